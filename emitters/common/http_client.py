@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import base64
+import gzip
 import hashlib
 import hmac
 import json
@@ -9,12 +10,21 @@ import os
 import random
 import secrets
 import time
+import zlib
 from datetime import UTC, datetime
 from typing import Any
 from urllib.parse import urlparse
 
 import requests
 
+try:
+    from services.common.codec import dumps as _dumps_json
+except ImportError:  # emitery uruchomione bez drzewa services/ — stdlib, ten sam format
+
+    def _dumps_json(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 # ── HMAC helpers (zgodne z tools/sign_hmac.py) ─────────────────────────────────
 
 
@@ -75,6 +85,43 @@ def _hmac_headers(url: str, body: bytes, method: str = "POST") -> dict[str, str]
     return headers
 
 
+# ── kompresja body (opt-in) ────────────────────────────────────────────────────
+
+
+def _zstd_compress() -> Any:
+    try:
+        from compression import zstd  # type: ignore[import-not-found]
+
+        return lambda data: zstd.compress(data, level=3)
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore[import-not-found]
+    except ImportError:
+        return None
+    return zstandard.ZstdCompressor(level=3).compress
+
+
+def make_compressor(encoding: str) -> Any:
+    """
+    "gzip" | "deflate" | "zstd" → funkcja bytes → bytes; "" / "none" → None.
+    zstd wymaga Pythona 3.14+ albo pakietu `zstandard` (brak → ValueError).
+    """
+    enc = (encoding or "").strip().lower()
+    if enc in ("", "none", "identity"):
+        return None
+    if enc == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    if enc == "deflate":
+        return lambda data: zlib.compress(data, 6)
+    if enc == "zstd":
+        fn = _zstd_compress()
+        if fn is not None:
+            return fn
+        raise ValueError("zstd compression needs Python 3.14+ or the 'zstandard' package")
+    raise ValueError(f"unsupported compression: {encoding!r}")
+
+
 # ── HTTP klient do emiterów ────────────────────────────────────────────────────
 
 
@@ -84,9 +131,21 @@ class IngestClient:
     - Domyślnie Content-Type: application/json (można zmienić set_content_type).
     - Automatycznie dokleja X-Emitter i X-Scenario-Id.
     - Jeżeli w ENV są LOGOPS_API_KEY/LOGOPS_SECRET → podpisuje HMAC-em.
+    - Opcjonalna kompresja body (`compress` albo ENV LOGOPS_EMITTER_COMPRESS = gzip | deflate |
+      zstd) od `compress_min_bytes` (ENV LOGOPS_EMITTER_COMPRESS_MIN_BYTES, domyślnie 1024);
+      podpis HMAC liczony po skompresowanych bajtach (tak jak weryfikuje AuthGW).
     """
 
-    def __init__(self, url: str, emitter: str, scenario_id: str, timeout: float = 5.0):
+    def __init__(
+        self,
+        url: str,
+        emitter: str,
+        scenario_id: str,
+        timeout: float = 5.0,
+        *,
+        compress: str | None = None,
+        compress_min_bytes: int | None = None,
+    ):
         self.url = url
         self.base_headers: dict[str, str] = {
             "Content-Type": "application/json",
@@ -95,20 +154,32 @@ class IngestClient:
         }
         self.timeout = timeout
         self._session = requests.Session()
+        if compress is None:
+            compress = os.environ.get("LOGOPS_EMITTER_COMPRESS", "")
+        if compress_min_bytes is None:
+            compress_min_bytes = int(os.environ.get("LOGOPS_EMITTER_COMPRESS_MIN_BYTES", "1024"))
+        self.compress = (compress or "").strip().lower()
+        self.compress_min_bytes = max(0, int(compress_min_bytes))
+        self._compressor = make_compressor(self.compress)
 
     def set_content_type(self, value: str) -> None:
         self.base_headers["Content-Type"] = value
 
+    def _encode(self, body: bytes, headers: dict[str, str]) -> bytes:
+        if self._compressor is None or len(body) < self.compress_min_bytes:
+            return body
+        headers["Content-Encoding"] = self.compress
+        return self._compressor(body)
+
     def post_json(self, records: list[dict[str, Any]]) -> None:
-        body = json.dumps(records, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
-        headers = dict(self.base_headers)
-        headers.update(_hmac_headers(self.url, body, "POST"))
-        self._session.post(
-            self.url, headers=headers, data=body, timeout=self.timeout
-        ).raise_for_status()
+        self.post_bytes(_dumps_json(records), records=len(records))
 
-    def post_bytes(self, payload: bytes) -> None:
+    def post_bytes(self, payload: bytes, *, records: int | None = None) -> None:
+        """`records` → nagłówek X-Record-Count (koszt w limicie rekordów AuthGW)."""
         headers = dict(self.base_headers)
+        if records is not None:
+            headers["X-Record-Count"] = str(records)
+        payload = self._encode(payload, headers)
         headers.update(_hmac_headers(self.url, payload, "POST"))
         self._session.post(
             self.url, headers=headers, data=payload, timeout=self.timeout
@@ -63,7 +63,7 @@ def main():
 
     while time.time() < end:
         csv_body, _ = build_csv(args.batch_size, args.partial_ratio)
-        cli.post_bytes(csv_body.encode("utf-8"))
+        cli.post_bytes(csv_body.encode("utf-8"), records=args.batch_size)
         sent += args.batch_size
         sleep_with_jitter(interval, args.jitter_ms)
 
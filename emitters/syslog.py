@@ -71,7 +71,7 @@ def main():
 
     while time.time() < end:
         payload, _ = build_payload(args.batch_size, args.partial_ratio)
-        cli.post_bytes(payload.encode("utf-8"))
+        cli.post_bytes(payload.encode("utf-8"), records=args.batch_size)
         sent += args.batch_size
         sleep_with_jitter(interval, args.jitter_ms)
 
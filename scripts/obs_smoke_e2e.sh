@@ -101,7 +101,7 @@ tools/hmac_curl.sh --url "$ENTRYPOINT_URL" -H 'Content-Type: text/plain' --data
 # NDJSON sink check
 stage "NDJSON sink (Promtail source → Loki)"
 TODAY=$(date -u +%Y%m%d)
-COUNT=$(jq -r "select(.scenario_id==\"$SCENARIO_ID\") | .emitter" "data/ingest/${TODAY}.ndjson" 2>/dev/null | wc -l | tr -d ' ' || echo 0)
+COUNT=$(cat data/ingest/${TODAY}*.ndjson 2>/dev/null | jq -r "select(.scenario_id==\"$SCENARIO_ID\") | .emitter" 2>/dev/null | wc -l | tr -d ' ' || echo 0)
 [[ "${COUNT:-0}" -gt 0 ]] && ok "NDJSON zawiera wpisy dla ${SCENARIO_ID} (count=${COUNT})" || warn "Brak wpisów NDJSON dla ${SCENARIO_ID}"
 
 # Warm-up pod histogramy
@@ -134,5 +134,5 @@ ok "Zapisano scenario_id do data/e2e/last_scenario_id"
 # ===== Summary =====
 stage "Podsumowanie"
 say "Scenario: ${SCENARIO_ID}"
-say "NDJSON: data/ingest/${TODAY}.ndjson"
+say "NDJSON: data/ingest/${TODAY}*.ndjson"
 ok "E2E smoke zakończony"
@@ -8,10 +8,13 @@ from typing import Any
 
 import yaml
 from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from starlette.background import BackgroundTask
+from starlette.datastructures import MutableHeaders
 
-from .downstream import Breaker, post_with_retry
+from .asgi import header_map
+from .downstream import BodyTooLarge, Breaker, Forwarder, ReplayableBody
 from .hmac_mw import HmacAuthMiddleware
 from .ratelimit_mw import TokenBucketRL
 
@@ -51,9 +54,13 @@ require_nonce = bool(hmac_cfg.get("require_nonce", True))
 clients = {k: v for k, v in ((CFG.get("secrets") or {}).get("clients") or {}).items()}
 
 ratelimit_cfg = CFG.get("ratelimit") or {}
-rl_default_cap = int((ratelimit_cfg.get("per_emitter") or {}).get("capacity", 100))
-rl_default_ref = int((ratelimit_cfg.get("per_emitter") or {}).get("refill_per_sec", 50))
-rl_by_emitter: dict[str, dict[str, int]] = {}
+rl_defaults: dict[str, Any] = ratelimit_cfg.get("per_emitter") or {}
+rl_default_cap = int(rl_defaults.get("capacity", 100))
+rl_default_ref = int(rl_defaults.get("refill_per_sec", 50))
+# kubełki bajtów / rekordów (bytes_*, records_*, record_bytes) i nadpisania per emiter
+rl_by_emitter: dict[str, dict[str, Any]] = {
+    str(k): dict(v or {}) for k, v in (ratelimit_cfg.get("by_emitter") or {}).items()
+}
 
 forward_cfg = CFG.get("forward") or {}
 FORWARD_URL = forward_cfg.get("url")  # e.g. "http://127.0.0.1:8080/v1/logs"
@@ -79,6 +86,23 @@ BREAKER = Breaker(
     half_open_after_sec=int(breaker_cfg.get("half_open_after_sec", 20)),
 )
 
+# długo żyjący forwarder (pula połączeń + breaker + retry) — jeden na proces
+FORWARDER = (
+    Forwarder(
+        FORWARD_URL,
+        timeout_ms=(timeouts.get("connect_ms", 2000), timeouts.get("read_ms", 5000)),
+        attempts=MAX_ATTEMPTS,
+        base_delay_ms=BASE_DELAY_MS,
+        max_delay_ms=MAX_DELAY_MS,
+        breaker=BREAKER,
+        max_connections=int(forward_cfg.get("max_connections", 100)),
+        max_keepalive=int(forward_cfg.get("max_keepalive", 20)),
+        keepalive_expiry_sec=float(forward_cfg.get("keepalive_expiry_sec", 30)),
+    )
+    if FORWARD_URL
+    else None
+)
+
 # backpressure
 bp_cfg = CFG.get("backpressure") or {}
 BP_ENABLED = bool(bp_cfg.get("enabled", True))
@@ -125,6 +149,12 @@ def _prewarm_metrics():
         REJECTED.labels(reason=r, emitter="unknown").inc(0)
 
 
+@app.on_event("shutdown")
+async def _close_forwarder():
+    if FORWARDER is not None:
+        await FORWARDER.aclose()
+
+
 logger.info(
     "AuthGW config: mode=%s skew=%ss require_nonce=%s forward_url=%s",
     auth_mode,
@@ -134,6 +164,21 @@ logger.info(
 )
 
 # --- middlewares (HMAC / RL) ---
+# dodany później = zewnętrzny: HMAC przed RL, więc kubełek jest emitera z uwierzytelnionego
+# klienta (request.state), a nie z nagłówka X-Emitter, który może podać każdy
+app.add_middleware(
+    TokenBucketRL,
+    default_capacity=rl_default_cap,
+    default_refill=rl_default_ref,
+    per_emitter=rl_by_emitter,
+    redis=REDIS,
+    default_limits=rl_defaults,
+    redis_timeout_ms=int(ratelimit_cfg.get("redis_timeout_ms", 50)),
+    redis_retry_s=float(ratelimit_cfg.get("redis_retry_s", 1.0)),
+    lease_fraction=float(ratelimit_cfg.get("lease_fraction", 0.1)),
+    lease_ttl_s=float(ratelimit_cfg.get("lease_ttl_s", 1.0)),
+)
+
 app.add_middleware(
     HmacAuthMiddleware,
     mode=auth_mode,
@@ -141,14 +186,9 @@ app.add_middleware(
     nonce_store=REDIS,
     clock_skew_sec=clock_skew_s,
     require_nonce=require_nonce,
-)
-
-app.add_middleware(
-    TokenBucketRL,
-    default_capacity=rl_default_cap,
-    default_refill=rl_default_ref,
-    per_emitter=rl_by_emitter,
-    redis=REDIS,
+    nonce_max_entries=int(hmac_cfg.get("nonce_max_entries", 500_000)),
+    nonce_filter=hmac_cfg.get("nonce_filter") or None,
+    max_body_bytes=BP_MAX_BODY if BP_ENABLED else 0,
 )
 
 
@@ -198,6 +238,18 @@ def _build_forward_headers(
     return out
 
 
+def _too_large(actual_len: int) -> JSONResponse:
+    return JSONResponse(
+        {
+            "error": "payload too large",
+            "max_body_bytes": BP_MAX_BODY,
+            "actual_bytes": actual_len,
+        },
+        status_code=413,
+        headers={"X-Backpressure-Reason": "too_large"},
+    )
+
+
 def _infer_reason(status_code: int, detail: Any) -> str:
     text = (str(detail) if detail is not None else "").lower()
     if status_code == 429:
@@ -239,36 +291,59 @@ async def _http_exc_handler(request: Request, exc: HTTPException):
 
 
 # --- middleware: latency + liczenie odrzuceń ---
-@app.middleware("http")
-async def _observe_and_count_mw(request: Request, call_next):
-    start_t = time.monotonic()
-    emitter, scenario_id = _labels_from_headers(request)
+class _ObserveAndCountMiddleware:
+    """
+    Czyste ASGI (zamiast @app.middleware("http") / BaseHTTPMiddleware — bez strumieni
+    i task group na każde żądanie): latencja i status per emiter, odrzucenia 4xx na /ingest.
+    """
 
-    try:
-        response = await call_next(request)
-    except HTTPException:
-        raise
-    except Exception:
-        resp = JSONResponse({"error": "internal_error"}, status_code=500)
-        AUTH_REQ.labels("500", emitter, scenario_id).inc()
-        AUTH_LAT.labels(emitter, scenario_id).observe(max(0.0, time.monotonic() - start_t))
-        return resp
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start_t = time.monotonic()
+        hdr = header_map(scope)
+        emitter = hdr.get("x-emitter", "").strip() or "unknown"
+        scenario_id = (
+            hdr.get("x-scenario-id", "").strip() or hdr.get("x-scenario", "").strip() or "na"
+        )
+        is_ingest = scope["path"] == "/ingest"
+        status = 0
+
+        async def send_observed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if is_ingest and 400 <= status < 500:
+                    headers = MutableHeaders(raw=list(message.get("headers") or []))
+                    if headers.get("X-AuthGW-Counted") != "1":
+                        reason = (
+                            headers.get("X-Backpressure-Reason")
+                            or headers.get("X-AuthGW-Reason")
+                            or _infer_reason(status, None)
+                        )
+                        REJECTED.labels(reason=reason, emitter=emitter).inc()
+                        headers["X-AuthGW-Counted"] = "1"
+                        headers.setdefault("X-AuthGW-Reason", reason)
+                    message["headers"] = headers.raw
+            await send(message)
 
-    AUTH_REQ.labels(str(response.status_code), emitter, scenario_id).inc()
-    AUTH_LAT.labels(emitter, scenario_id).observe(max(0.0, time.monotonic() - start_t))
+        try:
+            await self.app(scope, receive, send_observed)
+        except Exception:
+            if status:
+                raise  # odpowiedź już wysłana w części — nie da się jej podmienić
+            status = 500
+            await JSONResponse({"error": "internal_error"}, status_code=500)(scope, receive, send)
+        finally:
+            AUTH_REQ.labels(str(status or 500), emitter, scenario_id).inc()
+            AUTH_LAT.labels(emitter, scenario_id).observe(max(0.0, time.monotonic() - start_t))
 
-    if request.url.path == "/ingest" and 400 <= response.status_code < 500:
-        if response.headers.get("X-AuthGW-Counted") != "1":
-            reason = (
-                response.headers.get("X-Backpressure-Reason")
-                or response.headers.get("X-AuthGW-Reason")
-                or _infer_reason(response.status_code, None)
-            )
-            REJECTED.labels(reason=reason, emitter=emitter).inc()
-            response.headers["X-AuthGW-Counted"] = "1"
-            response.headers.setdefault("X-AuthGW-Reason", reason)
 
-    return response
+# najbardziej zewnętrzny (dodany ostatni) — widzi też odpowiedzi HMAC/RL
+app.add_middleware(_ObserveAndCountMiddleware)
 
 
 # --- routes ---
@@ -293,13 +368,9 @@ async def ingest(request: Request):
     """
     Passthrough dowolnego Content-Type do IngestGW z zachowaniem nagłówków transportowych.
     HMAC oraz rate-limiting obsługują middleware’y.
+    Body idzie do downstream bez dodatkowej kopii (bufor z HMAC albo stream z klienta),
+    a odpowiedź wraca jako stream.
     """
-    try:
-        raw = await request.body()
-    except Exception:
-        return JSONResponse({"error": "cannot read request body"}, 400)
-
-    actual_len = len(raw)
     content_length_hdr = request.headers.get("content-length")
     content_type = (request.headers.get("content-type") or "application/json").split(";")[0].lower()
 
@@ -318,34 +389,36 @@ async def ingest(request: Request):
         except Exception:
             pass
 
-        if actual_len > BP_MAX_BODY:
-            return JSONResponse(
-                {
-                    "error": "payload too large",
-                    "max_body_bytes": BP_MAX_BODY,
-                    "actual_bytes": actual_len,
-                },
-                status_code=413,
-                headers={"X-Backpressure-Reason": "too_large"},
-            )
-
-    if not FORWARD_URL:
+    # HMAC już zbuforował body (hash liczony w locie, limit BP sprawdzony przy odczycie)
+    # → używamy tego samego obiektu bytes. W pozostałych trybach streamujemy z klienta
+    # (limit BP egzekwowany w locie).
+    body: bytes | ReplayableBody
+    raw = getattr(request.state, "raw_body", None)
+    if raw:
+        body = raw
+        if BP_ENABLED and len(raw) > BP_MAX_BODY:
+            return _too_large(len(raw))
+    else:
+        body = ReplayableBody(request.stream(), max_bytes=BP_MAX_BODY if BP_ENABLED else 0)
+
+    if FORWARDER is None:
         return JSONResponse({"error": "forward url not configured"}, 500)
 
     emitter, scenario_id = _labels_from_headers(request)
     fwd_headers = _build_forward_headers(request, emitter, scenario_id, content_type)
+    content_encoding = request.headers.get("content-encoding")
+    if content_encoding:
+        # body skompresowane (gzip/zstd) idzie dalej bez zmian — HMAC i limit BP liczone
+        # po bajtach z sieci, dekompresja dopiero w IngestGW
+        fwd_headers.setdefault("Content-Encoding", content_encoding)
+    if isinstance(body, ReplayableBody) and content_length_hdr:
+        # znany rozmiar → downstream dostaje Content-Length zamiast chunked
+        fwd_headers.setdefault("Content-Length", content_length_hdr)
 
     try:
-        resp = await post_with_retry(
-            FORWARD_URL,
-            content=raw,  # passthrough bytes — bez ingerencji w body
-            timeout_ms=(timeouts.get("connect_ms", 2000), timeouts.get("read_ms", 5000)),
-            attempts=MAX_ATTEMPTS,
-            base_delay_ms=BASE_DELAY_MS,
-            max_delay_ms=MAX_DELAY_MS,
-            breaker=BREAKER,
-            headers=fwd_headers,
-        )
+        resp = await FORWARDER.send(body, headers=fwd_headers)
+    except BodyTooLarge as e:
+        return _too_large(e.seen)
     except RuntimeError as e:
         msg = str(e)
         if "circuit_open" in msg:
@@ -354,10 +427,18 @@ async def ingest(request: Request):
     except Exception as e:  # awaryjnie
         return JSONResponse({"error": f"downstream_error: {e!r}"}, status_code=502)
 
-    return Response(
-        content=resp.content,
+    passthrough = {}
+    if resp.headers.get("content-encoding"):
+        passthrough["Content-Encoding"] = resp.headers["content-encoding"]
+    if resp.headers.get("retry-after"):
+        # 429/503 z admission control Ingest — klient musi zobaczyć, kiedy ponowić
+        passthrough["Retry-After"] = resp.headers["retry-after"]
+    return StreamingResponse(
+        resp.aiter_raw(),
         status_code=resp.status_code,
         media_type=resp.headers.get("content-type", "application/json"),
+        headers=passthrough,
+        background=BackgroundTask(resp.aclose),
     )
 
 
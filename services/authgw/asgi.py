@@ -0,0 +1,32 @@
+# services/authgw/asgi.py
+"""
+Pomocniki czystego ASGI dla middleware'ów AuthGW — bez budowania `Request`/`URL` na każde
+żądanie w każdym middleware:
+- `header_map(scope)` — nagłówki parsowane raz na żądanie i współdzielone przez scope,
+- `scope_state(scope)` — ten sam słownik, który handler widzi jako `request.state`.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+__all__ = ["header_map", "scope_state"]
+
+_HEADERS_KEY = "authgw.headers"
+
+
+def header_map(scope: dict[str, Any]) -> dict[str, str]:
+    """Nagłówki żądania: nazwa (małe litery) → pierwsza wartość (jak `Headers.get`)."""
+    hdr = scope.get(_HEADERS_KEY)
+    if hdr is None:
+        hdr = {}
+        for k, v in scope.get("headers") or ():
+            name = k.decode("latin-1").lower()
+            if name not in hdr:
+                hdr[name] = v.decode("latin-1")
+        scope[_HEADERS_KEY] = hdr
+    return hdr
+
+
+def scope_state(scope: dict[str, Any]) -> dict[str, Any]:
+    return scope.setdefault("state", {})
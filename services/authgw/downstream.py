@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import time
+from collections.abc import AsyncIterator
 from typing import Any
 
 import httpx
@@ -43,49 +45,119 @@ class Breaker:
         self._total_count = 0
 
 
-async def post_with_retry(
-    url: str,
-    *,
-    # Użyj jednego z dwóch:
-    json_payload: Any | None = None,
-    content: bytes | None = None,
-    # Timeouty (connect_ms, read_ms)
-    timeout_ms: tuple[int, int] = (2000, 5000),
-    # Retry
-    attempts: int = 3,
-    base_delay_ms: int = 100,
-    max_delay_ms: int = 1500,
-    breaker: Breaker | None = None,
-    headers: dict[str, str] | None = None,
-) -> httpx.Response:
+class BodyTooLarge(Exception):
+    """Body przekroczyło limit w trakcie streamowania (backpressure)."""
+
+    def __init__(self, limit: int, seen: int):
+        super().__init__(f"body exceeds {limit} bytes")
+        self.limit = limit
+        self.seen = seen
+
+
+class ReplayableBody:
     """
-    Wysyłka z retry i prostym CB. Obsługuje JSON (json_payload) lub surowe body (content).
-    - 5xx i błędy sieci → retry
-    - 4xx → bez retry (zwracamy odpowiedź)
-    - breaker.state_allows() == False → RuntimeError("circuit_open")
+    Streamowane body, które da się wysłać ponownie (retry) bez kopiowania na happy-path.
+    - pierwszy przebieg czyta źródło i zapamiętuje referencje do chunków,
+    - kolejne przebiegi odtwarzają zapamiętane chunki i dociągają resztę ze źródła,
+    - max_bytes > 0 → po przekroczeniu limitu rzuca BodyTooLarge.
     """
-    if json_payload is not None and content is not None:
-        raise ValueError("Provide either json_payload or content, not both.")
 
-    if breaker and not breaker.state_allows():
-        raise RuntimeError("circuit_open")
+    def __init__(self, source: AsyncIterator[bytes], *, max_bytes: int = 0):
+        self._source = source
+        self._chunks: list[bytes] = []
+        self._done = False
+        self.max_bytes = int(max_bytes)
+        self.size = 0
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for chunk in list(self._chunks):
+            yield chunk
+        if self._done:
+            return
+        async for chunk in self._source:
+            if not chunk:
+                continue
+            self.size += len(chunk)
+            if self.max_bytes and self.size > self.max_bytes:
+                raise BodyTooLarge(self.max_bytes, self.size)
+            self._chunks.append(chunk)
+            yield chunk
+        self._done = True
+
+
+class Forwarder:
+    """
+    Długo żyjący forwarder do downstream: posiada pulę połączeń (httpx.AsyncClient),
+    breaker i politykę retry. Odpowiedź zwracana jest jako *stream* — wołający
+    odpowiada za `await resp.aclose()` (np. BackgroundTask przy StreamingResponse).
+    """
 
-    connect, read = timeout_ms
-    timeout = httpx.Timeout(
-        connect=connect / 1000.0, read=read / 1000.0, write=read / 1000.0, pool=connect / 1000.0
-    )
+    def __init__(
+        self,
+        url: str,
+        *,
+        timeout_ms: tuple[int, int] = (2000, 5000),
+        attempts: int = 3,
+        base_delay_ms: int = 100,
+        max_delay_ms: int = 1500,
+        breaker: Breaker | None = None,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry_sec: float = 30.0,
+    ):
+        self.url = url
+        connect, read = timeout_ms
+        self.timeout = httpx.Timeout(
+            connect=connect / 1000.0, read=read / 1000.0, write=read / 1000.0, pool=connect / 1000.0
+        )
+        self.attempts = max(1, int(attempts))
+        self.base_delay_ms = int(base_delay_ms)
+        self.max_delay_ms = int(max_delay_ms)
+        self.breaker = breaker
+        self.limits = httpx.Limits(
+            max_connections=int(max_connections),
+            max_keepalive_connections=int(max_keepalive),
+            keepalive_expiry=float(keepalive_expiry_sec),
+        )
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send(
+        self,
+        content: bytes | ReplayableBody,
+        *,
+        headers: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        """
+        Wysyłka z retry i prostym CB.
+        - 5xx i błędy sieci → retry
+        - 4xx → bez retry (zwracamy odpowiedź)
+        - breaker.state_allows() == False → RuntimeError("circuit_open")
+        - BodyTooLarge (limit przy streamowaniu) → propagowany bez retry
+        """
+        breaker = self.breaker
+        if breaker and not breaker.state_allows():
+            raise RuntimeError("circuit_open")
 
-    last_exc: Exception | None = None
-    delay = base_delay_ms / 1000.0
-    max_delay = max_delay_ms / 1000.0
+        last_exc: Exception | None = None
+        delay = self.base_delay_ms / 1000.0
+        max_delay = self.max_delay_ms / 1000.0
+        client = self.client
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        for attempt in range(1, max(1, attempts) + 1):
+        for attempt in range(1, self.attempts + 1):
             try:
-                if content is not None:
-                    resp = await client.post(url, content=content, headers=headers)
-                else:
-                    resp = await client.post(url, json=json_payload, headers=headers)
+                req = client.build_request("POST", self.url, content=content, headers=headers)
+                resp = await client.send(req, stream=True)
 
                 # 4xx → bez retry
                 if 400 <= resp.status_code < 500:
@@ -102,8 +174,13 @@ async def post_with_retry(
 
                 if ok:
                     return resp
+                await resp.aclose()
 
+            except BodyTooLarge:
+                raise
             except Exception as e:
+                if isinstance(e.__cause__, BodyTooLarge):
+                    raise e.__cause__ from None
                 last_exc = e
                 if breaker:
                     breaker.record(False)
@@ -111,9 +188,57 @@ async def post_with_retry(
                         breaker.open()
 
             # tu wchodzimy jeśli wyjątek lub 5xx
-            if attempt >= attempts:
+            if attempt >= self.attempts:
                 break
             await asyncio.sleep(min(delay, max_delay))
             delay = min(delay * 2, max_delay)
 
-    raise RuntimeError(f"downstream_error: {last_exc!r}" if last_exc else "downstream_error")
+        raise RuntimeError(f"downstream_error: {last_exc!r}" if last_exc else "downstream_error")
+
+
+async def post_with_retry(
+    url: str,
+    *,
+    # Użyj jednego z dwóch:
+    json_payload: Any | None = None,
+    content: bytes | None = None,
+    # Timeouty (connect_ms, read_ms)
+    timeout_ms: tuple[int, int] = (2000, 5000),
+    # Retry
+    attempts: int = 3,
+    base_delay_ms: int = 100,
+    max_delay_ms: int = 1500,
+    breaker: Breaker | None = None,
+    headers: dict[str, str] | None = None,
+) -> httpx.Response:
+    """
+    Jednorazowa wysyłka (bez współdzielonej puli) — zgodność wsteczna.
+    Na gorącej ścieżce używaj długo żyjącego `Forwarder`.
+    Zwraca odpowiedź z już wczytanym body.
+    """
+    if json_payload is not None and content is not None:
+        raise ValueError("Provide either json_payload or content, not both.")
+
+    hdrs = dict(headers or {})
+    if json_payload is not None:
+        content = json.dumps(json_payload, ensure_ascii=False).encode("utf-8")
+        if not any(k.lower() == "content-type" for k in hdrs):
+            hdrs["Content-Type"] = "application/json"
+
+    fwd = Forwarder(
+        url,
+        timeout_ms=timeout_ms,
+        attempts=attempts,
+        base_delay_ms=base_delay_ms,
+        max_delay_ms=max_delay_ms,
+        breaker=breaker,
+    )
+    try:
+        resp = await fwd.send(content or b"", headers=hdrs)
+        try:
+            await resp.aread()
+        finally:
+            await resp.aclose()
+        return resp
+    finally:
+        await fwd.aclose()
@@ -5,13 +5,14 @@ import base64
 import hashlib
 import hmac
 import logging
-import time
 from datetime import UTC, datetime
 from typing import Any
 
-from fastapi import Request
 from fastapi.responses import JSONResponse
 
+from .asgi import header_map, scope_state
+from .nonce_store import make_nonce_store
+
 __all__ = ["HmacAuthMiddleware"]
 
 logger = logging.getLogger("authgw.hmac")
@@ -49,7 +50,12 @@ class HmacAuthMiddleware:
 
     Dodatkowo:
     - weryfikacja X-Timestamp względem clock_skew_sec (UTC)
-    - ochrona przed replay (nonce + Redis/in-memory)
+    - ochrona przed replay (nonce + Redis/in-memory, patrz nonce_store.py): nonce sprawdzany
+      i zapamiętywany jedną operacją po weryfikacji podpisu, na 2 × clock_skew_sec
+      (żądanie z X-Timestamp = teraz + skew jest ważne jeszcze 2 × skew)
+    - body czytane raz, czystym ASGI: SHA256 liczony przyrostowo z kawałków, limit
+      max_body_bytes (0 = bez limitu) egzekwowany z Content-Length i w trakcie odczytu (413),
+      handler dostaje jeden bufor w request.state.raw_body
     """
 
     def __init__(
@@ -61,21 +67,29 @@ class HmacAuthMiddleware:
         clock_skew_sec: int = 300,
         require_nonce: bool = True,
         nonce_store=None,
+        nonce_max_entries: int = 500_000,
+        nonce_filter: dict[str, Any] | None = None,
+        max_body_bytes: int = 0,
     ):
         self.app = app
         self.mode = (mode or "hmac").lower()
         self.clients = clients or {}
         self.clock_skew_sec = int(clock_skew_sec or 0)
         self.require_nonce = bool(require_nonce)
-        self.nonce_store = nonce_store
-        self._nonce_cache: dict[str, float] = {}
+        self.max_body = max(0, int(max_body_bytes))
+        self.nonce_ttl = 2 * (self.clock_skew_sec or 300)
+        self.nonce_store = make_nonce_store(
+            nonce_store,
+            max_entries=nonce_max_entries,
+            nonce_filter=nonce_filter,
+            window_s=self.nonce_ttl,
+        )
 
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
 
-        request = Request(scope, receive=receive)
-        path = request.url.path
+        path = scope["path"]
 
         # BYPASS dla sond/obserwacji i dokumentacji
         if path in (
@@ -92,9 +106,10 @@ class HmacAuthMiddleware:
         if self.mode == "none":
             return await self.app(scope, receive, send)
 
+        headers = header_map(scope)
         try:
             # 1) API key
-            api_key: str | None = request.headers.get("x-api-key")
+            api_key: str | None = headers.get("x-api-key")
             if not api_key:
                 return await JSONResponse({"error": "missing X-Api-Key"}, 401)(scope, receive, send)
 
@@ -104,14 +119,14 @@ class HmacAuthMiddleware:
 
             if self.mode == "apikey":
                 # w trybie apikey tylko uzupełniamy state
-                self._populate_state(request, api_key, client, b"")
+                self._populate_state(scope, headers, api_key, client, b"")
                 return await self.app(scope, receive, send)
 
             # 2) HMAC headers
-            ts = request.headers.get("x-timestamp")
-            sign = request.headers.get("x-signature")
-            body_hash_hdr = request.headers.get("x-content-sha256")
-            nonce = request.headers.get("x-nonce")
+            ts = headers.get("x-timestamp")
+            sign = headers.get("x-signature")
+            body_hash_hdr = headers.get("x-content-sha256")
+            nonce = headers.get("x-nonce")
 
             if not (ts and sign and body_hash_hdr):
                 return await JSONResponse({"error": "missing hmac headers"}, 401)(
@@ -126,27 +141,47 @@ class HmacAuthMiddleware:
             if self.clock_skew_sec and abs((now - dt).total_seconds()) > self.clock_skew_sec:
                 return await JSONResponse({"error": "timestamp skew"}, 401)(scope, receive, send)
 
-            # 4) Nonce replay
-            if self.require_nonce:
-                if not nonce:
-                    return await JSONResponse({"error": "missing X-Nonce"}, 401)(
+            # 4) Nonce (powtórzenie sprawdzane w kroku 7 — po podpisie, żeby żądanie
+            # z fałszywym podpisem nie "zużyło" cudzego nonce)
+            if self.require_nonce and not nonce:
+                return await JSONResponse({"error": "missing X-Nonce"}, 401)(scope, receive, send)
+
+            # 5) Body: SHA256 liczony przyrostowo w trakcie odczytu, limit rozmiaru w locie
+            length_hdr = headers.get("content-length") or ""
+            if self.max_body and length_hdr.isdigit() and int(length_hdr) > self.max_body:
+                return await self._too_large("too_large_hdr", content_length_hdr=int(length_hdr))(
+                    scope, receive, send
+                )
+            hasher = hashlib.sha256()
+            chunks: list[bytes] = []
+            size = 0
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] != "http.request":
+                    break  # http.disconnect — klient zniknął
+                chunk = message.get("body", b"")
+                more = message.get("more_body", False)
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if self.max_body and size > self.max_body:
+                    return await self._too_large("too_large", actual_bytes=size)(
                         scope, receive, send
                     )
-                if await self._nonce_seen(api_key, nonce):
-                    return await JSONResponse({"error": "nonce replay"}, 401)(scope, receive, send)
-
-            # 5) Body + jego SHA256 (HEX)
-            body = await request.body()
-            body_sha256_hex = hashlib.sha256(body).hexdigest()
-            if (body_hash_hdr or "").lower() != body_sha256_hex.lower():
+                hasher.update(chunk)
+                chunks.append(chunk)
+            # jeden bufor dla handlera: pojedynczy kawałek bez kopii, kilka — jedno sklejenie
+            body = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+            body_sha256_hex = hasher.hexdigest()
+            if body_hash_hdr.lower() != body_sha256_hex:
                 return await JSONResponse({"error": "bad X-Content-SHA256"}, 400)(
                     scope, receive, send
                 )
 
             # 6) Canonical + podpis
-            method = request.method.upper()
-            path_only = request.url.path
-            canonical = "\n".join([method, path_only, body_sha256_hex, ts, nonce or ""])
+            method = scope["method"].upper()
+            canonical = "\n".join([method, path, body_sha256_hex, ts, nonce or ""])
             expected_b64 = base64.b64encode(
                 hmac.new(
                     client["secret"].encode("utf-8"), canonical.encode("utf-8"), hashlib.sha256
@@ -163,20 +198,25 @@ class HmacAuthMiddleware:
                     )
                 return await JSONResponse({"error": "bad signature"}, 401)(scope, receive, send)
 
-            # 7) zapamiętaj nonce
+            # 7) nonce replay: sprawdzenie + zapamiętanie atomowo (Redis: SET NX EX)
             if self.require_nonce:
-                await self._nonce_remember(api_key, nonce, ttl=self.clock_skew_sec or 300)
+                key = f"hmac:nonce:{api_key}:{nonce}"
+                if not await self.nonce_store.check_and_remember(key, self.nonce_ttl):
+                    return await JSONResponse({"error": "nonce replay"}, 401)(scope, receive, send)
+
+            # 8) uzupełnij state (handler bierze body z request.state.raw_body)
+            self._populate_state(scope, headers, api_key, client, body)
 
-            # 8) uzupełnij state i reinject body
-            self._populate_state(request, api_key, client, body)
+            body_sent = False
 
-            async def receive_with_buffer(sent=None):
-                if sent is None:
-                    sent = [False]
-                if not sent[0]:
-                    sent[0] = True
+            async def receive_with_buffer():
+                # ten sam bufor, gdyby handler czytał request.body(); potem oryginalny receive
+                # (np. http.disconnect dla streamingu)
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
                     return {"type": "http.request", "body": body, "more_body": False}
-                return {"type": "http.request", "body": b"", "more_body": False}
+                return await receive()
 
             return await self.app(scope, receive_with_buffer, send)
 
@@ -186,53 +226,34 @@ class HmacAuthMiddleware:
 
     # --- helpers ---
 
-    def _populate_state(self, request: Request, api_key: str, client: dict[str, Any], body: bytes):
-        emitter = client.get("emitter") or request.headers.get("x-emitter") or "unknown"
-
-        # IP z gniazda albo X-Forwarded-For
-        client_ip = None
-        try:
-            client_ip = (request.scope.get("client") or (None, None))[0]
-        except Exception:
-            client_ip = None
-        client_ip = client_ip or request.headers.get("x-forwarded-for") or ""
-
-        scenario_id = (
-            request.headers.get("x-scenario-id") or request.headers.get("x-scenario") or None
+    def _too_large(self, reason: str, **detail: int) -> JSONResponse:
+        # ten sam kształt co 413 z handlera /ingest (X-Backpressure-Reason → metryki odrzuceń)
+        return JSONResponse(
+            {"error": "payload too large", "max_body_bytes": self.max_body, **detail},
+            status_code=413,
+            headers={"X-Backpressure-Reason": reason},
         )
 
-        request.state.api_key = api_key
-        request.state.client = client
-        request.state.emitter = emitter
-        request.state.client_ip = client_ip
-        request.state.scenario_id = scenario_id
-        request.state.raw_body = body
-
-    async def _nonce_seen(self, api_key: str, nonce: str) -> bool:
-        key = f"hmac:nonce:{api_key}:{nonce}"
-        if self.nonce_store:
-            val = self.nonce_store.get(key)
-            if callable(getattr(val, "__await__", None)):
-                val = await val
-            return val is not None
-        now = time.time()
-        for k, exp in list(self._nonce_cache.items()):
-            if exp <= now:
-                self._nonce_cache.pop(k, None)
-        return key in self._nonce_cache
-
-    async def _nonce_remember(self, api_key: str, nonce: str, ttl: int = 300):
-        key = f"hmac:nonce:{api_key}:{nonce}"
-        if self.nonce_store:
-            setex = getattr(self.nonce_store, "setex", None)
-            if setex:
-                rv = setex(key, ttl, "1")
-                if callable(getattr(rv, "__await__", None)):
-                    await rv
-                return
-            rv = self.nonce_store.set(key, "1")
-            if callable(getattr(rv, "__await__", None)):
-                await rv
-            return
-        self._nonce_cache[key] = time.time() + max(1, int(ttl))
-        # prosta pamięć w RAM, bez TTL cleanup (czyszczenie przy sprawdzaniu)
+    def _populate_state(
+        self,
+        scope: dict[str, Any],
+        headers: dict[str, str],
+        api_key: str,
+        client: dict[str, Any],
+        body: bytes,
+    ):
+        emitter = client.get("emitter") or headers.get("x-emitter") or "unknown"
+
+        # IP z gniazda albo X-Forwarded-For
+        client_ip = (scope.get("client") or (None, None))[0]
+        client_ip = client_ip or headers.get("x-forwarded-for") or ""
+
+        scenario_id = headers.get("x-scenario-id") or headers.get("x-scenario") or None
+
+        state = scope_state(scope)
+        state["api_key"] = api_key
+        state["client"] = client
+        state["emitter"] = emitter
+        state["client_ip"] = client_ip
+        state["scenario_id"] = scenario_id
+        state["raw_body"] = body
@@ -0,0 +1,395 @@
+# services/authgw/nonce_store.py
+"""
+Magazyn nonce (anti-replay HMAC): `check_and_remember(key, ttl)` → True, gdy nonce jest nowy
+(i od teraz zapamiętany na `ttl` sekund), False przy powtórzeniu — sprawdzenie i zapis
+to jedna operacja, bez okna wyścigu między nimi.
+
+- `MemoryNonceStore` — per proces: słownik klucz → wygaśnięcie (sprawdzenie O(1)) i pierścień
+  generacji po `granularity_s` sekund (lista kluczy per generacja). Wygasłe generacje zdejmowane
+  w całości z początku pierścienia — koszt zamortyzowany O(1) na nonce, bez przeglądania słownika.
+  `max_entries` — twardy limit: przy przepełnieniu zdejmowana najstarsza generacja przed czasem
+  (ochrona przed powtórzeniem tych nonce słabnie — licznik `auth_nonce_evicted_total{reason="cap"}`).
+- `RedisNonceStore` — `SET key 1 NX EX ttl`: jeden RTT, atomowo między replikami.
+- `FilteredNonceStore` — opcjonalny filtr Blooma (`RotatingBloom`, plastry czasowe) przed
+  Redisem: "na pewno nowy" → odpowiedź bez RTT, nonce zapisywany w tle (`SET EX` potokiem),
+  "może był" → `SET NX EX` jak bez filtra. Negatywna odpowiedź filtra dotyczy nonce widzianych
+  przez TEN proces — poprawne tylko, gdy klient (api_key) trafia zawsze do tej samej repliki
+  (`redis_sticky`). Przez `window_s` po starcie (filtr nie zna nonce sprzed restartu) i po
+  nieudanym zapisie w tle filtr tylko się uczy, a każdy nonce idzie przez `SET NX EX`. Przed magazynem in-memory filtr nic nie daje (słownik to już O(1),
+  tańszy niż k bitów filtra w Pythonie), więc nie jest tam używany.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import deque
+from typing import Any
+
+from prometheus_client import Counter, Gauge
+
+__all__ = [
+    "FilteredNonceStore",
+    "MemoryNonceStore",
+    "RedisNonceStore",
+    "RotatingBloom",
+    "make_nonce_store",
+]
+
+logger = logging.getLogger("authgw.nonce")
+
+NONCE_CHECKS = Counter(
+    "auth_nonce_checks_total",
+    "Nonce checks by result (fresh|replay)",
+    labelnames=("result",),
+)
+NONCE_EVICTED = Counter(
+    "auth_nonce_evicted_total",
+    "Nonces dropped from the in-memory store (expired|cap)",
+    labelnames=("reason",),
+)
+NONCE_ENTRIES = Gauge(
+    "auth_nonce_store_entries",
+    "Nonces held by the in-memory store",
+)
+FILTER_CHECKS = Counter(
+    "auth_nonce_filter_checks_total",
+    "Nonce prefilter answers (new = skipped the exact lookup, maybe = fell through, "
+    "exact = filter bypassed after startup or a failed write-behind)",
+    labelnames=("result",),
+)
+FILTER_BYTES = Gauge(
+    "auth_nonce_filter_bytes",
+    "Memory held by the nonce prefilter bit arrays",
+)
+FILTER_FP = Gauge(
+    "auth_nonce_filter_fp_estimate",
+    "Estimated false-positive rate of the nonce prefilter (from current fill)",
+)
+
+
+def _fingerprint(key: str) -> bytes:
+    # 16 B zamiast klucza "hmac:nonce:<api_key>:<nonce>" (~60–100 B); kolizja ~n²/2¹²⁹
+    return hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def _count(fresh: bool) -> None:
+    try:
+        NONCE_CHECKS.labels("fresh" if fresh else "replay").inc()
+    except Exception:
+        pass
+
+
+class MemoryNonceStore:
+    """
+    Nonce w pamięci procesu z wygasaniem generacjami i limitem `max_entries`
+    (klucze trzymane jako 16-bajtowe skróty blake2b).
+    """
+
+    def __init__(self, *, max_entries: int = 500_000, granularity_s: float = 1.0):
+        self.max_entries = max(1, int(max_entries))
+        self.granularity = max(0.01, float(granularity_s))
+        self._exp: dict[bytes, float] = {}
+        # (koniec generacji, klucze wygasające do tej chwili) — rosnąco
+        self._gens: deque[tuple[float, list[bytes]]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._exp)
+
+    async def check_and_remember(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        self._expire(now)
+        fp = _fingerprint(key)
+        exp = self._exp.get(fp)
+        if exp is not None and exp > now:
+            _count(False)
+            return False
+        self._insert(fp, now, ttl)
+        _count(True)
+        return True
+
+    def _insert(self, key: bytes, now: float, ttl: float) -> None:
+        expires = now + max(1.0, float(ttl))
+        end = math.ceil(expires / self.granularity) * self.granularity
+        gens = self._gens
+        if not gens or gens[-1][0] < end:
+            gens.append((end, []))
+        # ttl krótszy niż poprzednie → ostatnia generacja (wygaśnie później — bezpieczniej)
+        gens[-1][1].append(key)
+        self._exp[key] = expires
+        if len(self._exp) > self.max_entries:
+            self._evict_cap()
+        try:
+            NONCE_ENTRIES.set(len(self._exp))
+        except Exception:
+            pass
+
+    def _drop(self, keys: list[bytes], until: float) -> int:
+        # klucz mógł zostać zapamiętany ponownie (nowsza generacja) — zostaje, jeśli żyje dłużej
+        exp, n = self._exp, 0
+        for k in keys:
+            if exp.get(k, math.inf) <= until:
+                del exp[k]
+                n += 1
+        return n
+
+    def _expire(self, now: float) -> None:
+        gens, n = self._gens, 0
+        while gens and gens[0][0] <= now:
+            n += self._drop(gens.popleft()[1], now)
+        if n:
+            try:
+                NONCE_EVICTED.labels("expired").inc(n)
+            except Exception:
+                pass
+
+    def _evict_cap(self) -> None:
+        n = 0
+        while len(self._exp) > self.max_entries and self._gens:
+            end, keys = self._gens.popleft()
+            n += self._drop(keys, end)
+        logger.warning(
+            "nonce store full (%d entries), dropped %d nonces before expiry", self.max_entries, n
+        )
+        try:
+            NONCE_EVICTED.labels("cap").inc(n)
+        except Exception:
+            pass
+
+
+class RedisNonceStore:
+    """Nonce w Redisie: `SET NX EX` — wspólne dla replik, sprawdzenie + zapis w jednym RTT."""
+
+    def __init__(self, client: Any):
+        self.client = client
+        # zapis w tle: czeka na wysłanie / wysłany, bez odpowiedzi / nieudany (klucz → wygaśnięcie)
+        self._pending: dict[str, int] = {}
+        self._inflight: dict[str, int] = {}
+        self._lost: dict[str, float] = {}
+        self._flush_task: asyncio.Task | None = None
+        # chwila ostatniego nieudanego zapisu w tle (zegar monotoniczny)
+        self.failed_at = -math.inf
+
+    def _unsaved(self, key: str) -> bool:
+        # nonce przyjęty, ale (jeszcze) nie w Redisie — SET NX by go nie zobaczył
+        if key in self._pending or key in self._inflight:
+            return True
+        exp = self._lost.get(key)
+        return exp is not None and exp > time.monotonic()
+
+    async def check_and_remember(self, key: str, ttl: float) -> bool:
+        if self._unsaved(key):
+            _count(False)
+            return False
+        rv = self.client.set(key, "1", nx=True, ex=max(1, math.ceil(ttl)))
+        if callable(getattr(rv, "__await__", None)):
+            rv = await rv
+        fresh = bool(rv)
+        _count(fresh)
+        return fresh
+
+    def remember(self, key: str, ttl: float) -> None:
+        """Zapis w tle: klucze z jednej iteracji pętli idą jednym potokiem `SET EX`."""
+        self._pending[key] = max(1, math.ceil(ttl))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        try:
+            while self._pending:
+                self._inflight, self._pending = self._pending, {}
+                try:
+                    pipe = self.client.pipeline(transaction=False)
+                    for key, ttl in self._inflight.items():
+                        pipe.set(key, "1", ex=ttl)
+                    rv = pipe.execute()
+                    if callable(getattr(rv, "__await__", None)):
+                        await rv
+                except Exception:
+                    self._write_failed()
+                finally:
+                    self._inflight = {}
+        finally:
+            self._flush_task = None
+
+    def _write_failed(self) -> None:
+        # nonce z nieudanej partii pamiętane lokalnie do wygaśnięcia (repliki ich nie widzą)
+        now = time.monotonic()
+        self.failed_at = now
+        self._lost = {k: exp for k, exp in self._lost.items() if exp > now}
+        for key, ttl in self._inflight.items():
+            self._lost[key] = now + ttl
+        logger.warning(
+            "nonce write-behind to Redis failed (%d nonces kept locally)",
+            len(self._inflight),
+            exc_info=True,
+        )
+
+
+class RotatingBloom:
+    """
+    Filtr Blooma w `slices` plastrach czasowych po `window_s / (slices - 1)` s: zapis do
+    bieżącego plastra, sprawdzenie — we wszystkich; najstarszy plaster czyszczony przy rotacji,
+    więc klucz jest pamiętany co najmniej `window_s`. Plaster liczony na `expected_rps × długość`
+    kluczy z fałszywie dodatnim `fp_rate / slices` (suma po plastrach ≤ `fp_rate`).
+    Więcej kluczy niż zakładane → wyższy fp (`auth_nonce_filter_fp_estimate`), nie błąd.
+    """
+
+    def __init__(
+        self, *, window_s: float, expected_rps: float, fp_rate: float = 1e-3, slices: int = 4
+    ):
+        self.slices = max(2, int(slices))
+        self.slice_s = max(0.1, float(window_s)) / (self.slices - 1)
+        n = max(1.0, float(expected_rps) * self.slice_s)
+        p = min(0.5, max(1e-12, float(fp_rate))) / self.slices
+        self.m = max(64, math.ceil(-n * math.log(p) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / n * math.log(2)))
+        self._nbytes = (self.m + 7) // 8
+        # (numer plastra, bity, liczba kluczy) — od najstarszego
+        self._ring: deque[tuple[int, bytearray, list[int]]] = deque()
+        try:
+            FILTER_BYTES.set(self.slices * self._nbytes)
+        except Exception:
+            pass
+
+    @property
+    def nbytes(self) -> int:
+        return self.slices * self._nbytes
+
+    def _positions(self, key: str) -> list[tuple[int, int]]:
+        # podwójne haszowanie (Kirsch–Mitzenmacher): bity h1 + i·h2 z jednego skrótu 128-bit,
+        # od razu jako (bajt, maska)
+        h = int.from_bytes(
+            hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest(),
+            "little",
+        )
+        m = self.m
+        i, step = (h & 0xFFFFFFFFFFFFFFFF) % m, ((h >> 64) | 1) % m
+        out = []
+        for _ in range(self.k):
+            out.append((i >> 3, 1 << (i & 7)))
+            i += step
+            if i >= m:
+                i -= m
+        return out
+
+    def _rotate(self, now: float) -> None:
+        epoch = int(now // self.slice_s)
+        ring = self._ring
+        if ring and ring[-1][0] == epoch:
+            return
+        while ring and ring[0][0] <= epoch - self.slices:
+            ring.popleft()
+        ring.append((epoch, bytearray(self._nbytes), [0]))
+        while len(ring) > self.slices:
+            ring.popleft()
+        try:
+            fp = 1.0
+            for _, _, count in ring:
+                fp *= 1.0 - (1.0 - math.exp(-self.k * count[0] / self.m)) ** self.k
+            FILTER_FP.set(1.0 - fp)
+        except Exception:
+            pass
+
+    def check_and_add(self, key: str) -> bool:
+        """True = "może był" (trafienie albo fałszywie dodatni), False = na pewno nowy."""
+        self._rotate(time.monotonic())
+        pos = self._positions(key)
+        seen = False
+        for _, bits, _ in self._ring:
+            for byte, mask in pos:
+                if not bits[byte] & mask:
+                    break
+            else:
+                seen = True
+                break
+        _, bits, count = self._ring[-1]
+        for byte, mask in pos:
+            bits[byte] |= mask
+        count[0] += 1
+        return seen
+
+
+class FilteredNonceStore:
+    """
+    Filtr Blooma przed magazynem dokładnym (`remember` = zapis bez sprawdzania).
+    Negatywnej odpowiedzi ufa dopiero po `window_s` od startu i od ostatniego nieudanego
+    zapisu w tle (`exact.failed_at`) — wcześniej filtr mógł nie widzieć nonce z okna.
+    """
+
+    def __init__(self, exact: Any, bloom: RotatingBloom, *, window_s: float):
+        self.exact = exact
+        self.bloom = bloom
+        self.window = max(0.0, float(window_s))
+        self._started = time.monotonic()
+
+    def _trusted(self) -> bool:
+        now = time.monotonic()
+        failed_at = getattr(self.exact, "failed_at", -math.inf)
+        return now - self._started >= self.window and now - failed_at >= self.window
+
+    async def check_and_remember(self, key: str, ttl: float) -> bool:
+        maybe = self.bloom.check_and_add(key)
+        if maybe or not self._trusted():
+            try:
+                FILTER_CHECKS.labels("maybe" if maybe else "exact").inc()
+            except Exception:
+                pass
+            return await self.exact.check_and_remember(key, ttl)
+        try:
+            FILTER_CHECKS.labels("new").inc()
+        except Exception:
+            pass
+        self.exact.remember(key, ttl)
+        _count(True)
+        return True
+
+
+def make_nonce_store(
+    store: Any = None,
+    *,
+    max_entries: int = 500_000,
+    nonce_filter: dict[str, Any] | None = None,
+    window_s: float = 600,
+) -> Any:
+    """
+    `store`: None → MemoryNonceStore, obiekt z `check_and_remember` → bez zmian,
+    klient redis-py (sync/async) → RedisNonceStore.
+    `nonce_filter` (`enabled`, `expected_rps`, `fp_rate`, `slices`, `redis_sticky`) → filtr
+    Blooma na okno `window_s` przed RedisNonceStore (tylko z `redis_sticky: true`).
+    """
+    if store is None:
+        exact: Any = MemoryNonceStore(max_entries=max_entries)
+    elif hasattr(store, "check_and_remember"):
+        exact = store
+    else:
+        exact = RedisNonceStore(store)
+    cfg = nonce_filter or {}
+    if not cfg.get("enabled"):
+        return exact
+    if not isinstance(exact, RedisNonceStore):
+        logger.info("nonce filter: only used in front of Redis, ignored for %s", exact)
+        return exact
+    if not cfg.get("redis_sticky"):
+        logger.warning(
+            "nonce filter disabled: with Redis a local filter misses replays sent to other "
+            "replicas (set nonce_filter.redis_sticky when clients are pinned to one replica)"
+        )
+        return exact
+    bloom = RotatingBloom(
+        window_s=window_s,
+        expected_rps=float(cfg.get("expected_rps", 1000)),
+        fp_rate=float(cfg.get("fp_rate", 1e-3)),
+        slices=int(cfg.get("slices", 4)),
+    )
+    logger.info(
+        "nonce filter: %d slices x %d bits, k=%d (%.1f KiB)",
+        bloom.slices,
+        bloom.m,
+        bloom.k,
+        bloom.nbytes / 1024,
+    )
+    return FilteredNonceStore(exact, bloom, window_s=window_s)
@@ -1,37 +1,219 @@
+import asyncio
+import hashlib
+import logging
+import math
 import time
 
-from fastapi import Request
 from fastapi.responses import JSONResponse
+from prometheus_client import Counter, Gauge
+
+from .asgi import header_map
+
+logger = logging.getLogger("authgw.ratelimit")
+
+# kubełki limitu: (rodzaj, sufiks nagłówków X-RateLimit-*)
+KINDS = (("requests", ""), ("bytes", "-Bytes"), ("records", "-Records"))
+
+# co ile sekund usuwać pełne (bezczynne) kubełki lokalne
+_EVICT_EVERY_S = 10.0
+
+# Kubełki emitera w Redisie — sprawdzenie i pobranie kosztu atomowo, jednym EVALSHA.
+# KEYS = hash {t: tokeny, ts: czas} na kubełek; ARGV = force, potem na kubełek
+# (capacity, refill, koszt, zwrot, dzierżawa). Czas z serwera (TIME) — repliki AuthGW
+# nie zależą od własnych zegarów. Zwrot = niewykorzystane tokeny poprzedniej dzierżawy
+# repliki (ujemny = dług zaciągnięty lokalnie), dzierżawa = ile tokenów ponad koszt pobrać
+# z wyprzedzeniem (najwyżej tyle, ile zostało). force=1: koszt bez sprawdzania (dług).
+# Zwraca {1|0 (przepuszczone), potem na kubełek: tokeny po operacji, przyznana dzierżawa}.
+RL_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local force = ARGV[1] == '1'
+local ok = 1
+local tokens = {}
+for i = 1, #KEYS do
+  local a = 5 * (i - 1) + 1
+  local cap, rate = tonumber(ARGV[a + 1]), tonumber(ARGV[a + 2])
+  local cost = tonumber(ARGV[a + 3])
+  local st = redis.call('HMGET', KEYS[i], 't', 'ts')
+  local tk, ts = tonumber(st[1]), tonumber(st[2])
+  if tk == nil or ts == nil then
+    tk, ts = cap, now
+  end
+  tk = math.min(cap, tk + math.max(0, now - ts) * rate + tonumber(ARGV[a + 4]))
+  tokens[i] = tk
+  if not force and tk < math.min(math.max(cost, 1), cap) then
+    ok = 0
+  end
+end
+local out = {ok}
+for i = 1, #KEYS do
+  local a = 5 * (i - 1) + 1
+  local cap, rate = tonumber(ARGV[a + 1]), tonumber(ARGV[a + 2])
+  local tk, grant = tokens[i], 0
+  if ok == 1 then
+    tk = tk - tonumber(ARGV[a + 3])
+    grant = math.max(0, math.min(tonumber(ARGV[a + 5]), tk))
+    tk = tk - grant
+  end
+  redis.call('HSET', KEYS[i], 't', tk, 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil((cap - tk) / rate * 1000) + 1000)
+  out[2 * i] = tostring(tk)
+  out[2 * i + 1] = tostring(grant)
+end
+return out
+"""
+RL_SHA = hashlib.sha1(RL_LUA.encode()).hexdigest()
+
+RL_DECISIONS = Counter(
+    "auth_rl_decisions_total",
+    "Rate-limit decisions by where they were made (lease|redis|local)",
+    labelnames=("path",),
+)
+RL_LEASE_SIZE = Gauge(
+    "auth_rl_lease_size_tokens",
+    "Tokens leased from Redis per refill (per-replica bound of the global limit error)",
+    labelnames=("emitter", "kind"),  # emitery spoza per_emitter → "other"
+)
+RL_LEASE_HELD = Gauge(
+    "auth_rl_lease_held_tokens",
+    "Leased tokens not used yet (held by this replica)",
+    labelnames=("emitter", "kind"),
+)
+
+
+def _header_int(value: str) -> int | None:
+    # tylko cyfry ASCII ("²".isdigit() → True, a int("²") rzuca) i bez limitu int() na cyfry;
+    # nagłówek niepoprawny = brak nagłówka
+    v = value.strip()
+    return int(v) if v.isascii() and v.isdigit() and len(v) <= 18 else None
+
+
+def _num(x: float) -> str:
+    # pełna precyzja dla ARGV skryptu i kluczy (":g" daje 1234567 → "1.23457e+06")
+    return f"{float(x):.17g}"
+
+
+def _count(path: str) -> None:
+    try:
+        RL_DECISIONS.labels(path).inc()
+    except Exception:
+        pass
 
 
 class _Bucket:
+    """
+    Token bucket z kosztem ważonym: `need(cost)` tokenów musi być dostępne, a pobierany jest
+    pełny koszt — batch większy niż `capacity` przechodzi przy pełnym kubełku i zostawia dług
+    (kolejne żądania czekają, aż się spłaci), więc średnie tempo = `refill_per_sec`.
+    """
+
     __slots__ = ("capacity", "refill_per_sec", "tokens", "ts")
 
-    def __init__(self, capacity: int, refill_per_sec: int):
-        self.capacity = max(1, int(capacity))
-        self.refill_per_sec = max(1, int(refill_per_sec))
-        self.tokens = float(self.capacity)
-        self.ts = time.monotonic()
+    def __init__(self, capacity: float, refill_per_sec: float, tokens=None, ts=None):
+        self.capacity = max(1.0, float(capacity))
+        self.refill_per_sec = max(1e-9, float(refill_per_sec))
+        self.tokens = self.capacity if tokens is None else float(tokens)
+        self.ts = time.monotonic() if ts is None else float(ts)
 
-    def allow(self) -> bool:
-        now = time.monotonic()
+    def refill(self, now: float) -> None:
         delta = max(0.0, now - self.ts)
         self.ts = now
         self.tokens = min(self.capacity, self.tokens + delta * self.refill_per_sec)
-        if self.tokens >= 1.0:
-            self.tokens -= 1.0
+
+    def need(self, cost: float) -> float:
+        # koszt jeszcze nieznany (0, np. body chunked) → kubełek nie może być na minusie
+        return min(max(cost, 1.0), self.capacity)
+
+    def wait_for(self, cost: float) -> float:
+        """Sekundy do chwili, gdy `need(cost)` tokenów będzie dostępne."""
+        return max(0.0, self.need(cost) - self.tokens) / self.refill_per_sec
+
+    def reset_in(self) -> float:
+        """Sekundy do pełnego kubełka."""
+        return max(0.0, self.capacity - self.tokens) / self.refill_per_sec
+
+    def fits(self, cost: float) -> bool:
+        return self.tokens >= self.need(cost)
+
+    def allow(self, cost: float = 1.0) -> bool:
+        self.refill(time.monotonic())
+        if self.tokens >= self.need(cost):
+            self.tokens -= cost
             return True
         return False
 
 
+class _Lease:
+    """
+    Tokeny emitera pobrane z Redisa z wyprzedzeniem: `tokens` — lokalna pula per kubełek
+    (może zejść poniżej zera długiem za body chunked), `view` — stan kubełków w Redisie
+    z chwili pobrania (`ts`, zegar monotoniczny), `inflight` — trwające pobieranie
+    (jedno na emitera; pozostałe żądania czekają na jego wynik).
+    """
+
+    __slots__ = ("tokens", "view", "ts", "inflight")
+
+    def __init__(self):
+        self.tokens: dict[str, float] = {}
+        self.view: dict[str, _Bucket] = {}
+        self.ts = 0.0
+        self.inflight: asyncio.Future | None = None
+
+    def buckets(self, now: float) -> dict[str, _Bucket]:
+        # widok "globalny + to, co trzyma replika" odnowiony do `now`
+        out = {}
+        for kind, b in self.view.items():
+            v = _Bucket(b.capacity, b.refill_per_sec, b.tokens, b.ts)
+            v.refill(now)
+            v.tokens = min(v.capacity, v.tokens + self.tokens.get(kind, 0.0))
+            out[kind] = v
+        return out
+
+
+def _limits(cfg: dict, defaults: dict) -> dict[str, tuple[float, float]]:
+    """Konfiguracja emitera → {rodzaj: (capacity, refill_per_sec)} (0 / brak = kubełek wyłączony)."""
+
+    def get(name: str) -> float:
+        return float(cfg.get(name, defaults.get(name, 0)) or 0)
+
+    out = {"requests": (max(1.0, get("capacity")), max(1.0, get("refill_per_sec")))}
+    for kind in ("bytes", "records"):
+        cap, ref = get(f"{kind}_capacity"), get(f"{kind}_per_sec")
+        if ref > 0:
+            out[kind] = (cap if cap > 0 else ref, ref)
+    return out
+
+
 class TokenBucketRL:
     """
-    Prosty token bucket per-emitter (in-memory) lub Redis jeśli podany.
+    Token bucket per-emitter (in-memory) lub Redis jeśli podany.
     Konstruktor (ważne nazwy!):
       - default_capacity: int
       - default_refill:   int
       - per_emitter: Dict[str, Dict[str, int]]
-      - redis: opcjonalny klient redis-py (async)
+      - redis: opcjonalny klient redis-py (async) — kubełki wspólne dla replik (skrypt Lua)
+      - redis_timeout_ms / redis_retry_s: Redis wolniejszy niż timeout albo niedostępny →
+        lokalne kubełki repliki przez redis_retry_s (limit per replika zamiast wspólnego)
+      - lease_fraction / lease_ttl_s: dzierżawy tokenów z Redisa (0 = EVALSHA na każde żądanie)
+      - default_limits: dodatkowe kubełki (bytes_capacity/bytes_per_sec,
+        records_capacity/records_per_sec, record_bytes) — per_emitter może je nadpisać
+
+    Kubełki emitera (każde żądanie musi zmieścić się we wszystkich; pobierane razem):
+      - requests: 1 token na żądanie (jak dotąd),
+      - bytes:    koszt = Content-Length; body bez Content-Length (chunked) liczone w locie,
+                  gdy aplikacja je czyta, i pobierane po odczycie (dług),
+      - records:  koszt = max(X-Record-Count, bajty / `record_bytes`, 1) — nagłówek klienta
+                  nie jest podpisany, więc nie może kosztu obniżyć.
+    Body nie jest czytane drugi raz — koszt bierze się z nagłówków albo z licznika na `receive`.
+    Nagłówki X-RateLimit-{Limit,Remaining,Reset}[-Bytes|-Records]: pojemność, pozostałe tokeny
+    i sekundy do pełnego kubełka; 429 dodatkowo z Retry-After.
+
+    Dzierżawy (Redis): replika pobiera razem z kosztem żądania zapas `lease_fraction × capacity`
+    tokenów każdego kubełka i kolejne żądania obsługuje lokalnie, bez Redisa. Koszt większy niż
+    reszta dzierżawy albo dzierżawa starsza niż `lease_ttl_s` → kolejne EVALSHA, które oddaje
+    resztę i pobiera nową; nieużywane dzierżawy wracają do Redisa w tle po `lease_ttl_s`.
+    Tokeny są zdejmowane z Redisa przed użyciem, więc limit globalny nie jest przekraczany —
+    błąd to najwyżej `lease × repliki` tokenów trzymanych przez repliki (przez ≤ lease_ttl_s).
     """
 
     def __init__(
@@ -42,72 +224,292 @@ class TokenBucketRL:
         default_refill: int = 50,
         per_emitter: dict[str, dict[str, int]] | None = None,
         redis=None,
+        default_limits: dict[str, float] | None = None,
+        redis_timeout_ms: int = 50,
+        redis_retry_s: float = 1.0,
+        lease_fraction: float = 0.1,
+        lease_ttl_s: float = 1.0,
     ):
         self.app = app
         self.default_capacity = int(default_capacity)
         self.default_refill = int(default_refill)
         self.per_emitter = per_emitter or {}
         self.redis = redis
+        self.defaults = {
+            "capacity": self.default_capacity,
+            "refill_per_sec": self.default_refill,
+            "record_bytes": 256,
+            **(default_limits or {}),
+        }
         self._mem: dict[str, _Bucket] = {}
+        # cache tylko dla emiterów z per_emitter — reszta (dowolne nazwy z zewnątrz) dzieli
+        # domyślną konfigurację, więc słownik nie rośnie z liczbą nazw
+        self._cfg_cache: dict[str, tuple[dict[str, tuple[float, float]], float]] = {}
+        self._cfg_default = self._config({})
+        self._next_evict = 0.0
+        self.redis_timeout = max(1, int(redis_timeout_ms)) / 1000.0
+        self.redis_retry_s = max(0.0, float(redis_retry_s))
+        self._redis_down_until = 0.0
+        self._script_loaded = False
+        self.lease_fraction = min(1.0, max(0.0, float(lease_fraction)))
+        self.lease_ttl = max(0.01, float(lease_ttl_s))
+        self._leases: dict[str, _Lease] = {}
+        self._next_sweep = 0.0
+        self._tasks: set[asyncio.Task] = set()
+
+    # --- konfiguracja ---
+
+    def _config(self, cfg: dict) -> tuple[dict[str, tuple[float, float]], float]:
+        record_bytes = float(cfg.get("record_bytes", self.defaults["record_bytes"]) or 256)
+        return _limits(cfg, self.defaults), max(1.0, record_bytes)
+
+    def _emitter_limits(self, emitter: str) -> tuple[dict[str, tuple[float, float]], float]:
+        cfg = self.per_emitter.get(emitter)
+        if cfg is None:
+            return self._cfg_default
+        hit = self._cfg_cache.get(emitter)
+        if hit is None:
+            hit = self._cfg_cache[emitter] = self._config(cfg)
+        return hit
+
+    def _label(self, emitter: str) -> str:
+        # etykieta metryk: tylko emitery z konfiguracji, reszta zbiorczo (ograniczona kardynalność)
+        return emitter if emitter in self.per_emitter else "other"
+
+    # --- kubełki ---
+
+    def _take_local(
+        self, emitter: str, limits: dict[str, tuple[float, float]], costs, force: bool
+    ) -> tuple[bool, dict[str, _Bucket]]:
+        now = time.monotonic()
+        self._evict_local(now)
+        buckets = {}
+        for kind, (cap, ref) in limits.items():
+            key = f"rl:{kind}:{emitter}:{_num(cap)}:{_num(ref)}"
+            b = self._mem.get(key)
+            if b is None:
+                b = self._mem.setdefault(key, _Bucket(cap, ref))
+            b.refill(now)
+            buckets[kind] = b
+        ok = force or all(b.fits(costs.get(kind, 0.0)) for kind, b in buckets.items())
+        if ok:
+            for kind, b in buckets.items():
+                b.tokens -= costs.get(kind, 0.0)
+        return ok, buckets
+
+    def _evict_local(self, now: float) -> None:
+        # pełny kubełek = świeży kubełek → można go usunąć bez zmiany decyzji
+        if now < self._next_evict:
+            return
+        self._next_evict = now + _EVICT_EVERY_S
+        for key, b in list(self._mem.items()):
+            b.refill(now)
+            if b.tokens >= b.capacity:
+                del self._mem[key]
+
+    async def _eval(self, keys: list[str], args: list) -> list:
+        if not self._script_loaded:
+            # pierwsze użycie (albo po SCRIPT FLUSH / restarcie Redisa): LOAD + EVALSHA w jednym RTT
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.script_load(RL_LUA)
+            pipe.evalsha(RL_SHA, len(keys), *keys, *args)
+            _, out = await pipe.execute()
+            self._script_loaded = True
+            return out
+        try:
+            return await self.redis.evalsha(RL_SHA, len(keys), *keys, *args)
+        except Exception as err:
+            if type(err).__name__ != "NoScriptError":
+                raise
+            self._script_loaded = False
+            return await self._eval(keys, args)
+
+    async def _take_redis(
+        self, emitter: str, limits: dict[str, tuple[float, float]], costs, force: bool
+    ) -> tuple[bool, dict[str, _Bucket]] | None:
+        lease = self._leases.setdefault(emitter, _Lease()) if self.lease_fraction else None
+        refund: dict[str, float] = {}
+        if lease is not None:
+            # reszta dzierżawy wraca w tym samym wywołaniu (równoległe żądanie widzi już 0)
+            refund, lease.tokens = lease.tokens, {}
+            if lease.inflight is None:
+                lease.inflight = asyncio.get_running_loop().create_future()
+        try:
+            return await self._take_redis_once(emitter, limits, costs, force, lease, refund)
+        finally:
+            if lease is not None and lease.inflight is not None:
+                lease.inflight.set_result(None)
+                lease.inflight = None
+
+    async def _take_redis_once(
+        self, emitter: str, limits, costs, force: bool, lease: _Lease | None, refund
+    ) -> tuple[bool, dict[str, _Bucket]] | None:
+        # klucze z hash-tagiem emitera — ten sam slot w Redis Cluster (skrypt wielokluczowy)
+        keys = [f"rl:{{{emitter}}}:{kind}" for kind in limits]
+        args: list = [1 if force else 0]
+        for kind, (cap, ref) in limits.items():
+            size = 0.0 if lease is None or force else self._lease_size(cap)
+            cost, back = costs.get(kind, 0.0), refund.get(kind, 0.0)
+            args += [_num(cap), _num(ref), _num(cost), _num(back), _num(size)]
+        try:
+            raw = await asyncio.wait_for(self._eval(keys, args), self.redis_timeout)
+            ok = int(raw[0]) == 1
+            now = time.monotonic()
+            buckets, grants = {}, {}
+            for i, (kind, (cap, ref)) in enumerate(limits.items()):
+                buckets[kind] = _Bucket(cap, ref, float(raw[1 + 2 * i]), now)
+                grants[kind] = float(raw[2 + 2 * i])
+        except Exception as err:
+            # Redis wolny / niedostępny → lokalne kubełki repliki przez `redis_retry_s`;
+            # zwracana reszta dzierżawy przepada (nie wiadomo, czy skrypt się wykonał)
+            self._redis_down_until = time.monotonic() + self.redis_retry_s
+            logger.warning(
+                "rate limit: Redis unavailable (%s), local buckets for %.1fs",
+                type(err).__name__,
+                self.redis_retry_s,
+            )
+            return None
+        if lease is None:
+            return ok, buckets
+        for kind, grant in grants.items():
+            lease.tokens[kind] = lease.tokens.get(kind, 0.0) + grant
+        lease.view, lease.ts = buckets, now
+        self._lease_metrics(emitter, lease, limits)
+        return ok, lease.buckets(now)
+
+    def _lease_size(self, capacity: float) -> float:
+        return max(1.0, math.floor(capacity * self.lease_fraction))
+
+    def _take_leased(
+        self, emitter: str, limits: dict[str, tuple[float, float]], costs, force: bool
+    ) -> tuple[bool, dict[str, _Bucket]] | None:
+        # decyzja z lokalnej dzierżawy (None → trzeba zapytać Redisa)
+        lease = self._leases.get(emitter)
+        now = time.monotonic()
+        if lease is None or not lease.view or now - lease.ts >= self.lease_ttl:
+            return None
+        tokens = lease.tokens
+        if not force:
+            view = lease.buckets(now)
+            # widok nie zna zużycia innych replik — w Redisie jest najwyżej tyle, więc
+            # "nie mieści się w widoku" = 429 bez pytania Redisa
+            if not all(b.fits(costs.get(k, 0.0)) for k, b in view.items()):
+                return False, view
+            if any(tokens.get(k, 0.0) < costs.get(k, 0.0) for k in limits):
+                return None
+        for kind in limits:
+            tokens[kind] = tokens.get(kind, 0.0) - costs.get(kind, 0.0)
+        self._lease_metrics(emitter, lease, None)
+        return True, lease.buckets(now)
+
+    def _lease_metrics(self, emitter: str, lease: _Lease, limits) -> None:
+        label = self._label(emitter)
+        try:
+            for kind, held in lease.tokens.items():
+                RL_LEASE_HELD.labels(label, kind).set(held)
+            for kind, (cap, _) in (limits or {}).items():
+                RL_LEASE_SIZE.labels(label, kind).set(self._lease_size(cap))
+        except Exception:
+            pass
+
+    def _sweep(self, now: float) -> None:
+        # dzierżawy nieużywane dłużej niż lease_ttl_s wracają do Redisa w tle; pustych
+        # i bezczynnych nie trzymamy (słownik = emitery aktywne w ostatnim lease_ttl_s)
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.lease_ttl
+        for emitter, lease in list(self._leases.items()):
+            if now - lease.ts < self.lease_ttl or lease.inflight is not None:
+                continue
+            if not any(lease.tokens.values()):
+                del self._leases[emitter]
+            else:
+                task = asyncio.create_task(self._return_lease(emitter))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _return_lease(self, emitter: str) -> None:
+        limits, _ = self._emitter_limits(emitter)
+        await self._take_redis(emitter, limits, {}, True)
+
+    async def _take(
+        self,
+        emitter: str,
+        limits: dict[str, tuple[float, float]],
+        costs: dict[str, float],
+        *,
+        force: bool = False,
+    ) -> tuple[bool, dict[str, _Bucket]]:
+        """
+        Sprawdza koszt we wszystkich kubełkach i pobiera go, gdy mieści się w każdym
+        (force=True: pobiera bez sprawdzania). → (przepuszczone, kubełki po operacji).
+        """
+        if self.redis and time.monotonic() >= self._redis_down_until:
+            if self.lease_fraction:
+                self._sweep(time.monotonic())
+                while True:
+                    res = self._take_leased(emitter, limits, costs, force)
+                    if res is not None:
+                        _count("lease")
+                        return res
+                    lease = self._leases.get(emitter)
+                    if force or lease is None or lease.inflight is None:
+                        break
+                    # dzierżawa jest właśnie pobierana — czekamy zamiast drugiego EVALSHA
+                    await asyncio.shield(lease.inflight)
+            res = await self._take_redis(emitter, limits, costs, force)
+            if res is not None:
+                _count("redis")
+                return res
+        _count("local")
+        return self._take_local(emitter, limits, costs, force)
+
+    @staticmethod
+    def _headers(buckets: dict[str, _Bucket]) -> dict[str, str]:
+        headers: dict[str, str] = {}
+        for kind, suffix in KINDS:
+            b = buckets.get(kind)
+            if b is None:
+                continue
+            headers[f"X-RateLimit-Limit{suffix}"] = f"{b.capacity:.0f}"
+            headers[f"X-RateLimit-Remaining{suffix}"] = str(max(0, math.floor(b.tokens)))
+            headers[f"X-RateLimit-Reset{suffix}"] = str(math.ceil(b.reset_in()))
+        return headers
+
+    # --- ASGI ---
 
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
 
-        request = Request(scope, receive=receive)
-        path = request.url.path
         # bypassy dla sond/metryk
-        if path in ("/metrics", "/health", "/healthz"):
+        if scope["path"] in ("/metrics", "/health", "/healthz"):
             return await self.app(scope, receive, send)
 
-        # z nagłówka, z request.state (HMAC), albo "unknown"
-        emitter = (
-            getattr(request.state, "emitter", None)
-            or (request.headers.get("x-emitter") or "").strip()
-            or "unknown"
-        )
-
-        # parametry kubełka dla emitera
-        cfg = self.per_emitter.get(emitter, {})
-        cap = int(cfg.get("capacity", self.default_capacity))
-        ref = int(cfg.get("refill_per_sec", self.default_refill))
-
-        # klucz limitu
-        key = f"rl:emitter:{emitter}:{cap}:{ref}"
-
-        allowed = True
-        # Redisowa wersja (prosta: GET+SETEX i lokalna arytmetyka — OK na testy/dev)
-        if self.redis:
-            # używamy 1-tokenowego okna w 1/ref sec jako uproszczenie
-            ttl = max(1, 1)
-            try:
-                v = await self.redis.get(key)  # bytes or None
-                tokens = float(v.decode()) if v else float(cap)
-                # bardzo uproszczony refill (co żądanie), wystarczający na sanity dev
-                tokens = min(cap, tokens + ref * 0.1)  # 0.1s tick
-                if tokens >= 1.0:
-                    tokens -= 1.0
-                    allowed = True
-                else:
-                    allowed = False
-                await self.redis.setex(key, ttl, str(tokens))
-            except Exception:
-                # w razie problemów z redisem — nie dławić ruchu
-                allowed = True
-        else:
-            b = self._mem.get(key)
-            if not b:
-                b = self._mem.setdefault(key, _Bucket(cap, ref))
-            allowed = b.allow()
+        # z request.state (HMAC jest zewnętrzny — emiter uwierzytelnionego klienta),
+        # bez uwierzytelniania (auth.mode none) z nagłówka, albo "unknown"
+        req_headers = header_map(scope)
+        state = scope.get("state") or {}
+        emitter = state.get("emitter") or req_headers.get("x-emitter", "").strip() or "unknown"
+        limits, record_bytes = self._emitter_limits(emitter)
 
-        # nagłówki informacyjne
-        headers = {
-            "X-RateLimit-Limit": str(cap),
-            # heurystyka ile zostało (tylko in-memory daje sensowną liczbę)
-            "X-RateLimit-Remaining": "1" if allowed else "0",
-        }
+        # koszt z nagłówków (bez czytania body)
+        nbytes = _header_int(req_headers.get("content-length") or "")
+        if nbytes is None and state.get("raw_body"):
+            # body chunked już zbuforowane przez HMAC (handler nie czyta go z receive)
+            nbytes = len(state["raw_body"])
+        # X-Record-Count nie jest podpisany — może koszt podnieść, ale nie zejść poniżej
+        # szacunku z bajtów; pobierany co najmniej 1 rekord (tyle sprawdza `_Bucket.need`)
+        nrecords = _header_int(req_headers.get("x-record-count") or "") or 0
+        if nbytes is not None:
+            nrecords = max(nrecords, math.ceil(nbytes / record_bytes))
+        costs = {"requests": 1.0, "bytes": float(nbytes or 0), "records": float(max(1, nrecords))}
 
-        if not allowed:
+        ok, buckets = await self._take(emitter, limits, costs)
+        if not ok:
+            headers = self._headers(buckets)
+            retry = max(b.wait_for(costs[k]) for k, b in buckets.items())
+            headers["Retry-After"] = str(max(1, math.ceil(retry)))
             resp = JSONResponse(
                 {"error": "rate limit exceeded", "emitter": emitter},
                 status_code=429,
@@ -115,10 +517,32 @@ class TokenBucketRL:
             )
             return await resp(scope, receive, send)
 
+        # body bez Content-Length: bajty (i szacunek rekordów ponad pobrane) liczone, gdy
+        # aplikacja je czyta
+        pending = {k for k in ("bytes", "records") if k in buckets}
+        if nbytes is None and pending and scope.get("method") not in ("GET", "HEAD"):
+            seen = 0
+            inner_receive = receive
+
+            async def counting_receive():
+                nonlocal seen
+                message = await inner_receive()
+                if message["type"] == "http.request":
+                    seen += len(message.get("body", b""))
+                    if not message.get("more_body", False) and seen:
+                        records = math.ceil(seen / record_bytes) - costs["records"]
+                        late = {"bytes": float(seen), "records": max(0.0, records)}
+                        # koszt znany dopiero po odczycie body → dług w kubełkach
+                        pend = {k: late[k] for k in pending}
+                        await self._take(emitter, limits, pend, force=True)
+                return message
+
+            receive = counting_receive
+
         async def send_with_headers(message):
             if message["type"] == "http.response.start":
                 raw = list(message.get("headers") or [])
-                for k, v in headers.items():
+                for k, v in self._headers(buckets).items():
                     raw.append((k.encode("latin-1"), v.encode("latin-1")))
                 message["headers"] = raw
             await send(message)
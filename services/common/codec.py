@@ -0,0 +1,76 @@
+# services/common/codec.py
+"""
+Wspólny codec JSON dla usług i emiterów.
+
+Backend wybierany raz przy imporcie (`LOGOPS_JSON_BACKEND`: auto | orjson | msgspec | json):
+- auto → orjson, jeśli zainstalowany; potem msgspec; na końcu stdlib `json`,
+- szybkie backendy są opcjonalne — brak pakietu = cichy fallback do stdlib.
+
+Kontrakt niezależny od backendu:
+- `dumps(obj) -> bytes` — kompaktowy JSON w UTF-8 (jak `ensure_ascii=False`),
+- `loads(bytes | str)` — przy błędzie szybkiego backendu ponawiamy stdlib, więc akceptowane
+  wejście i wyjątki (`json.JSONDecodeError`) są takie jak dotąd (np. NaN/Infinity).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import Callable
+from typing import Any
+
+__all__ = ["BACKEND", "dumps", "load_backend", "loads", "std_dumps", "std_loads"]
+
+
+def std_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def std_loads(data: bytes | str) -> Any:
+    return json.loads(data)
+
+
+def load_backend(
+    name: str,
+) -> tuple[str, Callable[[Any], bytes], Callable[[bytes | str], Any]]:
+    if name in ("auto", "orjson"):
+        try:
+            import orjson  # type: ignore
+
+            return "orjson", orjson.dumps, orjson.loads
+        except ImportError:
+            pass
+    if name in ("auto", "msgspec"):
+        try:
+            import msgspec  # type: ignore
+
+            enc = msgspec.json.Encoder()
+            dec = msgspec.json.Decoder()
+            return "msgspec", enc.encode, dec.decode
+        except ImportError:
+            pass
+    return "json", std_dumps, std_loads
+
+
+BACKEND, _fast_dumps, _fast_loads = load_backend(
+    (os.getenv("LOGOPS_JSON_BACKEND") or "auto").strip().lower()
+)
+
+
+def dumps(obj: Any) -> bytes:
+    if BACKEND == "json":
+        return std_dumps(obj)
+    try:
+        return _fast_dumps(obj)
+    except Exception:
+        # np. int > 64 bit albo klucze nie-str — stdlib poradzi sobie (albo rzuci jak dotąd)
+        return std_dumps(obj)
+
+
+def loads(data: bytes | str) -> Any:
+    if BACKEND == "json":
+        return std_loads(data)
+    try:
+        return _fast_loads(data)
+    except Exception:
+        return std_loads(data)
@@ -0,0 +1,283 @@
+# services/common/colbatch.py
+"""
+Kolumnowy format batcha na wewnętrznym hopie IngestGW → Core (`application/x-logops-columnar`).
+
+Znormalizowane rekordy mają te same etykiety w całym batchu (`app`, `source`, `emitter`,
+`scenario_id`, zwykle też flagi `_missing_*`), a JSON powtarza je — razem z nazwami kluczy —
+w każdym rekordzie. Ramka batcha:
+
+    b"LCB1" | u32 długość reszty ramki
+    u32 + nagłówek JSON {"n": N, "labels": {...}, "levels": [...], "attrs": bool}
+    u32 + długości `ts` (u32 × N, w znakach) | u32 + `ts` sklejone (UTF-8)
+    u32 + kody `level` (u8 × N, indeksy w "levels"; u16 przy > 256 wartościach)
+    u32 + długości `msg` | u32 + `msg` sklejone
+    u32 + atrybuty JSON {"cols": {pole: [N wartości]}, "rows": [mapa | null] × N | null}
+          (pusta sekcja, gdy "attrs": false)
+
+- `labels` = pola obecne z tą samą wartością skalarną we wszystkich rekordach,
+- `cols` = pozostałe pola obecne we wszystkich rekordach, `rows` = pola tylko części rekordów,
+- body może zawierać kilka ramek (sklejenie body = sklejenie batchy — jak przy łączeniu w IngestGW),
+- rekord bez `ts`/`level`/`msg` typu str albo więcej niż 65 536 różnych `level` (kody u16)
+  → `encode_batch` zwraca None, wołający wysyła JSON,
+- Core, który zna format, dokłada do odpowiedzi `400` na ramkę nagłówek `X-LogOps-Columnar: 1`
+  (`COLUMNAR_ACK_HEADER`) — `400` bez niego = starszy Core, który czytał ramkę jako JSON.
+Liczby całkowite little-endian; tekst dekodowany raz na kolumnę i cięty po długościach.
+"""
+
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from collections.abc import AsyncIterable, AsyncIterator
+from itertools import accumulate
+from operator import itemgetter
+from typing import Any
+
+from services.common import codec
+
+from .jsonstream import StreamDecodeError, StreamLimitError
+
+__all__ = [
+    "COLUMNAR_ACK_HEADER",
+    "COLUMNAR_CONTENT_TYPE",
+    "ColumnarBatchStream",
+    "decode_batch",
+    "encode_batch",
+    "is_columnar",
+]
+
+COLUMNAR_CONTENT_TYPE = "application/x-logops-columnar"
+COLUMNAR_ACK_HEADER = "X-LogOps-Columnar"
+
+_MAGIC = b"LCB1"
+_U32 = struct.Struct("<I")
+_COLUMNS = ("ts", "level", "msg")
+_MAX_LEVELS = 1 << 16  # kody `level` to u8 albo u16
+_LABEL_TYPES = (str, int, float, bool, type(None))
+_SWAP = sys.byteorder != "little"
+
+
+def is_columnar(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() == COLUMNAR_CONTENT_TYPE
+
+
+def _hoist(records: list[dict[str, Any]]) -> tuple[dict[str, Any], dict[str, list[Any]]]:
+    # pola obecne we wszystkich rekordach → etykiety (stała wartość skalarna) albo kolumny
+    # atrybutów; kolumna pola zbierana w C (map/itemgetter), stałość przez list.count
+    # (najpierw tożsamość) — typ sprawdzany osobno, bo 1 == True == 1.0 (str równy tylko str)
+    n = len(records)
+    labels: dict[str, Any] = {}
+    cols: dict[str, list[Any]] = {}
+    for k, v in records[0].items():
+        if k in _COLUMNS:
+            continue
+        try:
+            vals = list(map(itemgetter(k), records))
+        except KeyError:
+            continue  # nie w każdym rekordzie → mapa atrybutów rekordu
+        if (
+            isinstance(v, _LABEL_TYPES)
+            and vals.count(v) == n
+            and (type(v) is str or set(map(type, vals)) == {type(v)})
+        ):
+            labels[k] = v
+        else:
+            cols[k] = vals
+    return labels, cols
+
+
+def _ints(typecode: str, values: Any) -> bytes:
+    arr = array(typecode, values)
+    if _SWAP:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _section(parts: list[bytes], data: bytes) -> None:
+    parts.append(_U32.pack(len(data)))
+    parts.append(data)
+
+
+def encode_batch(records: list[dict[str, Any]]) -> bytes | None:
+    """
+    Rekordy → jedna ramka; None, gdy któryś rekord nie pasuje do kolumn (nie-dict albo
+    `ts`/`level`/`msg` nie jest str) albo słownik poziomów nie mieści się w kodach u16
+    (nieznane poziomy od klienta przechodzą bez zmian) — wtedy wysyłamy JSON.
+    """
+    if not records:
+        return None
+    try:
+        ts = list(map(itemgetter("ts"), records))
+        lvl = list(map(itemgetter("level"), records))
+        msg = list(map(itemgetter("msg"), records))
+    except (KeyError, TypeError):
+        return None
+    for col in (ts, lvl, msg):
+        if set(map(type, col)) != {str}:
+            return None
+
+    labels, cols = _hoist(records)
+    # etykiety i kolumny są w każdym rekordzie — rekord bez innych pól ma dokładnie tyle kluczy
+    width = len(labels) + len(cols) + len(_COLUMNS)
+    rows: list[dict[str, Any] | None] | None = None
+    if set(map(len, records)) != {width}:
+        known = labels.keys() | cols.keys() | set(_COLUMNS)
+        rows = [{k: v for k, v in r.items() if k not in known} or None for r in records]
+    has_attrs = bool(cols) or rows is not None
+
+    levels = list(dict.fromkeys(lvl))
+    if len(levels) > _MAX_LEVELS:
+        return None
+    index = {v: i for i, v in enumerate(levels)}
+    header = {"n": len(records), "labels": labels, "levels": levels, "attrs": has_attrs}
+
+    parts: list[bytes] = []
+    _section(parts, codec.dumps(header))
+    _section(parts, _ints("I", map(len, ts)))
+    _section(parts, "".join(ts).encode("utf-8", "surrogatepass"))
+    _section(parts, _ints("B" if len(levels) <= 256 else "H", map(index.__getitem__, lvl)))
+    _section(parts, _ints("I", map(len, msg)))
+    _section(parts, "".join(msg).encode("utf-8", "surrogatepass"))
+    _section(parts, codec.dumps({"cols": cols, "rows": rows}) if has_attrs else b"")
+    body = b"".join(parts)
+    return _MAGIC + _U32.pack(len(body)) + body
+
+
+def _read_ints(typecode: str, data: bytes, n: int) -> array:
+    arr = array(typecode)
+    arr.frombytes(data)
+    if _SWAP:
+        arr.byteswap()
+    if len(arr) != n:
+        raise StreamDecodeError("column length mismatch")
+    return arr
+
+
+def _strings(lens_raw: bytes, blob: bytes, n: int) -> list[str]:
+    lens = _read_ints("I", lens_raw, n)
+    text = blob.decode("utf-8", "surrogatepass")
+    offs = [0, *accumulate(lens)]
+    if offs[-1] != len(text):
+        raise StreamDecodeError("column length mismatch")
+    return [text[a:b] for a, b in zip(offs, offs[1:], strict=False)]
+
+
+def _frame_records(frame: bytes, room: int = -1) -> list[dict[str, Any]]:
+    # room ≥ 0: ile rekordów jeszcze mieści limit — sprawdzane przed budową rekordów
+    sections: list[bytes] = []
+    pos = 0
+    while pos < len(frame):
+        if pos + 4 > len(frame):
+            raise StreamDecodeError("truncated section")
+        (size,) = _U32.unpack_from(frame, pos)
+        pos += 4
+        if pos + size > len(frame):
+            raise StreamDecodeError("truncated section")
+        sections.append(frame[pos : pos + size])
+        pos += size
+    if len(sections) != 7:
+        raise StreamDecodeError("bad frame layout")
+    try:
+        header = codec.loads(sections[0])
+        n = int(header["n"])
+        labels = dict(header["labels"])
+        levels = list(header["levels"])
+        attrs = codec.loads(sections[6]) if header.get("attrs") else None
+    except (ValueError, KeyError, TypeError) as err:
+        raise StreamDecodeError(f"bad frame header: {err}") from None
+    if 0 <= room < n:
+        raise StreamLimitError("too_many_items", room)
+
+    ts = _strings(sections[1], sections[2], n)
+    codes = _read_ints("B" if len(levels) <= 256 else "H", sections[3], n)
+    msg = _strings(sections[4], sections[5], n)
+    try:
+        lvl = [levels[c] for c in codes]
+    except IndexError:
+        raise StreamDecodeError("bad level code") from None
+    records = [
+        {**labels, "ts": t, "level": lv, "msg": m} for t, lv, m in zip(ts, lvl, msg, strict=False)
+    ]
+    if attrs:
+        try:
+            for k, col in (attrs.get("cols") or {}).items():
+                if len(col) != n:
+                    raise StreamDecodeError("attrs length mismatch")
+                for r, v in zip(records, col, strict=False):
+                    r[k] = v
+            rows = attrs.get("rows")
+            if rows is not None:
+                if len(rows) != n:
+                    raise StreamDecodeError("attrs length mismatch")
+                for r, extra in zip(records, rows, strict=False):
+                    if extra:
+                        r.update(extra)
+        except (AttributeError, TypeError, ValueError) as err:
+            raise StreamDecodeError(f"bad attrs: {err}") from None
+    return records
+
+
+def decode_batch(data: bytes) -> list[dict[str, Any]]:
+    """Całe body (jedna albo więcej ramek) → rekordy."""
+    stream = ColumnarBatchStream()
+    out = stream.feed(data)
+    stream.close()
+    return out
+
+
+class ColumnarBatchStream:
+    """
+    Parser body kolumnowego karmiony kawałkami (API jak JsonArrayStream):
+    ramka jest dekodowana, gdy jest kompletna; `max_items` sprawdzane z nagłówka ramki
+    przed budową rekordów, `max_bytes` — przy każdym kawałku (0 = bez limitu).
+    """
+
+    is_array = True
+
+    def __init__(self, *, max_items: int = 0, max_bytes: int = 0):
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        self.bytes_seen = 0
+        self.items = 0
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes) -> list[dict[str, Any]]:
+        """Dokłada kawałek body; zwraca rekordy z ramek skompletowanych w tym kroku."""
+        if not chunk:
+            return []
+        self.bytes_seen += len(chunk)
+        if self.max_bytes and self.bytes_seen > self.max_bytes:
+            raise StreamLimitError("too_large", self.max_bytes)
+        buf = self._buf
+        buf += chunk
+        out: list[dict[str, Any]] = []
+        while len(buf) >= 8:
+            if buf[:4] != _MAGIC:
+                raise StreamDecodeError("bad frame magic")
+            (size,) = _U32.unpack_from(buf, 4)
+            if len(buf) < 8 + size:
+                break
+            frame = bytes(buf[8 : 8 + size])
+            del buf[: 8 + size]
+            room = self.max_items - self.items if self.max_items else -1
+            try:
+                records = _frame_records(frame, room)
+            except StreamLimitError:
+                raise StreamLimitError("too_many_items", self.max_items) from None
+            self.items += len(records)
+            out.extend(records)
+        return out
+
+    def close(self) -> list[dict[str, Any]]:
+        """Koniec body: niedokończona ramka → StreamDecodeError."""
+        if self._buf:
+            raise StreamDecodeError("truncated frame")
+        return []
+
+    async def aiter(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[list[dict[str, Any]]]:
+        async for chunk in chunks:
+            items = self.feed(chunk)
+            if items:
+                yield items
+        self.close()
@@ -0,0 +1,240 @@
+# services/common/compression.py
+"""
+Dekompresja body żądań wg `Content-Encoding` (gzip, deflate, zstd) — strumieniowo, przed parsowaniem.
+
+`decompress_stream(chunks, encoding)` zamienia strumień bajtów z sieci na strumień bajtów
+zdekompresowanych w kawałkach co najwyżej `OUT_CHUNK` — parser (JsonArrayStream, TextLineStream)
+dostaje je tak, jak dostałby body bez kompresji, a całe body nie jest nigdy w pamięci.
+
+Ochrona przed "bombą dekompresyjną" sprawdzana po każdym kawałku wyjścia:
+- `LOGOPS_MAX_DECOMPRESSED_BYTES` — twardy limit bajtów po dekompresji (0 = bez limitu),
+- `LOGOPS_MAX_DECOMPRESSION_RATIO` — maks. stosunek wyjścia do wejścia (od 1 MiB wyjścia).
+Przekroczenie → `StreamLimitError("too_large")` (413 jak przy zbyt dużym body).
+
+zstd: stdlib `compression.zstd` (Python 3.14+) albo pakiet `zstandard`; bez nich `zstd` jest
+nieobsługiwany (`UnsupportedEncoding` → 415), gzip/deflate działają zawsze (zlib).
+"""
+
+from __future__ import annotations
+
+import os
+import zlib
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from typing import Any
+
+from .jsonstream import StreamLimitError
+
+__all__ = [
+    "ENCODINGS",
+    "MAX_DECOMPRESSED_BYTES",
+    "MAX_RATIO",
+    "DecompressError",
+    "UnsupportedEncoding",
+    "content_encoding",
+    "decompress_stream",
+]
+
+MAX_DECOMPRESSED_BYTES = int(os.getenv("LOGOPS_MAX_DECOMPRESSED_BYTES", str(64 << 20)))
+MAX_RATIO = int(os.getenv("LOGOPS_MAX_DECOMPRESSION_RATIO", "200"))
+OUT_CHUNK = 64 * 1024
+_RATIO_FLOOR = 1 << 20  # małe body mogą mieć dowolny stosunek (np. same spacje)
+
+
+def _zstd_module() -> tuple[str, Any] | None:
+    try:
+        from compression import zstd  # type: ignore[import-not-found]
+
+        return "stdlib", zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore[import-not-found]
+
+        return "zstandard", zstandard
+    except ImportError:
+        return None
+
+
+_ZSTD = _zstd_module()
+ENCODINGS: tuple[str, ...] = ("gzip", "deflate") + (("zstd",) if _ZSTD else ())
+
+
+class UnsupportedEncoding(ValueError):
+    """Content-Encoding, którego nie umiemy zdekodować (→ 415)."""
+
+
+class DecompressError(ValueError):
+    """Uszkodzone albo urwane dane skompresowane (→ 400)."""
+
+
+def content_encoding(headers: Any) -> str:
+    """
+    Nagłówek Content-Encoding → "" (brak / identity) albo jedno kodowanie z ENCODINGS
+    (`x-gzip` = gzip). Łańcuch kodowań albo nieznane → UnsupportedEncoding.
+    """
+    raw = (headers.get("content-encoding") or "").strip().lower()
+    if raw in ("", "identity"):
+        return ""
+    enc = {"x-gzip": "gzip"}.get(raw, raw)
+    if enc not in ENCODINGS:
+        raise UnsupportedEncoding(raw)
+    return enc
+
+
+class _ZlibDecoder:
+    # gzip (także wiele członów), deflate (zlib; surowy deflate rozpoznany po nagłówku)
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._d: Any = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+        self._head = b""
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        if self._d is None:
+            # RFC 9110: "deflate" = zlib; część klientów wysyła surowy deflate — bez nagłówka zlib
+            data = self._head + data
+            if len(data) < 2:
+                self._head = data
+                return
+            zlib_hdr = data[0] & 0x0F == 8 and (data[0] << 8 | data[1]) % 31 == 0
+            self._d = zlib.decompressobj(zlib.MAX_WBITS if zlib_hdr else -zlib.MAX_WBITS)
+        d = self._d
+        try:
+            while data:
+                if d.eof:
+                    # kolejny człon gzip (np. `cat a.gz b.gz`); po deflate — śmieci
+                    if self.encoding != "gzip" or not data.strip(b"\0"):
+                        return
+                    d = self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                out = d.decompress(data, OUT_CHUNK)
+                data = d.unconsumed_tail or d.unused_data
+                if out:
+                    yield out
+        except zlib.error as err:
+            raise DecompressError(str(err)) from None
+
+    def finish(self) -> Iterator[bytes]:
+        d = self._d
+        if d is None:
+            raise DecompressError("truncated stream")
+        try:
+            while True:
+                out = d.flush(OUT_CHUNK)
+                if not out:
+                    break
+                yield out
+        except zlib.error as err:
+            raise DecompressError(str(err)) from None
+        if not d.eof:
+            raise DecompressError("truncated stream")
+
+
+class _StdZstdDecoder:
+    # compression.zstd (3.14+): decompress(max_length) jak bz2/lzma
+    def __init__(self, mod: Any):
+        self._mod = mod
+        self._d = mod.ZstdDecompressor()
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        d = self._d
+        try:
+            while True:
+                if d.eof:
+                    if not data and not d.unused_data:
+                        return
+                    data, d = d.unused_data + data, self._mod.ZstdDecompressor()
+                    self._d = d
+                out = d.decompress(data, OUT_CHUNK)
+                data = b""
+                if out:
+                    yield out
+                if d.needs_input and not d.eof:
+                    return
+        except self._mod.ZstdError as err:
+            raise DecompressError(str(err)) from None
+
+    def finish(self) -> Iterator[bytes]:
+        if not self._d.eof:
+            raise DecompressError("truncated stream")
+        return iter(())
+
+
+class _ZstandardDecoder:
+    # pakiet `zstandard`: decompressobj bez max_length — wejście podawane po 256 B,
+    # więc jeden krok wyprodukuje najwyżej kilka MiB ponad limit
+    _STEP = 256
+
+    def __init__(self, mod: Any):
+        self._mod = mod
+        self._d = mod.ZstdDecompressor().decompressobj()
+        self._fed = False
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        step = self._STEP
+        try:
+            for i in range(0, len(data), step):
+                piece = data[i : i + step]
+                while piece:
+                    if self._d.eof:
+                        # kolejna ramka zstd
+                        self._d = self._mod.ZstdDecompressor().decompressobj()
+                    out = self._d.decompress(piece)
+                    piece = self._d.unused_data if self._d.eof else b""
+                    self._fed = True
+                    if out:
+                        yield out
+        except self._mod.ZstdError as err:
+            raise DecompressError(str(err)) from None
+
+    def finish(self) -> Iterator[bytes]:
+        if self._fed and not self._d.eof:
+            raise DecompressError("truncated stream")
+        return iter(())
+
+
+def _decoder(encoding: str) -> Any:
+    if encoding in ("gzip", "deflate"):
+        return _ZlibDecoder(encoding)
+    if encoding == "zstd" and _ZSTD is not None:
+        kind, mod = _ZSTD
+        return _StdZstdDecoder(mod) if kind == "stdlib" else _ZstandardDecoder(mod)
+    raise UnsupportedEncoding(encoding)
+
+
+async def decompress_stream(
+    chunks: AsyncIterable[bytes],
+    encoding: str,
+    *,
+    max_bytes: int | None = None,
+    max_ratio: int | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Strumień body skompresowanego `encoding` → strumień bajtów po dekompresji.
+    "" (brak kodowania) → chunks bez zmian. Limity domyślnie z ENV (patrz wyżej).
+    """
+    if not encoding:
+        async for chunk in chunks:
+            yield chunk
+        return
+    limit = MAX_DECOMPRESSED_BYTES if max_bytes is None else max(0, int(max_bytes))
+    ratio = MAX_RATIO if max_ratio is None else max(0, int(max_ratio))
+    dec = _decoder(encoding)
+    seen_in = seen_out = 0
+
+    def check(out: bytes) -> bytes:
+        nonlocal seen_out
+        seen_out += len(out)
+        if limit and seen_out > limit:
+            raise StreamLimitError("too_large", limit)
+        if ratio and seen_out > _RATIO_FLOOR and seen_out > ratio * max(1, seen_in):
+            raise StreamLimitError("too_large", ratio * max(1, seen_in))
+        return out
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        seen_in += len(chunk)
+        for out in dec.feed(chunk):
+            yield check(out)
+    if seen_in:
+        for out in dec.finish():
+            yield check(out)
@@ -0,0 +1,290 @@
+# services/common/jsonstream.py
+"""
+Przyrostowy parser body JSON (tablica rekordów albo pojedynczy obiekt).
+
+Duże body nie jest materializowane w całości: `feed(chunk)` dekoduje kolejne elementy tablicy
+najwyższego poziomu, gdy tylko są kompletne (`json.JSONDecoder.raw_decode` — skaner w C),
+a bufor trzyma wyłącznie niedokończony element. Body mniejsze niż `LOGOPS_JSON_STREAM_MIN_BYTES`
+są dekodowane w całości przez `codec.loads` (orjson/msgspec są szybsze, a pamięć i tak mała).
+Element urwany na granicy kawałka nie jest dekodowany od nowa przy każdym kawałku: skaner
+nawiasów/cudzysłowów wznawia od miejsca, w którym skończył, a `raw_decode` rusza dopiero, gdy
+element jest domknięty. Obie ścieżki akceptują to samo wejście (łącznie z NaN/Infinity, jak
+stdlib). Limity bajtów i elementów sprawdzane są w trakcie — przekroczenie przerywa parsowanie
+od razu (`StreamLimitError`).
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+import os
+import re
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Any
+
+from services.common import codec
+
+__all__ = ["STREAM_MIN_BYTES", "JsonArrayStream", "StreamDecodeError", "StreamLimitError"]
+
+# poniżej tego rozmiaru body dekodujemy w całości (szybki backend codec)
+STREAM_MIN_BYTES = int(os.getenv("LOGOPS_JSON_STREAM_MIN_BYTES", "65536"))
+
+_WS = re.compile(r"[ \t\r\n]*")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+_NUMBER_START = frozenset("-0123456789")
+_VALUE_START = frozenset('{["tfnNI') | _NUMBER_START  # N/I: NaN/Infinity (jak json.loads)
+_CONTAINER_START = frozenset('{["')
+_STR_STOP = re.compile(r'["\\]')
+_STRUCT_STOP = re.compile(r'[\[\]{}"]')
+_raw_decode = json.JSONDecoder().raw_decode
+
+
+class StreamDecodeError(ValueError):
+    """Body nie jest poprawnym JSON-em (albo urwało się w połowie)."""
+
+
+class StreamLimitError(ValueError):
+    """Przekroczony limit: reason = "too_large" (bajty) | "too_many_items" | "line_too_large"."""
+
+    def __init__(self, reason: str, limit: int):
+        super().__init__(f"{reason} (limit {limit})")
+        self.reason = reason
+        self.limit = limit
+
+
+class JsonArrayStream:
+    """
+    Parser karmiony kawałkami body:
+    - `[ {...}, {...} ]` → elementy zwracane, gdy tylko są kompletne,
+    - cokolwiek innego (np. `{...}`) → jedna wartość, dekodowana w `close()`,
+    - `max_bytes` / `max_items` (0 = bez limitu) sprawdzane przy każdym kawałku/elemencie,
+    - do `buffer_below` bajtów (domyślnie STREAM_MIN_BYTES; 0 = zawsze przyrostowo) body jest
+      tylko buforowane i w `close()` dekodowane jednym `codec.loads`.
+    Elementy nie-dict są zwracane bez zmian — walidacja należy do wołającego.
+    """
+
+    def __init__(self, *, max_items: int = 0, max_bytes: int = 0, buffer_below: int | None = None):
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        below = STREAM_MIN_BYTES if buffer_below is None else buffer_below
+        self._whole: bytearray | None = bytearray() if below > 0 else None
+        self._whole_max = below
+        self.bytes_seen = 0
+        self.items = 0
+        self.is_array: bool | None = None  # None = jeszcze nie wiadomo
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""  # jeszcze nieprzetworzony tekst (od początku bieżącego elementu)
+        self._parts: list[str] = []  # dalsze kawałki tekstu niedomkniętego elementu/wartości
+        self._scan: tuple[int, bool, bool] | None = None  # (głębokość, w stringu, po "\\")
+        self._expect_value = True
+        self._after_comma = False
+        self._done = False  # widzieliśmy zamykające "]"
+
+    # --- API ---
+
+    def feed(self, chunk: bytes) -> list[Any]:
+        """Dokłada kawałek body; zwraca elementy zdekodowane w tym kroku."""
+        if not chunk:
+            return []
+        self.bytes_seen += len(chunk)
+        if self.max_bytes and self.bytes_seen > self.max_bytes:
+            raise StreamLimitError("too_large", self.max_bytes)
+        if self._whole is not None:
+            self._whole += chunk
+            if len(self._whole) < self._whole_max:
+                return []
+            # body większe niż próg → przechodzimy na parsowanie przyrostowe
+            chunk, self._whole = bytes(self._whole), None
+        text = self._decode(chunk, final=False)
+        if self.is_array is None:
+            self._text += text
+            if not self._sniff():
+                return []
+            return self._parse(final=False) if self.is_array else []
+        if not self.is_array:
+            self._parts.append(text)  # pojedyncza wartość — sklejana raz, w close()
+            return []
+        if self._scan is None:
+            self._text += text
+            return self._parse(final=False)
+        # niedomknięty element: skanujemy tylko nowy kawałek, dekodujemy po domknięciu
+        self._parts.append(text)
+        if not self._scan_more(text, 0):
+            return []
+        self._join()
+        return self._parse(final=False, first_complete=True)
+
+    def close(self) -> list[Any]:
+        """Koniec body: waliduje domknięcie i zwraca resztę (lub jedyną wartość nie-tablicową)."""
+        if self._whole is not None:
+            return self._close_whole()
+        text = self._decode(b"", final=True)
+        if self.is_array is None:
+            self._text += text
+            if not self._sniff():
+                raise StreamDecodeError("empty body")
+        else:
+            self._parts.append(text)
+        self._join()
+        if not self.is_array:
+            out: list[Any] = []
+            self._emit_raw(self._text, out)
+            self._text = ""
+            return out
+        out = self._parse(final=True)
+        if not self._done:
+            raise StreamDecodeError("unterminated array")
+        return out
+
+    async def aiter(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[list[Any]]:
+        """Strumień body → listy elementów (po jednej na kawałek, puste pomijane)."""
+        async for chunk in chunks:
+            items = self.feed(chunk)
+            if items:
+                yield items
+        items = self.close()
+        if items:
+            yield items
+
+    # --- wnętrze ---
+
+    def _close_whole(self) -> list[Any]:
+        raw, self._whole = bytes(self._whole or b""), None
+        if not raw.strip():
+            raise StreamDecodeError("empty body")
+        try:
+            payload = codec.loads(raw)
+        except ValueError as err:
+            raise StreamDecodeError("invalid body") from err
+        self.is_array = isinstance(payload, list)
+        if not self.is_array:
+            self._count()
+            return [payload]
+        self.items = len(payload)
+        if self.max_items and self.items > self.max_items:
+            raise StreamLimitError("too_many_items", self.max_items)
+        return payload
+
+    def _decode(self, chunk: bytes, final: bool) -> str:
+        try:
+            return self._utf8.decode(chunk, final)
+        except UnicodeDecodeError as err:
+            raise StreamDecodeError("invalid utf-8") from err
+
+    def _join(self) -> None:
+        if self._parts:
+            self._text = "".join([self._text, *self._parts])
+            self._parts.clear()
+        self._scan = None
+
+    def _scan_more(self, text: str, pos: int) -> bool:
+        """Wznawia skan elementu od `pos`; True = element najwyższego poziomu domknięty."""
+        depth, in_str, esc = self._scan or (0, False, False)
+        n = len(text)
+        while pos < n:
+            if esc:
+                esc = False
+                pos += 1
+            elif in_str:
+                m = _STR_STOP.search(text, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                if m.group() == "\\":
+                    esc = True
+                else:
+                    in_str = False
+                    if depth == 0:  # element był stringiem
+                        return True
+            else:
+                m = _STRUCT_STOP.search(text, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                ch = m.group()
+                if ch == '"':
+                    in_str = True
+                elif ch in "[{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth <= 0:
+                        return True
+        self._scan = (depth, in_str, esc)
+        return False
+
+    def _sniff(self) -> bool:
+        text = self._text.lstrip("\ufeff \t\r\n")
+        self._text = text
+        if not text:
+            return False
+        self.is_array = text[0] == "["
+        if self.is_array:
+            self._text = text[1:]
+        return True
+
+    def _count(self) -> None:
+        self.items += 1
+        if self.max_items and self.items > self.max_items:
+            raise StreamLimitError("too_many_items", self.max_items)
+
+    def _emit_raw(self, raw: str, out: list[Any]) -> None:
+        self._count()
+        try:
+            out.append(codec.loads(raw))
+        except ValueError as err:
+            raise StreamDecodeError("invalid body") from err
+
+    def _parse(self, *, final: bool, first_complete: bool = False) -> list[Any]:
+        # first_complete: skaner potwierdził, że pierwszy element jest domknięty
+        out: list[Any] = []
+        text = self._text
+        n = len(text)
+        pos = _WS.match(text).end()
+        while pos < n and not self._done:
+            c = text[pos]
+            if self._expect_value:
+                if c == "]" and not self._after_comma:  # "[]"
+                    self._done = True
+                    pos += 1
+                    break
+                if c not in _VALUE_START:
+                    raise StreamDecodeError(f"unexpected {c!r} in array")
+                try:
+                    obj, end = _raw_decode(text, pos)
+                except ValueError as err:
+                    # element urwany na granicy kawałka — czekamy na resztę; kontener/string
+                    # skanujemy od razu: domknięty, a nie do zdekodowania = błąd
+                    if final or first_complete:
+                        raise StreamDecodeError(f"invalid item #{self.items}") from err
+                    if c in _CONTAINER_START:
+                        self._scan = None
+                        if self._scan_more(text, pos):
+                            raise StreamDecodeError(f"invalid item #{self.items}") from err
+                    break
+                first_complete = False
+                if c in _NUMBER_START and not final and _NUMBER_TAIL.match(text, end).end() >= n:
+                    break  # liczba mogła zostać ucięta ("-3." | "5e10") — czekamy na resztę
+                self._count()
+                out.append(obj)
+                self._expect_value = False
+                pos = end
+            elif c == ",":
+                self._expect_value = True
+                self._after_comma = True
+                pos += 1
+            elif c == "]":
+                self._done = True
+                pos += 1
+                break
+            else:
+                raise StreamDecodeError(f"expected ',' or ']', got {c!r}")
+            pos = _WS.match(text, pos).end()
+
+        # zostawiamy w buforze tylko niedokończony element (albo ogon po "]")
+        self._text = text[pos:]
+        if self._done and self._text.strip(" \t\r\n"):
+            raise StreamDecodeError("data after closing bracket")
+        if self._done:
+            self._text = ""
+        return out
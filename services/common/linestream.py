@@ -0,0 +1,135 @@
+# services/common/linestream.py
+"""
+Strumieniowy podział body tekstowego (text/plain, text/csv) na kawałki pełnych linii.
+
+Body nie jest materializowane w całości: `feed(chunk)` dokłada bajty do bufora i, gdy ten
+urośnie do `chunk_bytes`, oddaje wszystko do ostatniego "\\n" (CSV — poza polem w cudzysłowie)
+jako `bytes` — jedna kopia przez `memoryview`, bez dekodowania i bez listy linii. Bufor trzyma
+więc najwyżej jeden kawałek plus niedokończoną linię; dekodowanie UTF-8 i parsowanie odbywa się
+per kawałek u wołającego (np. w puli procesów). Cięcie zawsze tuż po "\\n" jest bezpieczne
+dla UTF-8 (bajt 0x0A nie występuje wewnątrz znaków wielobajtowych). Szukanie granicy
+wznawia od miejsca, w którym skończyło poprzednie (parzystość `"` niesiona dalej), więc długa
+linia / pole w cudzysłowie rozłożone na wiele kawałków jest skanowane raz.
+"""
+
+from __future__ import annotations
+
+import os
+from collections.abc import AsyncIterable, AsyncIterator
+
+from .jsonstream import StreamLimitError
+
+__all__ = ["MAX_LINE_BYTES", "TextLineStream"]
+
+# maks. bajtów bez granicy, w której wolno ciąć (linia bez "\n" albo pole CSV z niedomkniętym
+# cudzysłowem) — bez tego jeden "\"" rozciąga bufor na całe body; 0 = bez limitu
+MAX_LINE_BYTES = int(os.getenv("LOGOPS_TEXT_MAX_LINE_BYTES", str(8 << 20)))
+
+
+class TextLineStream:
+    """
+    Splitter karmiony kawałkami body:
+    - `feed()` → lista kawałków (każdy kończy się "\\n", ~`chunk_bytes`, zwykle 0 albo 1),
+    - `close()` → reszta (ostatnia linia bez "\\n" też),
+    - `quoted=True` (CSV): cięcie tylko przy parzystej liczbie `"` od początku kawałka,
+    - `max_bytes` (0 = bez limitu) sprawdzany przy każdym kawałku → `StreamLimitError`,
+    - `max_line_bytes` (domyślnie MAX_LINE_BYTES; 0 = bez limitu): tyle bajtów ponad kawałek
+      bez granicy cięcia → `StreamLimitError("line_too_large")`.
+    """
+
+    def __init__(
+        self,
+        chunk_bytes: int,
+        *,
+        quoted: bool = False,
+        max_bytes: int = 0,
+        max_line_bytes: int | None = None,
+    ):
+        self.chunk_bytes = max(1, int(chunk_bytes))
+        self.quoted = quoted
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_line_bytes = max(
+            0, int(MAX_LINE_BYTES if max_line_bytes is None else max_line_bytes)
+        )
+        self.bytes_seen = 0
+        self._buf = bytearray()
+        self._scan = 0  # bufor przejrzany do tej pozycji (bez granicy cięcia od chunk_bytes - 1)
+        self._odd = False  # CSV: nieparzysta liczba `"` w buf[:_scan]
+
+    # --- API ---
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """Dokłada kawałek body; zwraca kawałki pełnych linii gotowe do parsowania."""
+        if not chunk:
+            return []
+        self.bytes_seen += len(chunk)
+        if self.max_bytes and self.bytes_seen > self.max_bytes:
+            raise StreamLimitError("too_large", self.max_bytes)
+        buf = self._buf
+        buf += chunk
+        out: list[bytes] = []
+        while len(buf) >= self.chunk_bytes:
+            cut = self._cut(self.chunk_bytes)
+            if cut <= 0:
+                if self.max_line_bytes and len(buf) > self.chunk_bytes + self.max_line_bytes:
+                    raise StreamLimitError("line_too_large", self.max_line_bytes)
+                break
+            out.append(self._take(cut))
+        return out
+
+    def close(self) -> list[bytes]:
+        """Koniec body: reszta bufora (pusta/same białe znaki → nic)."""
+        rest = self._take(len(self._buf))
+        return [rest] if rest.strip() else []
+
+    async def aiter(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """Strumień body → kolejne kawałki pełnych linii."""
+        async for chunk in chunks:
+            for part in self.feed(chunk):
+                yield part
+        for part in self.close():
+            yield part
+
+    # --- wnętrze ---
+
+    def _cut(self, at_least: int) -> int:
+        # pierwsza granica linii od `at_least` (kawałki ~chunk_bytes także z jednego dużego
+        # odczytu); CSV: przesuwamy się dalej, dopóki jesteśmy w środku pola w cudzysłowie.
+        # Skan wznawiany od self._scan — nic przed nim nie liczymy drugi raz.
+        buf = self._buf
+        pos = max(self._scan, at_least - 1)
+        if not self.quoted:
+            cut = buf.find(b"\n", pos)
+            self._scan = len(buf) if cut == -1 else cut + 1
+            return cut + 1
+        odd = self._odd
+        if self._scan < pos:
+            odd ^= buf.count(b'"', self._scan, pos) % 2 == 1
+        # skaczemy od cudzysłowu do cudzysłowu (find w C), nie od linii do linii
+        while True:
+            if odd:
+                q = buf.find(b'"', pos)
+                if q == -1:
+                    self._odd, self._scan = True, len(buf)
+                    return 0
+                odd, pos = False, q + 1
+                continue
+            nl = buf.find(b"\n", pos)
+            if nl == -1:
+                self._odd, self._scan = buf.count(b'"', pos) % 2 == 1, len(buf)
+                return 0
+            q = buf.find(b'"', pos, nl)
+            if q == -1:
+                self._odd, self._scan = False, nl + 1
+                return nl + 1
+            odd, pos = True, q + 1
+
+    def _take(self, n: int) -> bytes:
+        with memoryview(self._buf) as mv:
+            out = bytes(mv[:n])
+        del self._buf[:n]
+        # cięcie tylko przy parzystej liczbie `"` — parzystość reszty bez zmian
+        self._scan = max(0, self._scan - n)
+        if not self._buf:
+            self._odd = False
+        return out
@@ -0,0 +1,88 @@
+# services/common/workers.py
+"""
+Tryb wieloprocesowy usług (`python -m services.serve <usługa> --workers N`).
+
+Launcher ustawia w środowisku workerów:
+- `PROMETHEUS_MULTIPROC_DIR` — wspólny katalog metryk prometheus_client (pliki mmap per PID);
+  `/metrics` dowolnego workera zwraca wtedy sumę ze wszystkich (`metrics_payload()`),
+- `LOGOPS_WORKER_DIR` — katalog, w którym workery zajmują sloty 0..N-1 (`flock` na pliku);
+  numer slotu jest stabilny między restartami workera (nowy proces przejmuje zwolniony slot),
+  więc nadaje się do nazw plików per worker (sink NDJSON, katalog spoola) bez przeplotu zapisów.
+
+Bez launchera (zwykły `uvicorn ...`) nic się nie zmienia: slot = None, rejestr domyślny.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+
+__all__ = ["MULTIPROC_DIR", "WORKER_DIR", "metrics_payload", "worker_slot", "worker_suffix"]
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+WORKER_DIR = os.getenv("LOGOPS_WORKER_DIR", "")
+
+_LIVE_GAUGE_FILE = re.compile(r"gauge_live\w+?_(\d+)\.db$")
+
+_slot: int | None = None
+_slot_fh = None  # trzymany do końca procesu — zamknięcie zwalnia flock
+
+
+def worker_slot() -> int | None:
+    """Numer slotu tego workera (0..N-1) albo None poza trybem wieloprocesowym."""
+    global _slot, _slot_fh
+    if _slot is not None or not WORKER_DIR:
+        return _slot
+    import fcntl
+
+    slots = Path(WORKER_DIR) / "slots"
+    slots.mkdir(parents=True, exist_ok=True)
+    k = 0
+    while True:
+        fh = open(slots / f"{k}.lock", "a+b")  # trzymany przez cały proces
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            k += 1
+            continue
+        _slot, _slot_fh = k, fh
+        return _slot
+
+
+def worker_suffix() -> str:
+    """Sufiks nazw plików per worker: "" (jeden proces) albo "-w<slot>"."""
+    slot = worker_slot()
+    return "" if slot is None else f"-w{slot}"
+
+
+def _reap_dead_gauges() -> None:
+    # gauge "live*" martwych workerów (restart) nie mogą zawyżać sumy
+    from prometheus_client import multiprocess
+
+    for p in Path(MULTIPROC_DIR).glob("gauge_live*.db"):
+        m = _LIVE_GAUGE_FILE.search(p.name)
+        if not m:
+            continue
+        pid = int(m.group(1))
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+        except OSError:
+            pass
+
+
+def metrics_payload() -> bytes:
+    """Ekspozycja /metrics: rejestr procesu albo agregat wszystkich workerów."""
+    if not MULTIPROC_DIR:
+        return generate_latest(REGISTRY)
+    from prometheus_client import multiprocess
+
+    _reap_dead_gauges()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+    return generate_latest(registry)
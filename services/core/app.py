@@ -1,12 +1,12 @@
 # services/core/app.py
 from __future__ import annotations
 
-import json
+import asyncio
+import contextlib
 import logging
 import os
 import time
 from collections import Counter, deque
-from datetime import UTC, datetime
 from typing import Any
 
 from fastapi import FastAPI, HTTPException, Request, Response
@@ -15,9 +15,21 @@ from prometheus_client import (
     Counter as PcCounter,
     Gauge,
     Histogram,
-    generate_latest,
 )
 
+from services.common import codec
+from services.common.colbatch import COLUMNAR_ACK_HEADER, ColumnarBatchStream, is_columnar
+from services.common.compression import (
+    DecompressError,
+    UnsupportedEncoding,
+    content_encoding,
+    decompress_stream,
+)
+from services.common.jsonstream import JsonArrayStream, StreamDecodeError, StreamLimitError
+from services.common.workers import metrics_payload, worker_suffix
+
+from .sink import DailyNdjsonSink
+
 logger = logging.getLogger("core.app")
 
 app = FastAPI(title="LogOps Core")
@@ -38,13 +50,21 @@ CORE_SINK_FILE = _env_bool("CORE_SINK_FILE", False)
 # Priorytet: LOGOPS_SINK_DIR (S13) -> CORE_SINK_DIR -> ./data/ingest
 CORE_SINK_DIR = os.getenv("LOGOPS_SINK_DIR", os.getenv("CORE_SINK_DIR", "./data/ingest"))
 
+# bufor zapisu i interwał flush+fsync dla dziennego pliku NDJSON
+CORE_SINK_BUFFER_BYTES = int(os.getenv("CORE_SINK_BUFFER_BYTES", "1048576"))
+CORE_SINK_FSYNC_MS = int(os.getenv("CORE_SINK_FSYNC_MS", "1000"))
+
 CORE_DEBUG_SAMPLE = _env_bool("CORE_DEBUG_SAMPLE", False)
 CORE_DEBUG_SAMPLE_SIZE = int(os.getenv("CORE_DEBUG_SAMPLE_SIZE", "10"))
 CORE_RING_SIZE = int(os.getenv("CORE_RING_SIZE", "200"))
 
 _RING = deque(maxlen=max(1, CORE_RING_SIZE))
 
-CORE_INFLIGHT = Gauge("core_inflight", "Number of in-flight core requests.")
+CORE_INFLIGHT = Gauge(
+    "core_inflight",
+    "Number of in-flight core requests.",
+    multiprocess_mode="livesum",  # suma po workerach (services/serve.py)
+)
 
 CORE_REQ_LAT = Histogram(
     "core_request_latency_seconds",
@@ -98,45 +118,109 @@ def _ensure_core_labels(records: list[dict[str, Any]]) -> list[dict[str, Any]]:
     return out
 
 
-def _parse_payload(raw: bytes) -> list[dict[str, Any]]:
+async def _read_payload(request: Request) -> list[dict[str, Any]]:
+    """
+    Body czytane i dekodowane kawałkami (JsonArrayStream) — bez materializacji całego body.
+    Content-Encoding (gzip/deflate/zstd) dekompresowany w locie (services/common/compression.py).
+    `application/x-logops-columnar` (batch z IngestGW, services/common/colbatch.py) — ramki
+    kolumnowe dekodowane tak samo kawałkami; każdy inny Content-Type → JSON jak dotąd.
+    Limity CORE_MAX_BODY_BYTES (po dekompresji) / CORE_MAX_ITEMS przerywają odczyt od razu.
+    """
+    content_length = request.headers.get("content-length") or ""
+    if content_length.isdigit() and int(content_length) > CORE_MAX_BODY_BYTES:
+        raise StreamLimitError("too_large", CORE_MAX_BODY_BYTES)
     try:
-        payload: Any = json.loads(raw.decode("utf-8"))
-    except Exception as err:
-        raise HTTPException(status_code=400, detail="bad json") from err
+        encoding = content_encoding(request.headers)
+    except UnsupportedEncoding as err:
+        raise HTTPException(
+            status_code=415, detail=f"unsupported content-encoding: {err}"
+        ) from None
+
+    parser: JsonArrayStream | ColumnarBatchStream
+    columnar = is_columnar(request.headers.get("content-type") or "")
+    # 400 na ramkę kolumnową z tym nagłówkiem = Core zna format (IngestGW nie spada na JSON)
+    ack = {COLUMNAR_ACK_HEADER: "1"} if columnar else None
+    if columnar:
+        parser = ColumnarBatchStream(max_items=CORE_MAX_ITEMS, max_bytes=CORE_MAX_BODY_BYTES)
+    else:
+        parser = JsonArrayStream(max_items=CORE_MAX_ITEMS, max_bytes=CORE_MAX_BODY_BYTES)
+    items: list[dict[str, Any]] = []
+    bad = 0
+    try:
+        async for chunk_items in parser.aiter(decompress_stream(request.stream(), encoding)):
+            for itm in chunk_items:
+                if isinstance(itm, dict):
+                    items.append(itm)
+                else:
+                    bad += 1
+    except StreamDecodeError as err:
+        detail = "bad columnar batch" if columnar else "bad json"
+        raise HTTPException(status_code=400, detail=detail, headers=ack) from err
+    except DecompressError as err:
+        raise HTTPException(status_code=400, detail="bad compressed body", headers=ack) from err
+    finally:
+        try:
+            CORE_BYTES.inc(parser.bytes_seen)
+        except Exception:
+            pass
+
+    if bad and not items:
+        if not parser.is_array:
+            raise HTTPException(status_code=400, detail="bad json")
+        raise HTTPException(status_code=422, detail="invalid items in array")
+    return items
+
+
+_SINK: DailyNdjsonSink | None = None
+_SINK_SYNC_TASK: asyncio.Task[None] | None = None
 
-    if isinstance(payload, list):
-        items = []
-        bad = 0
-        for itm in payload:
-            if isinstance(itm, dict):
-                items.append(itm)
-            else:
-                bad += 1
-        if bad and not items:
-            raise HTTPException(status_code=422, detail="invalid items in array")
-        return items
 
-    if isinstance(payload, dict):
-        return [payload]
+def _sink() -> DailyNdjsonSink:
+    global _SINK
+    if _SINK is None:
+        _SINK = DailyNdjsonSink(
+            CORE_SINK_DIR,
+            buffer_bytes=CORE_SINK_BUFFER_BYTES,
+            fsync_interval_ms=CORE_SINK_FSYNC_MS,
+            name_suffix=worker_suffix(),
+        )
+    return _SINK
 
-    raise HTTPException(status_code=400, detail="bad json")
+
+@app.on_event("startup")
+async def _start_sink() -> None:
+    global _SINK_SYNC_TASK
+    if CORE_SINK_FILE:
+        _SINK_SYNC_TASK = asyncio.get_running_loop().create_task(_sink().run_sync_loop())
+
+
+@app.on_event("shutdown")
+async def _stop_sink() -> None:
+    global _SINK_SYNC_TASK
+    if _SINK_SYNC_TASK is not None:
+        _SINK_SYNC_TASK.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _SINK_SYNC_TASK
+        _SINK_SYNC_TASK = None
+    if _SINK is not None:
+        _SINK.close()
 
 
 def _write_ndjson(records: list[dict[str, Any]], *, emitter: str, scenario_id: str) -> None:
     if not (CORE_SINK_FILE and records):
         return
     try:
-        os.makedirs(CORE_SINK_DIR, exist_ok=True)
-        day = datetime.now(UTC).strftime("%Y%m%d")
-        path = os.path.join(CORE_SINK_DIR, f"{day}.ndjson")
-        with open(path, "a", encoding="utf-8") as fh:
-            for item in records:
-                row = dict(item)
-                row.setdefault("app", "logops")
-                row.setdefault("source", "core")
-                row.setdefault("emitter", emitter or "unknown")
-                row.setdefault("scenario_id", scenario_id or "na")
-                fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+        dumps = codec.dumps
+        lines: list[bytes] = []
+        for item in records:
+            row = dict(item)
+            row.setdefault("app", "logops")
+            row.setdefault("source", "core")
+            row.setdefault("emitter", emitter or "unknown")
+            row.setdefault("scenario_id", scenario_id or "na")
+            lines.append(dumps(row))
+        lines.append(b"")
+        _sink().write(b"\n".join(lines))
     except Exception:
         logger.exception("core sink write failed")
 
@@ -155,7 +239,7 @@ def healthz():
 
 @app.get("/metrics")
 def metrics():
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/_debug/hdrs")
@@ -169,6 +253,8 @@ async def debug_hdrs(request: Request):
             "CORE_MAX_ITEMS": CORE_MAX_ITEMS,
             "CORE_SINK_FILE": CORE_SINK_FILE,
             "CORE_SINK_DIR": CORE_SINK_DIR,
+            "CORE_SINK_BUFFER_BYTES": CORE_SINK_BUFFER_BYTES,
+            "CORE_SINK_FSYNC_MS": CORE_SINK_FSYNC_MS,
             "CORE_RING_SIZE": CORE_RING_SIZE,
         },
     }
@@ -195,27 +281,23 @@ async def v1_logs(request: Request):
     emitter, scenario_id = _labels_from_headers(request)
 
     try:
-        raw = await request.body()
-    except Exception as err:
+        records = await _read_payload(request)
+    except StreamLimitError as err:
+        CORE_REJECTED.labels(err.reason).inc()
         _observe(emitter, scenario_id, start_t)
-        raise HTTPException(status_code=400, detail="cannot read body") from err
-
-    try:
-        CORE_BYTES.inc(len(raw))
-    except Exception:
-        pass
-
-    if len(raw) > CORE_MAX_BODY_BYTES:
-        CORE_REJECTED.labels("too_large").inc()
+        detail = "payload too large" if err.reason == "too_large" else "too many items"
+        raise HTTPException(status_code=413, detail=detail) from None
+    except HTTPException:
         _observe(emitter, scenario_id, start_t)
-        raise HTTPException(status_code=413, detail="payload too large")
-
-    records = _parse_payload(raw)
-
-    if len(records) > CORE_MAX_ITEMS:
-        CORE_REJECTED.labels("too_many_items").inc()
+        raise
+    except Exception as err:
         _observe(emitter, scenario_id, start_t)
-        raise HTTPException(status_code=413, detail="too many items")
+        ack = (
+            {COLUMNAR_ACK_HEADER: "1"}
+            if is_columnar(request.headers.get("content-type") or "")
+            else None
+        )
+        raise HTTPException(status_code=400, detail="cannot read body", headers=ack) from err
 
     records = _ensure_core_labels(records)
 
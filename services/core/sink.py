@@ -0,0 +1,110 @@
+# services/core/sink.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+
+logger = logging.getLogger("core.sink")
+
+
+def _next_utc_midnight(now: float) -> float:
+    d = datetime.fromtimestamp(now, UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (d + timedelta(days=1)).timestamp()
+
+
+class DailyNdjsonSink:
+    """
+    Dzienny plik NDJSON z trwałym uchwytem:
+    - plik `YYYYMMDD<name_suffix>.ndjson` otwierany raz i trzymany do północy UTC (potem
+      rollover); sufiks per worker (np. "-w1") — każdy proces pisze do własnego pliku,
+    - zapisy idą do bufora (`buffer_bytes`), flush + fsync co `fsync_interval_ms`
+      (pętla `run_sync_loop` w tle) oraz przy zamknięciu,
+    - współdzielony między żądaniami/wątkami (lock tylko na czas dopisania do bufora).
+    """
+
+    def __init__(
+        self,
+        sink_dir: str,
+        *,
+        buffer_bytes: int = 1 << 20,
+        fsync_interval_ms: int = 1000,
+        name_suffix: str = "",
+    ):
+        self.sink_dir = sink_dir
+        self.buffer_bytes = max(4096, int(buffer_bytes))
+        self.fsync_interval_s = max(1, int(fsync_interval_ms)) / 1000.0
+        self.name_suffix = name_suffix
+        self._lock = threading.Lock()
+        self._fh = None
+        self._roll_at = 0.0
+        self._dirty = False
+
+    @property
+    def path(self) -> str | None:
+        return getattr(self._fh, "name", None)
+
+    def _filename(self, now: float) -> str:
+        day = datetime.fromtimestamp(now, UTC).strftime("%Y%m%d")
+        return f"{day}{self.name_suffix}.ndjson"
+
+    def _rollover(self, now: float) -> None:
+        # wołane pod lockiem
+        if self._fh is not None:
+            try:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+            finally:
+                self._fh.close()
+        os.makedirs(self.sink_dir, exist_ok=True)
+        path = os.path.join(self.sink_dir, self._filename(now))
+        self._fh = open(path, "ab", buffering=self.buffer_bytes)
+        self._roll_at = _next_utc_midnight(now)
+
+    def write(self, data: bytes) -> None:
+        """Dopisuje gotowe linie NDJSON (jeden write do bufora)."""
+        if not data:
+            return
+        with self._lock:
+            now = time.time()
+            if self._fh is None or now >= self._roll_at:
+                self._rollover(now)
+            self._fh.write(data)
+            self._dirty = True
+
+    def sync(self) -> None:
+        """flush bufora pod lockiem, fsync już poza nim (na zduplikowanym fd)."""
+        with self._lock:
+            if self._fh is None or not self._dirty:
+                return
+            self._fh.flush()
+            self._dirty = False
+            fd = os.dup(self._fh.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is None:
+                return
+            try:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+            finally:
+                self._fh.close()
+                self._fh = None
+                self._dirty = False
+
+    async def run_sync_loop(self) -> None:
+        """Okresowy flush + fsync (poza event loopem)."""
+        while True:
+            await asyncio.sleep(self.fsync_interval_s)
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception:
+                logger.exception("core sink sync failed")
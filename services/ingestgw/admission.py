@@ -0,0 +1,206 @@
+# services/ingestgw/admission.py
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+
+from .metrics import (
+    ADMISSION_INFLIGHT_RECORDS,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_SHED_TOTAL,
+    ADMISSION_WAIT,
+)
+
+
+class AdmissionRejected(Exception):
+    """Budżet wyczerpany: status (429 | 503) i sugerowany Retry-After w sekundach."""
+
+    def __init__(self, status: int, reason: str, retry_after_s: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class Ticket:
+    """Rezerwacja budżetu dla jednego żądania; `resize` po poznaniu liczby rekordów."""
+
+    __slots__ = ("_ctl", "records")
+
+    def __init__(self, ctl: AdmissionController, records: int):
+        self._ctl = ctl
+        self.records = records
+
+    async def resize(self, records: int) -> None:
+        """
+        Korekta do faktycznej liczby rekordów: zmniejszenie od razu, dopłata czeka w kolejce
+        jak `acquire` (po terminie AdmissionRejected — rezerwacja zostaje, zwalnia ją `release`).
+        """
+        records = max(1, records)
+        delta = records - self.records
+        if delta > 0:
+            await self._ctl._reserve(delta, held=self.records)
+        elif delta < 0:
+            self._ctl._adjust(delta)
+        self.records = records
+
+    def release(self) -> None:
+        if self.records:
+            self._ctl._adjust(-self.records)
+            self.records = 0
+
+
+class AdmissionController:
+    """
+    Budżet rekordów w locie (parsowanie → normalizacja → forward) zamiast liczby żądań:
+    - żądanie rezerwuje szacunek: Content-Length (dla skompresowanego × średni współczynnik
+      dekompresji) / średni rozmiar rekordu po dekompresji; bez Content-Length — średnia liczba
+      rekordów takich żądań; po parsowaniu rezerwacja jest korygowana do faktycznej liczby
+      rekordów (dopłata też czeka na miejsce — budżet nie jest przekraczany),
+    - brak miejsca → kolejka FIFO z terminem `queue_timeout_ms`; po terminie 503,
+      przy pełnej kolejce (`max_queue` żądań) od razu 429 — oba z Retry-After,
+    - żądanie większe niż cały budżet wchodzi (i rośnie) samo, gdy nic innego nie jest w locie.
+    """
+
+    def __init__(
+        self,
+        max_records: int,
+        *,
+        queue_timeout_ms: int = 250,
+        max_queue: int = 1000,
+        bytes_per_record: int = 256,
+        retry_after_s: int = 1,
+    ):
+        self.max_records = max(1, int(max_records))
+        self.queue_timeout_s = max(0, int(queue_timeout_ms)) / 1000.0
+        self.max_queue = max(0, int(max_queue))
+        self.retry_after_s = max(1, int(retry_after_s))
+        self._bpr = float(max(1, bytes_per_record))  # EWMA bajtów (po dekompresji) na rekord
+        self._ratio = 4.0  # EWMA bajtów po dekompresji / bajtów na drucie (skompresowane body)
+        self._unsized = 1.0  # EWMA rekordów w żądaniu bez Content-Length (chunked)
+        self._inflight = 0
+        # (rekordy, future, już trzymane przez to żądanie — > 0 tylko przy dopłacie w resize)
+        self._waiters: deque[tuple[int, asyncio.Future[None], int]] = deque()
+        self._growers: deque[tuple[int, asyncio.Future[None], int]] = deque()
+        self._grow_held = 0  # rekordy trzymane przez żądania czekające na dopłatę
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def estimate(self, content_length: int | None, *, compressed: bool = False) -> int:
+        if content_length is None:
+            return max(1, round(self._unsized))
+        body_bytes = content_length * self._ratio if compressed else content_length
+        return max(1, math.ceil(body_bytes / self._bpr))
+
+    def observe(
+        self,
+        body_bytes: int,
+        records: int,
+        *,
+        wire_bytes: int | None = None,
+        compressed: bool = False,
+    ) -> None:
+        """
+        Uczy szacunek (EWMA): rozmiar rekordu z bajtów body po dekompresji, współczynnik
+        dekompresji z `wire_bytes` (Content-Length) skompresowanych body, liczbę rekordów
+        żądań bez Content-Length.
+        """
+        if body_bytes > 0 and records > 0:
+            self._bpr += 0.1 * (body_bytes / records - self._bpr)
+        if wire_bytes is None:
+            if records > 0:
+                self._unsized += 0.1 * (records - self._unsized)
+        elif compressed and wire_bytes > 0 and body_bytes > 0:
+            self._ratio += 0.1 * (body_bytes / wire_bytes - self._ratio)
+
+    async def acquire(self, records: int) -> Ticket:
+        records = max(1, records)
+        await self._reserve(records)
+        return Ticket(self, records)
+
+    async def _reserve(self, records: int, *, held: int = 0) -> None:
+        # held > 0: dopłata żądania, które już trzyma `held` rekordów (Ticket.resize) — osobna
+        # kolejka z pierwszeństwem przed nowymi żądaniami
+        t0 = time.perf_counter()
+        queue = self._growers if held else self._waiters
+        if not self._growers and (held or not self._waiters) and self._fits(records, held):
+            self._adjust(records)
+            ADMISSION_WAIT.observe(0.0)
+            return
+
+        if not held and len(self._waiters) >= self.max_queue:
+            ADMISSION_SHED_TOTAL.labels("queue_full").inc()
+            raise AdmissionRejected(429, "queue_full", self.retry_after_s)
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        entry = (records, fut, held)
+        queue.append(entry)
+        self._grow_held += held
+        self._wake()  # np. wszyscy w locie czekają na dopłatę — ktoś musi ruszyć
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout_s)
+        except TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # zdążyliśmy dostać miejsce tuż przed terminem — oddajemy je
+                self._adjust(-records)
+            else:
+                self._remove(entry)
+            ADMISSION_WAIT.observe(time.perf_counter() - t0)
+            ADMISSION_SHED_TOTAL.labels("timeout").inc()
+            raise AdmissionRejected(503, "timeout", self.retry_after_s) from None
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self._adjust(-records)
+            else:
+                self._remove(entry)
+            raise
+        ADMISSION_WAIT.observe(time.perf_counter() - t0)
+
+    # --- wnętrze ---
+
+    def _fits(self, records: int, held: int = 0) -> bool:
+        # held: rekordy trzymane już przez to samo żądanie ("samo w locie" = inflight == held)
+        return self._inflight <= held or self._inflight + records <= self.max_records
+
+    def _remove(self, entry: tuple[int, asyncio.Future[None], int]) -> None:
+        queue = self._growers if entry[2] else self._waiters
+        try:
+            queue.remove(entry)
+            self._grow_held -= entry[2]
+        except ValueError:
+            pass
+        entry[1].cancel()
+        self._wake()
+
+    def _adjust(self, delta: int) -> None:
+        self._inflight = max(0, self._inflight + delta)
+        ADMISSION_INFLIGHT_RECORDS.set(self._inflight)
+        if delta < 0:
+            self._wake()
+
+    def _wake(self) -> None:
+        # najpierw dopłaty (FIFO); gdy cały budżet w locie należy do czekających na dopłatę,
+        # nikt go nie zwolni — wpuszczamy pierwszą ponad limit (jak żądanie "samo w locie")
+        growers = self._growers
+        while growers and (
+            self._fits(growers[0][0], growers[0][2]) or self._inflight <= self._grow_held
+        ):
+            records, fut, held = growers.popleft()
+            self._grow_held -= held
+            if fut.done():
+                continue
+            self._inflight += records
+            fut.set_result(None)
+        # nowe żądania FIFO, dopóki się mieszczą (i nikt nie czeka na dopłatę)
+        while not growers and self._waiters and self._fits(self._waiters[0][0]):
+            records, fut, _ = self._waiters.popleft()
+            if fut.done():
+                continue
+            self._inflight += records
+            fut.set_result(None)
+        ADMISSION_INFLIGHT_RECORDS.set(self._inflight)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters) + len(growers))
@@ -1,38 +1,85 @@
 ﻿from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import os
 import time
-from collections import Counter
-from datetime import UTC, datetime
-from json import JSONDecodeError
+from collections.abc import AsyncIterator
 from typing import Any
 
 import httpx
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from services.common import codec
+from services.common.colbatch import (
+    COLUMNAR_ACK_HEADER,
+    COLUMNAR_CONTENT_TYPE,
+    decode_batch,
+    encode_batch,
+)
+from services.common.compression import (
+    DecompressError,
+    UnsupportedEncoding,
+    content_encoding,
+    decompress_stream,
+)
+from services.common.jsonstream import JsonArrayStream, StreamDecodeError, StreamLimitError
+from services.common.workers import metrics_payload, worker_slot, worker_suffix
 
+from .admission import AdmissionController, AdmissionRejected, Ticket
+from .coalesce import CoreBatcher
 from .metrics import (
     ACCEPTED_TOTAL,
+    ADMISSION_BYTES_PER_RECORD,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_RECORDS,
+    ADMISSION_QUEUE_TIMEOUT_MS,
+    ADMISSION_RETRY_AFTER_S,
     BATCH_LATENCY,
     BATCH_SIZE,
-    DEBUG_SAMPLE,
-    DEBUG_SAMPLE_SIZE,
+    COALESCE_ENABLED,
+    COALESCE_LINGER_MS,
+    COALESCE_MAX_BYTES,
+    COALESCE_MAX_RECORDS,
+    COMPRESSED_BODIES_TOTAL,
+    CORE_FORWARD_BYTES_TOTAL,
+    CORE_POOL_CONNECTIONS,
+    CORE_POOL_TIMEOUTS_TOTAL,
+    CORE_POOL_WAITING,
+    CORE_POOL_WAITS_TOTAL,
+    INGEST_MAX_BODY_BYTES,
+    INGEST_MAX_ITEMS,
     INGESTED_TOTAL,
+    INVALID_TS_TOTAL,
     METRIC_INFLIGHT,
     MISSING_LEVEL_TOTAL,
     MISSING_TS_TOTAL,
+    OFFLOAD_CHUNK_BYTES,
+    OFFLOAD_MIN_BYTES,
+    OFFLOAD_WORKERS,
     PARSE_ERRORS,
+    SINK_BLOCK_MS,
     SINK_DIR_PATH,
     SINK_FILE,
+    SINK_FLUSH_MS,
+    SINK_FLUSH_RECORDS,
+    SINK_QUEUE_MAX,
+    SPOOL_DIR,
+    SPOOL_ENABLED,
+    SPOOL_FSYNC,
+    SPOOL_MAX_ATTEMPTS,
+    SPOOL_MAX_BYTES,
+    SPOOL_REPLAY_RPS,
+    SPOOL_SEGMENT_BYTES,
 )
 
-# normalizacja pojedynczego rekordu
-from .normalize import normalize_record
-from .parsers import parse_csv_text_body, parse_syslog_line
+# normalizacja batcha (jeden przebieg)
+from .normalize import BatchStats, normalize_batch
+from .offload import TextParseOffload
+from .sink import NdjsonSink
+from .spool import CoreSpool
 
 logger = logging.getLogger("ingestgw.app")
 
@@ -40,39 +87,234 @@ app = FastAPI(title="LogOps Ingest Gateway")
 
 # URL Core (forward); nadpisz envem CORE_URL
 CORE_URL = os.getenv("CORE_URL", "http://127.0.0.1:8095/v1/logs")
+# sonda żywotności Core (spool: czy wpis jest "zatruty", czy Core po prostu leży)
+CORE_HEALTH_URL = os.getenv("CORE_HEALTH_URL") or str(
+    httpx.URL(CORE_URL).copy_with(path="/healthz")
+)
 
+# Pula połączeń do Core: jeden klient na cały czas życia aplikacji (keep-alive)
+CORE_POOL_MAX_CONNECTIONS = int(os.getenv("INGEST_CORE_MAX_CONNECTIONS", "100"))
+CORE_POOL_MAX_KEEPALIVE = int(os.getenv("INGEST_CORE_MAX_KEEPALIVE", "20"))
+CORE_POOL_KEEPALIVE_EXPIRY_S = float(os.getenv("INGEST_CORE_KEEPALIVE_EXPIRY_S", "30"))
 
-def enforce_labels(
-    records: list[dict[str, Any]],
-    *,
-    emitter: str,
-    scenario_id: str,
-    app: str = "logops",
-    source: str = "ingest",
-) -> list[dict[str, Any]]:
+# Format batcha do Core: "columnar" (services/common/colbatch.py; Core bez obsługi → JSON) | "json"
+CORE_WIRE_FORMAT = os.getenv("INGEST_CORE_FORMAT", "columnar").strip().lower()
+_CORE_COLUMNAR = CORE_WIRE_FORMAT == "columnar"
+
+_CORE_CLIENT: httpx.AsyncClient | None = None
+
+
+def _core_client() -> httpx.AsyncClient:
+    """Współdzielony klient do Core; tworzony na starcie (lub leniwie, jeśli startup nie ruszył)."""
+    global _CORE_CLIENT
+    if _CORE_CLIENT is None or _CORE_CLIENT.is_closed:
+        _CORE_CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=CORE_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=CORE_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=CORE_POOL_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+    return _CORE_CLIENT
+
+
+def _pool_stats(client: httpx.AsyncClient) -> tuple[int, int, int]:
     """
-    Nagłówek ma pierwszeństwo: nadpisujemy pola emitter/scenario_id.
-    Doklejamy też app/source.
+    (idle, active, waiting) dla puli httpcore pod klientem.
+    Czytamy wnętrzności httpx/httpcore — przy zmianie API zwracamy zera zamiast wybuchać.
     """
-    out: list[dict[str, Any]] = []
-    for n in records:
-        if not isinstance(n, dict):
-            continue
-        n["app"] = app
-        n["source"] = source
-        if emitter:
-            n["emitter"] = emitter
-        if scenario_id:
-            n["scenario_id"] = scenario_id
-        out.append(n)
-    return out
+    try:
+        pool = client._transport._pool  # type: ignore[attr-defined]
+        conns = list(pool.connections)
+        idle = sum(1 for c in conns if c.is_idle())
+        waiting = sum(1 for r in pool._requests if r.is_queued())
+        return idle, len(conns) - idle, waiting
+    except Exception:
+        return 0, 0, 0
+
+
+def _refresh_pool_metrics() -> None:
+    if _CORE_CLIENT is None or _CORE_CLIENT.is_closed:
+        idle, active, waiting = 0, 0, 0
+    else:
+        idle, active, waiting = _pool_stats(_CORE_CLIENT)
+    CORE_POOL_CONNECTIONS.labels("idle").set(idle)
+    CORE_POOL_CONNECTIONS.labels("active").set(active)
+    CORE_POOL_WAITING.set(waiting)
+
+
+_SINK: NdjsonSink | None = None
+
+
+def _sink() -> NdjsonSink:
+    """Writer NDJSON w tle; katalog: LOGOPS_SINK_DIR (kompatybilność ze smoke) → SINK_DIR_PATH."""
+    global _SINK
+    if _SINK is None:
+        _SINK = NdjsonSink(
+            os.getenv("LOGOPS_SINK_DIR", SINK_DIR_PATH or "./data/ingest"),
+            max_queue=SINK_QUEUE_MAX,
+            flush_interval_ms=SINK_FLUSH_MS,
+            flush_records=SINK_FLUSH_RECORDS,
+            block_ms=SINK_BLOCK_MS,
+            name_suffix=worker_suffix(),
+        )
+    return _SINK
+
+
+_ADMISSION: AdmissionController | None = None
+
+
+def _admission() -> AdmissionController:
+    global _ADMISSION
+    if _ADMISSION is None:
+        _ADMISSION = AdmissionController(
+            ADMISSION_MAX_RECORDS,
+            queue_timeout_ms=ADMISSION_QUEUE_TIMEOUT_MS,
+            max_queue=ADMISSION_MAX_QUEUE,
+            bytes_per_record=ADMISSION_BYTES_PER_RECORD,
+            retry_after_s=ADMISSION_RETRY_AFTER_S,
+        )
+    return _ADMISSION
+
+
+def _content_length(request: Request) -> int | None:
+    v = request.headers.get("content-length") or ""
+    return int(v) if v.isascii() and v.isdigit() and len(v) <= 18 else None
+
+
+def _is_compressed(request: Request) -> bool:
+    return (request.headers.get("content-encoding") or "").strip().lower() not in ("", "identity")
+
+
+def _overloaded(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status,
+        detail={"error": "overloaded", "reason": e.reason},
+        headers={"Retry-After": str(e.retry_after_s)},
+    )
+
+
+async def _admit(request: Request) -> Ticket | None:
+    """Rezerwacja budżetu rekordów w locie; brak miejsca → 429/503 z Retry-After."""
+    if ADMISSION_MAX_RECORDS <= 0:
+        return None
+    ctl = _admission()
+    estimate = ctl.estimate(_content_length(request), compressed=_is_compressed(request))
+    try:
+        return await ctl.acquire(estimate)
+    except AdmissionRejected as e:
+        raise _overloaded(e) from None
+
+
+async def _readmit(request: Request, ticket: Ticket, records: int) -> None:
+    """Po parsowaniu: nauka szacunku (bajty po dekompresji) i korekta rezerwacji."""
+    _admission().observe(
+        getattr(request.state, "body_bytes", 0),
+        records,
+        wire_bytes=_content_length(request),
+        compressed=_is_compressed(request),
+    )
+    try:
+        await ticket.resize(records)
+    except AdmissionRejected as e:
+        raise _overloaded(e) from None
+
+
+_SPOOL: CoreSpool | None = None
+
+
+def _spool() -> CoreSpool:
+    """
+    Spool na dysku dla batchy, których Core nie przyjął (INGEST_SPOOL=true).
+    W trybie wieloprocesowym worker ze slotem k > 0 używa podkatalogu `w<k>` (slot 0 = katalog
+    główny, jak przy jednym procesie) — segmenty i checkpoint nie są współdzielone.
+    """
+    global _SPOOL
+    if _SPOOL is None:
+        slot = worker_slot()
+        _SPOOL = CoreSpool(
+            os.path.join(SPOOL_DIR, f"w{slot}") if slot else SPOOL_DIR,
+            segment_bytes=SPOOL_SEGMENT_BYTES,
+            max_bytes=SPOOL_MAX_BYTES,
+            replay_rps=SPOOL_REPLAY_RPS,
+            fsync=SPOOL_FSYNC,
+            max_attempts=SPOOL_MAX_ATTEMPTS,
+            probe=_core_alive,
+        )
+    return _SPOOL
+
+
+async def _core_alive() -> bool:
+    try:
+        resp = await _core_client().get(CORE_HEALTH_URL, timeout=2.0)
+    except Exception:
+        return False
+    return resp.status_code == 200
+
+
+_BATCHER: CoreBatcher | None = None
+
+
+def _batcher() -> CoreBatcher:
+    """Łączenie żądań w większe batche do Core (INGEST_COALESCE=true)."""
+    global _BATCHER
+    if _BATCHER is None:
+        _BATCHER = CoreBatcher(
+            _deliver,
+            max_records=COALESCE_MAX_RECORDS,
+            max_bytes=COALESCE_MAX_BYTES,
+            linger_ms=COALESCE_LINGER_MS,
+        )
+    return _BATCHER
+
+
+_OFFLOAD: TextParseOffload | None = None
+
+
+def _offload() -> TextParseOffload:
+    """Pula parsowania dużych body text/plain i text/csv (INGEST_PARSE_WORKERS; 0 = inline)."""
+    global _OFFLOAD
+    if _OFFLOAD is None:
+        _OFFLOAD = TextParseOffload(
+            workers=OFFLOAD_WORKERS,
+            min_bytes=OFFLOAD_MIN_BYTES,
+            chunk_bytes=OFFLOAD_CHUNK_BYTES,
+        )
+    return _OFFLOAD
+
+
+@app.on_event("startup")
+async def _open_core_client() -> None:
+    _core_client()
+    if SINK_FILE:
+        _sink().start()
+    if SPOOL_ENABLED:
+        _spool().start(_forward_to_core)
+    _offload().start()
+
+
+@app.on_event("shutdown")
+async def _close_core_client() -> None:
+    global _CORE_CLIENT
+    if _SINK is not None:
+        await _SINK.stop()
+    if _BATCHER is not None:
+        await _BATCHER.aclose()
+    if _SPOOL is not None:
+        await _SPOOL.stop()
+    if _OFFLOAD is not None:
+        _OFFLOAD.shutdown()
+    if _CORE_CLIENT is not None:
+        await _CORE_CLIENT.aclose()
+        _CORE_CLIENT = None
 
 
 # ── mały helper HTTP z retry (headers wspierane) ─────────────────────────────
 async def _post_with_retry(
     url: str,
     *,
-    json_payload: Any,
+    json_payload: Any = None,
+    content: bytes | None = None,
     headers: dict[str, str] | None = None,
     attempts: int = 3,
     base_delay_ms: int = 100,
@@ -82,30 +324,226 @@ async def _post_with_retry(
     write_s: float = 5.0,
     pool_s: float = 2.0,
 ) -> httpx.Response:
+    # body kodujemy raz (szybki codec) i wysyłamy te same bajty przy każdej próbie
+    if content is None:
+        content = codec.dumps(json_payload)
     delay = base_delay_ms / 1000.0
     max_delay = max_delay_ms / 1000.0
     last_exc: Exception | None = None
 
     timeout = httpx.Timeout(connect=connect_s, read=read_s, write=write_s, pool=pool_s)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        for attempt in range(1, max(1, attempts) + 1):
-            try:
-                return await client.post(url, json=json_payload, headers=headers)
-            except Exception as e:
-                last_exc = e
-                if attempt >= attempts:
-                    break
-                await asyncio.sleep(delay)
-                delay = min(delay * 2, max_delay)
+    client = _core_client()
+    for attempt in range(1, max(1, attempts) + 1):
+        idle, active, _ = _pool_stats(client)
+        if not idle and active >= CORE_POOL_MAX_CONNECTIONS:
+            CORE_POOL_WAITS_TOTAL.inc()
+        try:
+            return await client.post(url, content=content, headers=headers, timeout=timeout)
+        except Exception as e:
+            if isinstance(e, httpx.PoolTimeout):
+                CORE_POOL_TIMEOUTS_TOTAL.inc()
+            last_exc = e
+            if attempt >= attempts:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
 
     raise RuntimeError(
         f"downstream_error: {last_exc!r}" if last_exc else "downstream_error: unknown"
     )
 
 
+def _encode_for_core(records: list[dict[str, Any]]) -> tuple[bytes, str]:
+    """Rekordy → (body, Content-Type): ramka kolumnowa albo tablica JSON (fallback)."""
+    if _CORE_COLUMNAR:
+        try:
+            body = encode_batch(records)
+        except Exception:
+            # błąd kodera nie może kończyć się 500 — ten sam batch idzie jako JSON
+            logger.exception("columnar encoding failed, sending JSON")
+            body = None
+        if body is not None:
+            return body, COLUMNAR_CONTENT_TYPE
+    return codec.dumps(records), "application/json"
+
+
+async def _forward_to_core(body: bytes, headers: dict[str, str], count: int = 0) -> tuple[int, Any]:
+    """
+    POST gotowego batcha do Core → (status, treść odpowiedzi). Core, który nie zna formatu
+    kolumnowego (415, a starszy — 400 bez nagłówka COLUMNAR_ACK_HEADER, bo czytał ramkę jako
+    JSON), dostaje ten sam batch jako JSON, a kolejne batche tego procesu idą już w JSON (także
+    te ze spoola). 400 z nagłówkiem = Core odrzucił ramkę — zwracamy jak jest.
+    """
+    global _CORE_COLUMNAR
+    fmt = "columnar" if headers.get("Content-Type") == COLUMNAR_CONTENT_TYPE else "json"
+    resp = await _post_core(body, headers, fmt)
+    if fmt == "columnar" and (
+        resp.status_code == 415
+        or (resp.status_code == 400 and COLUMNAR_ACK_HEADER not in resp.headers)
+    ):
+        try:
+            records = decode_batch(body)
+        except StreamDecodeError:
+            logger.error("columnar batch cannot be decoded for JSON fallback")
+            return 502, {"error": "bad columnar batch"}
+        if _CORE_COLUMNAR:
+            _CORE_COLUMNAR = False
+            logger.warning(
+                "core does not accept columnar batches (%d) — falling back to JSON",
+                resp.status_code,
+            )
+        body = codec.dumps(records)
+        headers = {**headers, "Content-Type": "application/json"}
+        resp = await _post_core(body, headers, "json")
+    try:
+        content = codec.loads(resp.content)
+    except Exception:
+        content = {"downstream_text": resp.text}
+    return resp.status_code, content
+
+
+async def _post_core(body: bytes, headers: dict[str, str], fmt: str) -> httpx.Response:
+    try:
+        CORE_FORWARD_BYTES_TOTAL.labels(fmt).inc(len(body))
+    except Exception:
+        pass
+    return await _post_with_retry(
+        CORE_URL,
+        content=body,
+        headers=headers,
+        attempts=3,
+        base_delay_ms=100,
+        max_delay_ms=1500,
+        connect_s=2.0,
+        read_s=5.0,
+        write_s=5.0,
+        pool_s=2.0,
+    )
+
+
+async def _deliver(body: bytes, headers: dict[str, str], count: int) -> tuple[int, Any]:
+    """
+    Forward do Core; przy INGEST_SPOOL batch, którego Core nie przyjął (błąd sieci / 5xx),
+    trafia do spoola i żądanie dostaje 202. Dopóki Core leży albo spool ma zaległości, nie
+    próbujemy wcale — dopisujemy od razu (bez czekania na retry; nowy batch nie wyprzedza
+    starszych ze spoola).
+    """
+    if not SPOOL_ENABLED:
+        return await _forward_to_core(body, headers, count)
+
+    spool = _spool()
+    spooled = 202, {"accepted": count, "spooled": True}
+    if spool.spooling:
+        if await spool.append(body, headers, count):
+            return spooled
+        raise RuntimeError("downstream_error: core down or spool backlog, spool full")
+
+    try:
+        status, content = await _forward_to_core(body, headers, count)
+    except RuntimeError:
+        if await spool.append(body, headers, count):
+            return spooled
+        raise
+    if status >= 500 and await spool.append(body, headers, count):
+        return spooled
+    return status, content
+
+
 @app.get("/metrics")
 def metrics():
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    _refresh_pool_metrics()
+    if _SPOOL is not None:
+        _SPOOL.refresh_metrics()
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+
+def _body_stream(request: Request) -> AsyncIterator[bytes]:
+    """
+    Body z sieci po dekompresji wg Content-Encoding (compression.py; nieznane → 415);
+    liczba bajtów po dekompresji → request.state.body_bytes (szacunek admission control).
+    """
+    try:
+        encoding = content_encoding(request.headers)
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=f"unsupported content-encoding: {e}") from None
+    if encoding:
+        try:
+            COMPRESSED_BODIES_TOTAL.labels(encoding).inc()
+        except Exception:
+            pass
+    return _count_bytes(request, decompress_stream(request.stream(), encoding))
+
+
+async def _count_bytes(request: Request, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    request.state.body_bytes = 0
+    async for chunk in chunks:
+        request.state.body_bytes += len(chunk)
+        yield chunk
+
+
+async def _normalize_json_stream(
+    request: Request, emitter_name: str, scenario_id: str
+) -> tuple[list[dict[str, Any]], BatchStats]:
+    """
+    Body JSON czytane kawałkami (JsonArrayStream) → normalize_batch per kawałek.
+    Limity INGEST_MAX_BODY_BYTES / INGEST_MAX_ITEMS przerywają odczyt od razu (413).
+    """
+    content_length = request.headers.get("content-length") or ""
+    if INGEST_MAX_BODY_BYTES and content_length.isdigit():
+        if int(content_length) > INGEST_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="payload too large")
+
+    parser = JsonArrayStream(max_items=INGEST_MAX_ITEMS, max_bytes=INGEST_MAX_BODY_BYTES)
+    stats = BatchStats()
+    normalized: list[dict[str, Any]] = []
+    seen = 0
+    try:
+        async for items in parser.aiter(_body_stream(request)):
+            part, _ = normalize_batch(
+                items,
+                emitter=emitter_name,
+                scenario_id=scenario_id,
+                stats=stats,
+                index_base=seen,
+            )
+            normalized.extend(part)
+            seen += len(items)
+    except StreamLimitError as e:
+        detail = "payload too large" if e.reason == "too_large" else "too many items"
+        raise HTTPException(status_code=413, detail=detail) from None
+    except StreamDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body") from None
+    except DecompressError:
+        raise HTTPException(status_code=400, detail="Invalid compressed body") from None
+
+    if not parser.is_array and not normalized:
+        raise HTTPException(
+            status_code=400,
+            detail="Payload must be object or array of objects",
+        )
+    return normalized, stats
+
+
+async def _normalize_text_stream(
+    request: Request, kind: str, emitter_name: str, scenario_id: str
+) -> tuple[list[dict[str, Any]], BatchStats]:
+    """
+    Body text/plain / text/csv czytane kawałkami (TextLineStream) — bez kopii całego body
+    w pamięci; kawałki pełnych linii parsowane w trakcie odczytu. Limit INGEST_MAX_BODY_BYTES → 413.
+    """
+    content_length = request.headers.get("content-length") or ""
+    if INGEST_MAX_BODY_BYTES and content_length.isdigit():
+        if int(content_length) > INGEST_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="payload too large")
+    try:
+        return await _offload().parse_stream(
+            kind, _body_stream(request), emitter_name, scenario_id, max_bytes=INGEST_MAX_BODY_BYTES
+        )
+    except StreamLimitError as e:
+        detail = "line too large" if e.reason == "line_too_large" else "payload too large"
+        raise HTTPException(status_code=413, detail=detail) from None
+    except DecompressError:
+        raise HTTPException(status_code=400, detail="Invalid compressed body") from None
 
 
 @app.post("/v1/logs")
@@ -117,6 +555,7 @@ async def ingest_logs(request: Request):
         pass
 
     t0 = time.perf_counter()
+    ticket: Ticket | None = None
     try:
         content_type = (request.headers.get("content-type") or "").lower()
         emitter_name = (request.headers.get("x-emitter") or "").strip() or "unknown"
@@ -127,127 +566,63 @@ async def ingest_logs(request: Request):
             or "na"
         )
 
-        # 1) Body -> records
-        if content_type.startswith("text/plain"):
-            text = (await request.body()).decode("utf-8", errors="replace")
-            records: list[dict[str, Any]] = [
-                parse_syslog_line(ln) for ln in text.splitlines() if ln.strip()
-            ]
-        elif content_type.startswith("text/csv"):
-            text = (await request.body()).decode("utf-8", errors="replace")
-            records = parse_csv_text_body(text)
+        # 0) Admission control — budżet rekordów w locie (szacunek z Content-Length,
+        #    korekta do faktycznej liczby po parsowaniu)
+        ticket = await _admit(request)
+
+        # 1) Body -> records, 2) normalizacja + etykiety z nagłówków + rozkład leveli.
+        #    Rekordy pochodzą z naszego parsowania body, więc mutujemy je w miejscu.
+        if content_type.startswith(("text/plain", "text/csv")):
+            # syslog / CSV: body czytane strumieniowo, kawałki linii parsowane w puli (offload.py)
+            kind = "csv" if content_type.startswith("text/csv") else "syslog"
+            normalized, stats = await _normalize_text_stream(
+                request, kind, emitter_name, scenario_id
+            )
         else:
+            # JSON: parsowanie strumieniowe — każdy kawałek body od razu trafia do normalizacji
+            normalized, stats = await _normalize_json_stream(request, emitter_name, scenario_id)
+        level_counts = stats.levels
+        if ticket is not None:
+            await _readmit(request, ticket, len(normalized) + stats.invalid)
+
+        # prosta walidacja bez Pydantic (elementy nie-dict w JSON array)
+        if stats.invalid:
             try:
-                payload: Any = await request.json()
-            except JSONDecodeError:
-                raise HTTPException(status_code=400, detail="Invalid JSON body") from None
-
-            if isinstance(payload, list):
-                records = payload
-            elif isinstance(payload, dict):
-                records = [payload]
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Payload must be object or array of objects",
-                )
-
-            # prosta walidacja bez Pydantic
-            invalid_idx: list[int] = []
-            validated: list[dict[str, Any]] = []
-            for i, item in enumerate(records):
-                if isinstance(item, dict):
-                    validated.append(item)
-                else:
-                    invalid_idx.append(i)
-
-            if invalid_idx:
-                try:
-                    # DOKLEJ scenariusz do licznika błędów parsowania
-                    PARSE_ERRORS.labels(emitter=emitter_name, scenario_id=scenario_id).inc(
-                        len(invalid_idx)
-                    )  # type: ignore[name-defined]
-                except Exception:
-                    pass
-                if not validated:
-                    raise HTTPException(
-                        status_code=422,
-                        detail={
-                            "error": "Invalid records in JSON array",
-                            "invalid_indices": invalid_idx[:50],
-                            "count": len(invalid_idx),
-                        },
-                    )
-            records = validated
-
-        # 2) Normalizacja
-        counters = Counter()
-        sample: list[dict[str, Any]] = []
-        normalized: list[dict[str, Any]] = []
-
-        for rec in records:
-            norm = normalize_record(rec if isinstance(rec, dict) else {})
-            normalized.append(norm)
-            if norm.get("_missing_ts"):
-                counters["missing_ts"] += 1
-            if norm.get("_missing_level"):
-                counters["missing_level"] += 1
-            try:
-                if DEBUG_SAMPLE and len(sample) < DEBUG_SAMPLE_SIZE:  # type: ignore[name-defined]
-                    sample.append({k: v for k, v in norm.items() if not k.startswith("_")})
+                # DOKLEJ scenariusz do licznika błędów parsowania
+                PARSE_ERRORS.labels(emitter=emitter_name, scenario_id=scenario_id).inc(
+                    stats.invalid
+                )  # type: ignore[name-defined]
             except Exception:
                 pass
-
-        # 3) Wymuszenie etykiet z nagłówków (nagłówek ma pierwszeństwo)
-        normalized = enforce_labels(
-            normalized,
-            emitter=emitter_name,
-            scenario_id=scenario_id,
-            app="logops",
-            source="ingest",
-        )
-
-        # 4) Rozkład leveli
-        level_counts = Counter()
-        for n in normalized:
-            lvl = (n.get("level") or "UNKNOWN").upper().strip()
-            level_counts[lvl] += 1
+            if not normalized:
+                raise HTTPException(
+                    status_code=422,
+                    detail={
+                        "error": "Invalid records in JSON array",
+                        "invalid_indices": stats.invalid_idx,
+                        "count": stats.invalid,
+                    },
+                )
 
         logger.info(
-            "[ingest] emitter=%s scenario_id=%s accepted=%d missing_ts=%d missing_level=%d enc=%s",
+            "[ingest] emitter=%s scenario_id=%s accepted=%d missing_ts=%d invalid_ts=%d "
+            "missing_level=%d enc=%s",
             emitter_name,
             scenario_id,
             len(normalized),
-            counters["missing_ts"],
-            counters["missing_level"],
+            stats.missing_ts,
+            stats.invalid_ts,
+            stats.missing_level,
             bool(globals().get("ENCRYPT_PII", False)),
         )
 
-        # 5) Zapis NDJSON (Promtail) — kontrolowany flagą
-        try:
-            sink_enabled = bool(SINK_FILE)  # default z metrics.py
-            # pozwól nadpisać katalog przez env (kompatybilność ze smoke)
-            sink_dir_path = os.getenv("LOGOPS_SINK_DIR", SINK_DIR_PATH or "./data/ingest")
-
-            if sink_enabled and normalized:
-                from pathlib import Path
-
-                sink_dir = Path(sink_dir_path)
-                sink_dir.mkdir(parents=True, exist_ok=True)
-                day = datetime.now(UTC).strftime("%Y%m%d")
-                out_file = sink_dir / f"{day}.ndjson"
-                with out_file.open("a", encoding="utf-8") as fh:
-                    for n in normalized:
-                        fh.write(
-                            json.dumps(
-                                {k: v for k, v in n.items() if not k.startswith("_")},
-                                ensure_ascii=False,
-                            )
-                            + "\n"
-                        )
-        except Exception:
-            # celowo łykamy — nie blokuje ingestu
-            pass
+        # 5) Zapis NDJSON (Promtail) — kontrolowany flagą; zapis robi writer w tle (sink.py)
+        if SINK_FILE and normalized:
+            try:
+                await _sink().submit(normalized)
+            except Exception:
+                # celowo łykamy — nie blokuje ingestu
+                pass
 
         # 6) Metryki Prometheus
         try:
@@ -263,45 +638,43 @@ async def ingest_logs(request: Request):
                 INGESTED_TOTAL.labels(emitter=emitter_name, level=lvl).inc(  # type: ignore[name-defined]
                     cnt
                 )
-            if counters["missing_ts"]:
+            if stats.missing_ts:
                 MISSING_TS_TOTAL.labels(emitter_name, scenario_id).inc(  # type: ignore[name-defined]
-                    counters["missing_ts"]
+                    stats.missing_ts
                 )
-            if counters["missing_level"]:
+            if stats.invalid_ts:
+                INVALID_TS_TOTAL.labels(emitter_name, scenario_id).inc(  # type: ignore[name-defined]
+                    stats.invalid_ts
+                )
+            if stats.missing_level:
                 MISSING_LEVEL_TOTAL.labels(emitter_name, scenario_id).inc(  # type: ignore[name-defined]
-                    counters["missing_level"]
+                    stats.missing_level
                 )
         except Exception:
             pass
 
-        # 7) Forward do Core (8095) – przekazujemy nagłówki transportowe
+        # 7) Forward do Core (8095) – przekazujemy nagłówki transportowe; batch w formacie
+        #    kolumnowym (etykiety raz na batch) albo JSON
+        body, core_type = _encode_for_core(normalized)
         core_headers = {
-            "Content-Type": "application/json",
+            "Content-Type": core_type,
             "X-Emitter": emitter_name,
             "X-Scenario-Id": scenario_id,
         }
         try:
-            resp = await _post_with_retry(
-                CORE_URL,
-                json_payload=normalized,
-                headers=core_headers,
-                attempts=3,
-                base_delay_ms=100,
-                max_delay_ms=1500,
-                connect_s=2.0,
-                read_s=5.0,
-                write_s=5.0,
-                pool_s=2.0,
-            )
-            try:
-                content = resp.json()
-            except Exception:
-                content = {"downstream_text": resp.text}
-            return JSONResponse(content, status_code=resp.status_code)
+            if COALESCE_ENABLED:
+                status, content = await _batcher().submit(
+                    (emitter_name, scenario_id, core_type), body, len(normalized), core_headers
+                )
+            else:
+                status, content = await _deliver(body, core_headers, len(normalized))
+            return JSONResponse(content, status_code=status)
         except RuntimeError as e:
             raise HTTPException(status_code=502, detail=str(e)) from e
 
     finally:
+        if ticket is not None:
+            ticket.release()
         try:
             METRIC_INFLIGHT.dec()  # type: ignore[name-defined]
         except Exception:
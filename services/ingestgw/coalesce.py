@@ -0,0 +1,145 @@
+# services/ingestgw/coalesce.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from services.common.colbatch import COLUMNAR_CONTENT_TYPE
+
+from .metrics import COALESCE_BATCH_RECORDS, COALESCE_BATCH_REQUESTS, COALESCE_FLUSH_TOTAL
+
+logger = logging.getLogger("ingestgw.coalesce")
+
+# send(body, headers, count) -> (status_code, content) — forward jednego (scalonego) batcha do Core
+SendFn = Callable[[bytes, dict[str, str], int], Awaitable[tuple[int, Any]]]
+
+
+class _Batch:
+    __slots__ = ("headers", "columnar", "parts", "waiters", "records", "nbytes", "timer")
+
+    def __init__(self, headers: dict[str, str]):
+        self.headers = headers
+        # ramki kolumnowe sklejamy wprost; tablice JSON — elementy między "[" i "]"
+        self.columnar = headers.get("Content-Type") == COLUMNAR_CONTENT_TYPE
+        self.parts: list[bytes] = []
+        self.waiters: list[tuple[asyncio.Future[tuple[int, Any]], int]] = []
+        self.records = 0
+        self.nbytes = 0 if self.columnar else 2  # "[" + "]"
+        self.timer: asyncio.TimerHandle | None = None
+
+    def body(self) -> bytes:
+        if self.columnar:
+            return b"".join(self.parts)
+        return b"[" + b",".join(self.parts) + b"]"
+
+
+class CoreBatcher:
+    """
+    Łączy rekordy z równoległych żądań w większe batche do Core:
+    - osobny bufor na (emitter, scenario_id) — Core etykietuje metryki nagłówkami żądania,
+    - flush po `max_records` / `max_bytes` albo po `linger_ms` od pierwszego rekordu w buforze,
+    - body żądań są już zakodowanymi batchami (tablice JSON albo ramki kolumnowe; format jest
+      częścią klucza bufora) — sklejamy je bez ponownej serializacji,
+    - każdy wołający dostaje własny wynik: {"accepted": <jego liczba rekordów>} albo
+      status/treść błędu z Core (wyjątek forwardu trafia do wszystkich czekających).
+    """
+
+    def __init__(
+        self,
+        send: SendFn,
+        *,
+        max_records: int = 1000,
+        max_bytes: int = 512 * 1024,
+        linger_ms: int = 10,
+    ):
+        self._send = send
+        self.max_records = max(1, int(max_records))
+        self.max_bytes = max(1024, int(max_bytes))
+        self.linger_s = max(0, int(linger_ms)) / 1000.0
+        self._open: dict[tuple[str, ...], _Batch] = {}
+        self._inflight: set[asyncio.Task[None]] = set()
+
+    async def submit(
+        self, key: tuple[str, ...], body: bytes, count: int, headers: dict[str, str]
+    ) -> tuple[int, Any]:
+        """
+        body = batch z `count` rekordami (tablica JSON albo ramka kolumnowa wg Content-Type
+        w `headers`). Zwraca (status, content) dla tego żądania.
+        Żądanie większe niż limity batcha idzie do Core samo (bez czekania).
+        """
+        if count >= self.max_records or len(body) + 2 >= self.max_bytes:
+            COALESCE_FLUSH_TOTAL.labels("oversize").inc()
+            COALESCE_BATCH_RECORDS.observe(count)
+            COALESCE_BATCH_REQUESTS.observe(1)
+            return await self._send(body, headers, count)
+
+        batch = self._open.get(key)
+        columnar = headers.get("Content-Type") == COLUMNAR_CONTENT_TYPE
+        inner = body if columnar else body[1:-1]  # "[a,b]" → "a,b"
+        sep = 0 if columnar else 1
+        if batch is not None and (
+            batch.records + count > self.max_records
+            or batch.nbytes + len(inner) + sep > self.max_bytes
+        ):
+            self._flush(key, "records" if batch.records + count > self.max_records else "bytes")
+            batch = None
+        if batch is None:
+            batch = _Batch(headers)
+            self._open[key] = batch
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.linger_s, self._flush, key, "linger"
+            )
+
+        fut: asyncio.Future[tuple[int, Any]] = asyncio.get_running_loop().create_future()
+        if inner:
+            batch.parts.append(inner)
+            batch.nbytes += len(inner) + sep
+        batch.waiters.append((fut, count))
+        batch.records += count
+        if batch.records >= self.max_records:
+            self._flush(key, "records")
+        return await fut
+
+    async def aclose(self) -> None:
+        """Wysyła wszystko, co czeka w buforach, i czeka na forwardy w locie."""
+        for key in list(self._open):
+            self._flush(key, "shutdown")
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    # --- wnętrze ---
+
+    def _flush(self, key: tuple[str, ...], reason: str) -> None:
+        batch = self._open.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        COALESCE_FLUSH_TOTAL.labels(reason).inc()
+        task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send_batch(self, batch: _Batch) -> None:
+        COALESCE_BATCH_RECORDS.observe(batch.records)
+        COALESCE_BATCH_REQUESTS.observe(len(batch.waiters))
+        body = batch.body()
+        try:
+            status, content = await self._send(body, batch.headers, batch.records)
+        except Exception as e:
+            for fut, _ in batch.waiters:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        accepted = content.get("accepted") if isinstance(content, dict) else None
+        split = 200 <= status < 300 and accepted == batch.records
+        if 200 <= status < 300 and not split:
+            # Core nie przyjął całości — nie wiemy czyje rekordy odpadły, oddajemy wynik batcha
+            logger.warning("core accepted %r of %d coalesced records", accepted, batch.records)
+        for fut, count in batch.waiters:
+            if fut.done():  # wołający się rozłączył
+                continue
+            fut.set_result((status, {**content, "accepted": count} if split else content))
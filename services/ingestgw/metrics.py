@@ -1,9 +1,15 @@
+import os
+
 from prometheus_client import Counter, Gauge, Histogram
 
+# Tryb wieloprocesowy (services/serve.py): gauge'e sumowane po żywych workerach ("livesum"),
+# liczniki i histogramy prometheus_client sumuje sam.
+
 # inflight – liczba równoległych żądań
 METRIC_INFLIGHT = Gauge(
     "logops_inflight",
     "Number of in-flight ingest requests.",
+    multiprocess_mode="livesum",
 )
 
 # wielkość batcha
@@ -41,6 +47,11 @@ MISSING_TS_TOTAL = Counter(
     "Records missing timestamp.",
     labelnames=("emitter", "scenario_id"),
 )
+INVALID_TS_TOTAL = Counter(
+    "logops_invalid_ts_total",
+    "Records with an unparseable timestamp (replaced with ingest time).",
+    labelnames=("emitter", "scenario_id"),
+)
 MISSING_LEVEL_TOTAL = Counter(
     "logops_missing_level_total",
     "Records missing level.",
@@ -54,6 +65,140 @@ PARSE_ERRORS = Counter(
     labelnames=("emitter", "scenario_id"),
 )
 
+# pula połączeń IngestGW → Core (odświeżane przy każdym scrape /metrics)
+CORE_POOL_CONNECTIONS = Gauge(
+    "logops_core_pool_connections",
+    "Connections in the IngestGW -> Core pool by state.",
+    labelnames=("state",),
+    multiprocess_mode="livesum",
+)
+CORE_POOL_WAITING = Gauge(
+    "logops_core_pool_waiting",
+    "Requests queued for a free IngestGW -> Core connection.",
+    multiprocess_mode="livesum",
+)
+CORE_POOL_WAITS_TOTAL = Counter(
+    "logops_core_pool_waits_total",
+    "Forwards that found the Core pool saturated (had to wait for a connection).",
+)
+CORE_POOL_TIMEOUTS_TOTAL = Counter(
+    "logops_core_pool_timeouts_total",
+    "Forwards that timed out waiting for a Core pool connection.",
+)
+# format batcha do Core (columnar | json) — bajty body wysłane przy forwardzie
+CORE_FORWARD_BYTES_TOTAL = Counter(
+    "logops_core_forward_bytes_total",
+    "Body bytes sent to Core, by wire format.",
+    labelnames=("format",),
+)
+
+# writer NDJSON w tle (sink.py)
+SINK_QUEUE_DEPTH = Gauge(
+    "logops_sink_queue_depth",
+    "Records waiting in the NDJSON sink queue.",
+    multiprocess_mode="livesum",
+)
+SINK_FLUSH_LATENCY = Histogram(
+    "logops_sink_flush_seconds",
+    "NDJSON sink flush latency (serialize + single write).",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float("inf")),
+)
+SINK_DROPPED_TOTAL = Counter(
+    "logops_sink_dropped_total",
+    "Records dropped by the NDJSON sink.",
+    labelnames=("reason",),
+)
+
+# łączenie batchy przed forwardem do Core (coalesce.py)
+COALESCE_BATCH_RECORDS = Histogram(
+    "logops_core_forward_batch_records",
+    "Records per POST forwarded to Core (after coalescing).",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2000, 5000, float("inf")),
+)
+COALESCE_BATCH_REQUESTS = Histogram(
+    "logops_core_forward_batch_requests",
+    "Ingest requests merged into one POST to Core.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, float("inf")),
+)
+COALESCE_FLUSH_TOTAL = Counter(
+    "logops_coalesce_flush_total",
+    "Coalesced Core batches flushed, by trigger.",
+    labelnames=("reason",),
+)
+
+# spool (write-ahead) na czas niedostępności Core (spool.py)
+SPOOL_BYTES = Gauge(
+    "logops_spool_bytes",
+    "Bytes waiting in the Core spool.",
+    multiprocess_mode="livesum",
+)
+SPOOL_OLDEST_AGE = Gauge(
+    "logops_spool_oldest_age_seconds",
+    "Age of the oldest batch waiting in the Core spool.",
+    multiprocess_mode="livemax",
+)
+SPOOL_APPENDED_TOTAL = Counter(
+    "logops_spool_appended_records_total",
+    "Records written to the Core spool after a failed forward.",
+)
+SPOOL_REPLAYED_TOTAL = Counter(
+    "logops_spool_replayed_records_total",
+    "Records replayed from the spool to Core.",
+)
+SPOOL_DROPPED_TOTAL = Counter(
+    "logops_spool_dropped_records_total",
+    "Records the spool could not keep (full), Core rejected on replay (4xx) or that were "
+    "dead-lettered after repeated failures.",
+    labelnames=("reason",),
+)
+
+# admission control /v1/logs (admission.py) — budżet rekordów w locie
+ADMISSION_INFLIGHT_RECORDS = Gauge(
+    "logops_admission_inflight_records",
+    "Records currently admitted (parse -> normalize -> forward).",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "logops_admission_queue_depth",
+    "Requests waiting for in-flight record budget.",
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT = Histogram(
+    "logops_admission_wait_seconds",
+    "Time a request waited for in-flight record budget.",
+    buckets=(0.0, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float("inf")),
+)
+ADMISSION_SHED_TOTAL = Counter(
+    "logops_admission_shed_total",
+    "Requests rejected by admission control.",
+    labelnames=("reason",),
+)
+
+# body skompresowane (Content-Encoding; dekompresja w services/common/compression.py)
+COMPRESSED_BODIES_TOTAL = Counter(
+    "logops_compressed_bodies_total",
+    "Request bodies received with Content-Encoding (decompressed before parsing).",
+    labelnames=("encoding",),
+)
+
+# parsowanie body text/plain | text/csv w puli (offload.py)
+OFFLOAD_BODIES_TOTAL = Counter(
+    "logops_offload_bodies_total",
+    "Text bodies parsed in the offload pool (above size threshold).",
+    labelnames=("kind",),
+)
+OFFLOAD_TASK_SECONDS = Histogram(
+    "logops_offload_task_seconds",
+    "CPU time of one offloaded parse+normalize task (body chunk).",
+    labelnames=("kind",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, float("inf")),
+)
+OFFLOAD_INFLIGHT_TASKS = Gauge(
+    "logops_offload_inflight_tasks",
+    "Offloaded parse tasks submitted and not yet finished.",
+    multiprocess_mode="livesum",
+)
+
 # flaga/sample do odpowiedzi debug
 DEBUG_SAMPLE = True
 DEBUG_SAMPLE_SIZE = 10
@@ -63,4 +208,42 @@ DEBUG_SAMPLE_SIZE = 10
 SINK_FILE = True
 # Domyślny katalog (może być nadpisany przez env LOGOPS_SINK_DIR)
 SINK_DIR_PATH = "./data/ingest"
+# Writer w tle (sink.py): limit kolejki w rekordach, flush co N ms albo co M rekordów,
+# ile ms producent może czekać na miejsce w kolejce zanim rekordy zostaną porzucone.
+SINK_QUEUE_MAX = int(os.getenv("LOGOPS_SINK_QUEUE_MAX", "50000"))
+SINK_FLUSH_MS = int(os.getenv("LOGOPS_SINK_FLUSH_MS", "200"))
+SINK_FLUSH_RECORDS = int(os.getenv("LOGOPS_SINK_FLUSH_RECORDS", "2000"))
+SINK_BLOCK_MS = int(os.getenv("LOGOPS_SINK_BLOCK_MS", "50"))
+# Limity body JSON (parser strumieniowy przerywa od razu po przekroczeniu; 0 = bez limitu).
+# Domyślnie wyłączone (jak przed parserem strumieniowym); INGEST_MAX_ITEMS=$CORE_MAX_ITEMS
+# odrzuca za duży batch już na wejściu, zamiast dopiero przy forwardzie do Core.
+INGEST_MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", "0"))
+INGEST_MAX_ITEMS = int(os.getenv("INGEST_MAX_ITEMS", "0"))
+# Łączenie żądań w większe batche do Core (opcjonalne): limity rekordów/bajtów i maks. czekanie.
+# Limity trzymaj poniżej CORE_MAX_ITEMS / CORE_MAX_BODY_BYTES.
+COALESCE_ENABLED = os.getenv("INGEST_COALESCE", "false").lower() in ("1", "true", "yes", "on")
+COALESCE_MAX_RECORDS = int(os.getenv("INGEST_COALESCE_MAX_RECORDS", "1000"))
+COALESCE_MAX_BYTES = int(os.getenv("INGEST_COALESCE_MAX_BYTES", "524288"))
+COALESCE_LINGER_MS = int(os.getenv("INGEST_COALESCE_LINGER_MS", "10"))
+# Spool na awarię Core: batche, których nie udało się oddać, lądują na dysku i są odtwarzane w tle.
+SPOOL_ENABLED = os.getenv("INGEST_SPOOL", "false").lower() in ("1", "true", "yes", "on")
+SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "./data/spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", str(16 << 20)))
+SPOOL_MAX_BYTES = int(os.getenv("INGEST_SPOOL_MAX_BYTES", str(1 << 30)))
+SPOOL_REPLAY_RPS = int(os.getenv("INGEST_SPOOL_REPLAY_RPS", "5000"))
+SPOOL_FSYNC = os.getenv("INGEST_SPOOL_FSYNC", "true").lower() in ("1", "true", "yes", "on")
+SPOOL_MAX_ATTEMPTS = int(os.getenv("INGEST_SPOOL_MAX_ATTEMPTS", "20"))
+# Admission control: maks. rekordów w locie (0 = wyłączone), jak długo żądanie może czekać w kolejce,
+# ile żądań może czekać, startowy szacunek bajtów na rekord (do Content-Length) i Retry-After.
+ADMISSION_MAX_RECORDS = int(os.getenv("INGEST_MAX_INFLIGHT_RECORDS", "50000"))
+ADMISSION_QUEUE_TIMEOUT_MS = int(os.getenv("INGEST_ADMISSION_QUEUE_MS", "250"))
+ADMISSION_MAX_QUEUE = int(os.getenv("INGEST_ADMISSION_MAX_QUEUE", "1000"))
+ADMISSION_BYTES_PER_RECORD = int(os.getenv("INGEST_ADMISSION_BYTES_PER_RECORD", "256"))
+ADMISSION_RETRY_AFTER_S = int(os.getenv("INGEST_ADMISSION_RETRY_AFTER_S", "1"))
+# Offload parsowania text/plain i text/csv: rozmiar puli (0 = zawsze inline — domyślnie, pula
+# to dodatkowe procesy na każdy worker), od ilu bajtów body idzie do puli i na jakie kawałki
+# jest cięte (0 = jak próg).
+OFFLOAD_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "0"))
+OFFLOAD_MIN_BYTES = int(os.getenv("INGEST_PARSE_OFFLOAD_BYTES", "262144"))
+OFFLOAD_CHUNK_BYTES = int(os.getenv("INGEST_PARSE_CHUNK_BYTES", "0"))
 ENCRYPT_PII = False
@@ -1,26 +1,171 @@
 # services/ingestgw/normalize.py
 from __future__ import annotations
 
+import math
+import os
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import UTC, datetime
 from typing import Any
 
+from .timeparse import canonical_ts
+
+# ── aliasy pól ────────────────────────────────────────────────────────────────
+# Emitery wysyłają m.in. message/log/text, lvl/severity, timestamp/time.
+# Tabela kompilowana raz (import) do mapy alias → pole kanoniczne.
+DEFAULT_FIELD_ALIASES: dict[str, tuple[str, ...]] = {
+    "ts": ("timestamp", "time", "@timestamp", "datetime"),
+    "level": ("lvl", "severity", "loglevel", "log_level"),
+    "msg": ("message", "log", "text"),
+}
+
+
+def parse_alias_spec(spec: str) -> dict[str, tuple[str, ...]]:
+    """
+    "ts=timestamp,time;level=lvl,severity" → {"ts": ("timestamp", "time"), ...}.
+    Podane pole kanoniczne zastępuje domyślną listę aliasów tego pola.
+    """
+    out: dict[str, tuple[str, ...]] = {}
+    for part in (spec or "").split(";"):
+        canon, sep, names = part.partition("=")
+        canon = canon.strip()
+        if not (sep and canon):
+            continue
+        out[canon] = tuple(n.strip() for n in names.split(",") if n.strip())
+    return out
+
+
+def compile_aliases(table: dict[str, tuple[str, ...]]) -> dict[str, str]:
+    """alias → pole kanoniczne (pierwszy wpis wygrywa; alias == kanoniczne jest pomijany)."""
+    lookup: dict[str, str] = {}
+    for canon, aliases in table.items():
+        for a in aliases:
+            if a != canon and a not in table:
+                lookup.setdefault(a, canon)
+    return lookup
+
+
+def _alias_groups(lookup: dict[str, str]) -> tuple[tuple[str, tuple[str, ...]], ...]:
+    # kolejność aliasów = kolejność priorytetu przy sondowaniu rekordu
+    groups: dict[str, list[str]] = {}
+    for alias, canon in lookup.items():
+        groups.setdefault(canon, []).append(alias)
+    return tuple((c, tuple(a)) for c, a in groups.items())
+
+
+FIELD_ALIASES: dict[str, tuple[str, ...]] = {
+    **DEFAULT_FIELD_ALIASES,
+    **parse_alias_spec(os.getenv("LOGOPS_FIELD_ALIASES", "")),
+}
+ALIAS_MAP: dict[str, str] = compile_aliases(FIELD_ALIASES)
+_ALIAS_GROUPS = _alias_groups(ALIAS_MAP)
+
+
+def resolve_aliases(n: dict[str, Any]) -> None:
+    """Przenosi pierwszy obecny alias do pola kanonicznego, jeśli kanoniczne puste (w miejscu)."""
+    for canon, aliases in _ALIAS_GROUPS:
+        if n.get(canon) not in (None, ""):
+            continue
+        for a in aliases:
+            if a in n:
+                n[canon] = n.pop(a)
+                break
+
+
+# ── poziomy ───────────────────────────────────────────────────────────────────
+LEVELS = ("TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL")
+
+_LEVEL_WORDS: dict[str, str] = {
+    "trace": "TRACE",
+    "debug": "DEBUG",
+    "info": "INFO",
+    "information": "INFO",
+    "notice": "INFO",
+    "warn": "WARN",
+    "warning": "WARN",
+    "error": "ERROR",
+    "err": "ERROR",
+    "fatal": "FATAL",
+    "critical": "FATAL",
+    "crit": "FATAL",
+    "alert": "FATAL",
+    "emerg": "FATAL",
+    "emergency": "FATAL",
+    "panic": "FATAL",
+}
+# szybka ścieżka: dokładne stringi w typowych wariantach wielkości liter
+_LEVEL_CACHE: dict[str, str] = {}
+for _w, _lvl in _LEVEL_WORDS.items():
+    for _v in (_w, _w.upper(), _w.capitalize()):
+        _LEVEL_CACHE[_v] = _lvl
+
+# syslog severity 0..7 (RFC 5424)
+_SYSLOG_SEVERITY = ("FATAL", "FATAL", "FATAL", "ERROR", "WARN", "INFO", "INFO", "DEBUG")
+
+
+def _level_from_number(v: int) -> str:
+    """0..7 → syslog severity; ≥ 8 → progi Pythonowego logging (10/20/30/40/50)."""
+    if 0 <= v < len(_SYSLOG_SEVERITY):
+        return _SYSLOG_SEVERITY[v]
+    if v >= 50:
+        return "FATAL"
+    if v >= 40:
+        return "ERROR"
+    if v >= 30:
+        return "WARN"
+    if v >= 20:
+        return "INFO"
+    if v >= 10:
+        return "DEBUG"
+    return "TRACE"
+
+
+def canonical_level(value: Any) -> str | None:
+    """
+    Poziom → wartość z LEVELS (nieznane słowa: UPPER jak dotąd); None = brak/nieużywalny.
+    Liczby: syslog severity / logging; bool: True → ERROR, False → INFO.
+    """
+    if isinstance(value, str):
+        hit = _LEVEL_CACHE.get(value)
+        if hit is not None:
+            return hit
+        s = value.strip()
+        if not s:
+            return None
+        hit = _LEVEL_WORDS.get(s.lower())
+        if hit is not None:
+            return hit
+        # tylko cyfry ASCII ("²".isdigit() → True, a int("²") rzuca) i bez gigantów dla int()
+        if s.isascii() and s.isdigit() and len(s) <= 18:
+            return _level_from_number(int(s))
+        return s.upper()
+    if isinstance(value, bool):
+        return "ERROR" if value else "INFO"
+    if isinstance(value, int):
+        return _level_from_number(value)
+    if isinstance(value, float):
+        # NaN/Infinity z fallbacku JSON → brak poziomu (int() rzuciłby ValueError/OverflowError)
+        return _level_from_number(int(value)) if math.isfinite(value) else None
+    return None
+
 
 def normalize_record(rec: dict[str, Any]) -> dict[str, Any]:
     out = dict(rec)
+    resolve_aliases(out)
 
-    # ts → ISO8601 (jeśli brak albo puste → wstaw teraz)
+    # ts → ISO8601 UTC (brak/puste albo nieparsowalne → wstaw teraz)
     ts = out.get("ts")
-    if isinstance(ts, str) and ts.strip():
-        out["_missing_ts"] = False
-    else:
-        out["_missing_ts"] = True
-        out["ts"] = datetime.now(UTC).isoformat()
+    missing = ts is None or (isinstance(ts, str) and not ts.strip())
+    canon = None if missing else canonical_ts(ts)
+    out["_missing_ts"] = missing
+    out["_invalid_ts"] = not missing and canon is None
+    out["ts"] = canon or datetime.now(UTC).isoformat()
 
-    # level → uppercase; nienapisowe traktujemy jako brak
-    lvl = out.get("level")
-    if isinstance(lvl, str) and lvl.strip():
+    # level → LEVELS (synonimy, liczby, bool); brak/nieużywalny → INFO
+    lvl = canonical_level(out.get("level"))
+    if lvl is not None:
         out["_missing_level"] = False
-        out["level"] = lvl.strip().upper()
+        out["level"] = lvl
     else:
         out["_missing_level"] = True
         out["level"] = "INFO"
@@ -36,3 +181,120 @@ def normalize_record(rec: dict[str, Any]) -> dict[str, Any]:
         out["msg"] = str(msg)
 
     return out
+
+
+@dataclass(slots=True)
+class BatchStats:
+    """Liczniki zebrane w jednym przebiegu normalize_batch()."""
+
+    missing_ts: int = 0
+    invalid_ts: int = 0
+    missing_level: int = 0
+    invalid: int = 0
+    invalid_idx: list[int] = field(default_factory=list)
+    levels: Counter[str] = field(default_factory=Counter)
+
+    def merge(self, other: BatchStats) -> None:
+        """Dolicza liczniki innego batcha (np. kawałka body parsowanego w puli procesów)."""
+        self.missing_ts += other.missing_ts
+        self.invalid_ts += other.invalid_ts
+        self.missing_level += other.missing_level
+        self.invalid += other.invalid
+        self.invalid_idx.extend(other.invalid_idx)
+        self.levels.update(other.levels)
+
+
+def normalize_batch(
+    records: list[Any],
+    *,
+    emitter: str = "",
+    scenario_id: str = "",
+    app: str = "logops",
+    source: str = "ingest",
+    in_place: bool = True,
+    max_invalid_idx: int = 50,
+    stats: BatchStats | None = None,
+    index_base: int = 0,
+) -> tuple[list[dict[str, Any]], BatchStats]:
+    """
+    Jeden przebieg po batchu: aliasy pól, normalizacja (jak normalize_record), etykiety z nagłówków
+    (nagłówek ma pierwszeństwo), rozkład leveli i liczniki braków.
+    - elementy nie-dict są pomijane (indeksy w stats.invalid_idx, maks. max_invalid_idx),
+    - ts kanonizowany do UTC (timeparse.canonical_ts); "teraz" liczone raz na batch
+      (tylko jeśli któryś rekord nie ma ts albo ma nieparsowalny — stats.invalid_ts),
+    - in_place=True mutuje rekordy wejściowe — bezpieczne, gdy batch pochodzi z naszego
+      parsowania body; in_place=False kopiuje każdy rekord,
+    - przy body czytanym kawałkami: przekaż wspólne `stats` i `index_base` (liczba rekordów
+      z poprzednich kawałków), żeby liczniki i indeksy dotyczyły całego body.
+    """
+    if stats is None:
+        stats = BatchStats()
+    levels = stats.levels
+    out: list[dict[str, Any]] = []
+    append = out.append
+    now_iso: str | None = None
+    alias_groups = _ALIAS_GROUPS
+    level_cache = _LEVEL_CACHE
+
+    for i, rec in enumerate(records):
+        if not isinstance(rec, dict):
+            stats.invalid += 1
+            if len(stats.invalid_idx) < max_invalid_idx:
+                stats.invalid_idx.append(index_base + i)
+            continue
+        n = rec if in_place else dict(rec)
+
+        for canon, aliases in alias_groups:
+            if n.get(canon) not in (None, ""):
+                continue
+            for a in aliases:
+                if a in n:
+                    n[canon] = n.pop(a)
+                    break
+
+        ts = n.get("ts")
+        canon = canonical_ts(ts) if ts is not None and ts != "" else None
+        if canon is not None:
+            n["_missing_ts"] = False
+            n["_invalid_ts"] = False
+            n["ts"] = canon
+        else:
+            if now_iso is None:
+                now_iso = datetime.now(UTC).isoformat()
+            missing = ts is None or (isinstance(ts, str) and not ts.strip())
+            n["_missing_ts"] = missing
+            n["_invalid_ts"] = not missing
+            n["ts"] = now_iso
+            if missing:
+                stats.missing_ts += 1
+            else:
+                stats.invalid_ts += 1
+
+        lvl = n.get("level")
+        lvl = level_cache.get(lvl) if isinstance(lvl, str) else None  # szybka ścieżka
+        if lvl is None:
+            lvl = canonical_level(n.get("level"))
+        if lvl is not None:
+            n["_missing_level"] = False
+        else:
+            n["_missing_level"] = True
+            lvl = "INFO"
+            stats.missing_level += 1
+        n["level"] = lvl
+        levels[lvl] += 1
+
+        msg = n.get("msg")
+        if msg is None:
+            n["msg"] = ""
+        elif not isinstance(msg, str):
+            n["msg"] = str(msg)
+
+        n["app"] = app
+        n["source"] = source
+        if emitter:
+            n["emitter"] = emitter
+        if scenario_id:
+            n["scenario_id"] = scenario_id
+        append(n)
+
+    return out, stats
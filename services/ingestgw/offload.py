@@ -0,0 +1,175 @@
+# services/ingestgw/offload.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import sys
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from services.common.linestream import TextLineStream
+
+from .metrics import OFFLOAD_BODIES_TOTAL, OFFLOAD_INFLIGHT_TASKS, OFFLOAD_TASK_SECONDS
+from .normalize import BatchStats
+from .parsers import csv_body_columns, parse_text_chunk, pool_worker_init, split_text_chunks
+
+logger = logging.getLogger("ingestgw.offload")
+
+
+def _free_threaded() -> bool:
+    # Python 3.13t+: bez GIL wątki wystarczą (bez kosztu pickle między procesami)
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class TextParseOffload:
+    """
+    Parsowanie + normalizacja body text/plain i text/csv poza event loopem:
+    - body mniejsze niż `min_bytes` (albo `workers=0`) — inline, jak dotąd,
+    - większe: cięte na kawałki ~`chunk_bytes` po granicach linii (CSV — poza cudzysłowem),
+      każdy kawałek to osobne zadanie w puli (procesy; wątki na buildzie free-threaded),
+    - wyniki wracają po kolei (kolejność rekordów zachowana) i są sklejane w miarę napływu,
+    - parse_stream(): body czytane strumieniowo — kawałki idą do puli w trakcie odczytu,
+    - zepsuta pula (np. OOM-kill workera) → nowa pula przy następnym body, bieżące inline w wątku.
+    """
+
+    def __init__(self, *, workers: int = 2, min_bytes: int = 256 * 1024, chunk_bytes: int = 0):
+        self.workers = max(0, int(workers))
+        self.min_bytes = max(0, int(min_bytes))
+        self.chunk_bytes = max(4096, int(chunk_bytes or min_bytes or 256 * 1024))
+        self._pool: Executor | None = None
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            if _free_threaded():
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="ingest-parse")
+            else:
+                # spawn: fork procesu z działającym event loopem i wątkami nie jest bezpieczny
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=pool_worker_init,
+                )
+            logger.info(
+                "parse offload pool: %d %s worker(s)",
+                self.workers,
+                "thread" if _free_threaded() else "process",
+            )
+        return self._pool
+
+    def start(self) -> None:
+        """Rozgrzewka: procesy puli startują od razu, nie przy pierwszym dużym body (spawn ~1 s)."""
+        if self.workers:
+            pool = self._executor()
+            for _ in range(self.workers):
+                pool.submit(split_text_chunks, b"", 1)
+
+    def shutdown(self) -> None:
+        # wait=True: czekamy tylko na zadania już wykonywane (kolejka anulowana)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def parse(
+        self, kind: str, data: bytes, emitter: str, scenario_id: str
+    ) -> tuple[list[dict[str, Any]], BatchStats]:
+        """kind = "syslog" | "csv" → (znormalizowane rekordy, liczniki całego body)."""
+        return await self.parse_stream(kind, _once(data), emitter, scenario_id)
+
+    async def parse_stream(
+        self,
+        kind: str,
+        chunks: AsyncIterable[bytes],
+        emitter: str,
+        scenario_id: str,
+        *,
+        max_bytes: int = 0,
+    ) -> tuple[list[dict[str, Any]], BatchStats]:
+        """
+        Jak parse(), ale body czytane strumieniowo (TextLineStream): kawałek pełnych linii trafia
+        do parsowania (inline albo do puli), gdy tylko jest kompletny — w pamięci jest najwyżej
+        kilka kawałków body, nie całe body. Do puli idą kawałki od `min_bytes` odczytanego body;
+        w locie najwyżej 2 × workers kawałków (dalszy odczyt czeka na wyniki).
+        max_bytes (0 = bez limitu) → StreamLimitError.
+        """
+        lines = TextLineStream(self.chunk_bytes, quoted=kind == "csv", max_bytes=max_bytes)
+        normalized: list[dict[str, Any]] = []
+        stats = BatchStats()
+        # zadanie = argumenty parse_text_chunk (kind, kawałek, emitter, scenario_id, first, columns)
+        pending: deque[tuple[asyncio.Future[Any], tuple[Any, ...]]] = deque()
+        columns: tuple[str, ...] | None = None  # CSV: kolumny z nagłówka dla dalszych kawałków
+        window = 2 * self.workers
+        offload = broken = False
+        loop = asyncio.get_running_loop()
+
+        def in_thread(task: tuple[Any, ...]) -> asyncio.Future[Any]:
+            return asyncio.ensure_future(asyncio.to_thread(parse_text_chunk, *task))
+
+        async def collect() -> None:
+            nonlocal broken
+            fut, task = pending.popleft()
+            try:
+                part, part_stats, cpu_s = await fut
+            except BrokenProcessPool:
+                logger.warning("parse pool broken, parsing %d bytes inline", len(task[1]))
+                if not broken:
+                    broken = True
+                    self._reset()
+                part, part_stats, cpu_s = await in_thread(task)
+            finally:
+                OFFLOAD_INFLIGHT_TASKS.dec()
+            OFFLOAD_TASK_SECONDS.labels(kind).observe(cpu_s)
+            normalized.extend(part)
+            stats.merge(part_stats)
+
+        try:
+            first = True
+            async for chunk in lines.aiter(chunks):
+                task = (kind, chunk, emitter, scenario_id, first, columns)
+                if first and kind == "csv":
+                    columns = csv_body_columns(chunk, emitter)
+                first = False
+                if not offload and self.workers and lines.bytes_seen >= self.min_bytes:
+                    offload = True
+                    OFFLOAD_BODIES_TOTAL.labels(kind).inc()
+                if not offload:
+                    part, part_stats, _ = parse_text_chunk(*task)
+                    normalized.extend(part)
+                    stats.merge(part_stats)
+                    continue
+
+                while len(pending) >= window:
+                    await collect()
+                fut: asyncio.Future[Any] | None = None
+                if not broken:
+                    try:
+                        fut = loop.run_in_executor(self._executor(), parse_text_chunk, *task)
+                    except (BrokenProcessPool, RuntimeError):
+                        broken = True
+                        self._reset()
+                # zepsuta pula → reszta tego body w wątku, nowa pula przy następnym body
+                OFFLOAD_INFLIGHT_TASKS.inc()
+                pending.append((fut or in_thread(task), task))
+            while pending:
+                await collect()
+        finally:
+            if pending:
+                OFFLOAD_INFLIGHT_TASKS.dec(len(pending))
+                for fut, _ in pending:
+                    fut.cancel()
+        return normalized, stats
+
+    # --- wnętrze ---
+
+    def _reset(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
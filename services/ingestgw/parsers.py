@@ -3,64 +3,486 @@ from __future__ import annotations
 
 import csv
 import io
+import itertools
+import os
 import re
+import signal
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
 from typing import Any
 
+from .normalize import BatchStats, canonical_level, normalize_batch
+
+# linia bez rozpoznanej struktury: level szukany gdziekolwiek (zachowanie sprzed parsera RFC)
 _LEVEL_RE = re.compile(r"\b(DEBUG|INFO|WARN|ERROR|TRACE|FATAL)\b", re.IGNORECASE)
 
+# ── syslog: format domowy, RFC 3164, RFC 5424 ─────────────────────────────────
+# Wyjście: ts (jak w linii — kanonizuje normalize), level, msg, host, app_name, pid, facility,
+# msgid, sd (RFC 5424). Pole `app` jest etykietą LogOps (app="logops"), stąd `app_name`.
+
+# słowa akceptowane na pozycji LEVEL formatu domowego
+_HOUSE_LEVELS = frozenset(
+    v
+    for w in (
+        "trace",
+        "debug",
+        "info",
+        "notice",
+        "warn",
+        "warning",
+        "err",
+        "error",
+        "crit",
+        "critical",
+        "alert",
+        "emerg",
+        "fatal",
+    )
+    for v in (w, w.upper(), w.capitalize())
+)
+
+# PRI = facility * 8 + severity; severity 0..7 → LEVELS (jak liczby w normalize)
+_PRI_LEVELS = tuple(canonical_level(i) for i in range(8))
+
+# "YYYY-MM-DD HH:MM:SS[.frac][tz] [LEVEL [host app[pid]: ]]msg" (emitters/syslog.py) — ścieżka ogólna
+_HOUSE_RE = re.compile(
+    r"(\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:[.,]\d+)?(?:Z|[+-]\d\d(?::?\d\d)?)?)[ \t]++"
+    r"(?:([A-Za-z]++)[ \t]++(?:([^\s\[\]:]++)[ \t]++([^\s\[\]:]++)(?:\[([^\]\s]*+)\])?+:[ \t]?+)?+)?+"
+    r"(.*)",
+    re.S,
+)
+# "<PRI>1 TIMESTAMP HOST APP PROCID MSGID SD [MSG]" — "-" = brak wartości
+_RFC5424_RE = re.compile(
+    r"<(\d{1,3})>1 (\S++) (\S++) (\S++) (\S++) (\S++) "
+    r"(-|(?:\[(?:[^\]\\\"]|\\.|\"(?:[^\"\\]|\\.)*+\")*+\])++)(?: (.*))?",
+    re.S,
+)
+# "[<PRI>]Mmm dd HH:MM:SS host [tag[pid]: ]msg" (BSD syslog; bez roku i strefy)
+_RFC3164_RE = re.compile(
+    r"(?:<(\d{1,3})>)?([A-Z][a-z]{2}) ([ \d]?\d) (\d\d:\d\d:\d\d) ++([^\s\[\]:]++) ++"
+    r"(?:([^\s\[\]:]++)(?:\[([^\]\s]*+)\])?+: ?+)?+(.*)",
+    re.S,
+)
+# body złożone z samych pełnych linii domowych — szybka ścieżka parse_syslog_text()
+_HOUSE_BODY_RE = re.compile(
+    r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) ("
+    + "|".join(sorted(_HOUSE_LEVELS, key=len, reverse=True))
+    + r") ([^\s\[\]:]++) ([^\s\[\]:]++)(?:\[(\d++)\])?+: ([^\n]*+)$",
+    re.M,
+)
+_MONTHS = {
+    m: i
+    for i, m in enumerate(
+        ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1
+    )
+}
+
+
+def _pri(rec: dict[str, Any], pri: str | None) -> None:
+    if pri is not None:
+        v = int(pri)
+        if v <= 191:
+            rec["facility"] = v >> 3
+            rec["level"] = _PRI_LEVELS[v & 7]
+
+
+def _rfc3164_ts(mon: str, day: str, hms: str) -> str | None:
+    month = _MONTHS.get(mon)
+    if month is None:
+        return None
+    now = datetime.now(UTC)
+    # bez roku: bieżący, chyba że miesiąc "z przyszłości" (grudniowe linie w styczniu)
+    year = now.year - 1 if month > now.month + 1 else now.year
+    return f"{year:04d}-{month:02d}-{int(day):02d}T{hms}"
+
+
+def _unstructured(line: str) -> dict[str, Any]:
+    rec: dict[str, Any] = {"msg": line}
+    m = _LEVEL_RE.search(line)
+    if m:
+        rec["level"] = m.group(1).upper()
+    return rec
+
 
 def parse_syslog_line(line: str) -> dict[str, Any]:
     """
-    Minimalny parser syslog-like:
-    - msg = pełna linia,
-    - level: wyciągnięty z tokena, jeśli występuje; inaczej INFO.
+    Jedna linia syslog → rekord (jedno dopasowanie prekompilowanego wzorca, bez backtrackingu
+    między formatami — format wybiera pierwszy znak):
+    - `<PRI>1 ...` → RFC 5424 (PRI → facility + level z severity),
+    - `<PRI>Mmm dd ...` / `Mmm dd HH:MM:SS host tag[pid]: msg` → RFC 3164 (rok bieżący, UTC),
+    - `YYYY-MM-DD HH:MM:SS [LEVEL host app[pid]: ]msg` → format domowy (emitters/syslog.py),
+    - inne → msg = cała linia, level wyszukany w treści (jak dotąd).
+    Brak levelu w linii = brak pola (normalize wstawia INFO i liczy missing_level).
     """
-    lvl = "INFO"
-    m = _LEVEL_RE.search(line or "")
-    if m:
-        lvl = m.group(1).upper()
-    return {"level": lvl, "msg": line}
+    line = (line or "").rstrip("\r\n")
+    head = line[:1]
+    if head.isdigit():
+        m = _HOUSE_RE.match(line)
+        if m is not None:
+            ts, level, host, app, pid, msg = m.groups()
+            if level is not None and level not in _HOUSE_LEVELS:
+                # pierwsze słowo to nie level — całość po ts jest wiadomością
+                rec = _unstructured(line[m.start(2) :])
+                rec["ts"] = ts
+                return rec
+            rec = {"ts": ts, "msg": msg}
+            if level is not None:
+                rec["level"] = level
+            if host is not None:
+                rec["host"] = host
+                rec["app_name"] = app
+                if pid:
+                    rec["pid"] = pid
+            return rec
+    elif head == "<" and line[2:7].find(">1 ") != -1:
+        m = _RFC5424_RE.match(line)
+        if m is not None:
+            pri, ts, host, app, pid, msgid, sd, msg = m.groups()
+            msg = msg or ""
+            rec = {"msg": msg[1:] if msg[:1] == "\ufeff" else msg}
+            _pri(rec, pri)
+            for key, val in (
+                ("ts", ts),
+                ("host", host),
+                ("app_name", app),
+                ("pid", pid),
+                ("msgid", msgid),
+                ("sd", sd),
+            ):
+                if val != "-":
+                    rec[key] = val
+            return rec
+    if head == "<" or head.isupper():
+        m = _RFC3164_RE.match(line)
+        if m is not None:
+            pri, mon, day, hms, host, tag, pid, msg = m.groups()
+            ts = _rfc3164_ts(mon, day, hms)
+            if ts is not None:
+                rec = {"ts": ts, "host": host, "msg": msg}
+                if tag is not None:
+                    rec["app_name"] = tag
+                    if pid:
+                        rec["pid"] = pid
+                _pri(rec, pri)
+                if "level" not in rec:
+                    lm = _LEVEL_RE.search(msg)
+                    if lm:
+                        rec["level"] = lm.group(1).upper()
+                return rec
+    return _unstructured(line)
+
+
+def _house_full_lines(text: str) -> list[dict[str, Any]] | None:
+    # jedno przejście regexu (C) po całym body; None = nie każda linia jest pełną linią domową
+    rows = _HOUSE_BODY_RE.findall(text)
+    if len(rows) != text.count("\n") + (text[-1:] != "\n") or "\r" in text:
+        return None
+    out: list[dict[str, Any]] = []
+    append = out.append
+    for ts, level, host, app, pid, msg in rows:
+        if pid:
+            append(
+                {"ts": ts, "level": level, "host": host, "app_name": app, "pid": pid, "msg": msg}
+            )
+        else:
+            append({"ts": ts, "level": level, "host": host, "app_name": app, "msg": msg})
+    return out
 
 
-def parse_csv_text_body(text: str) -> list[dict[str, Any]]:
+def parse_syslog_text(text: str) -> list[dict[str, Any]]:
     """
-    CSV o strukturze (ts, level, msg), z opcjonalnym nagłówkiem.
-    Obsługuje cudzysłowy i przecinki w polu msg (używa csv.reader).
+    Body text/plain → rekordy (1 niepusta linia = 1 rekord), wynik jak parse_syslog_line.
+    - body złożone wyłącznie z pełnych linii formatu domowego
+      "YYYY-MM-DD HH:MM:SS LEVEL host app[pid]: msg" (typowy emiter) → jeden `findall`,
+    - pozostałe: pełna linia domowa rozpoznawana przez `str.split` + kontrolę kształtu,
+      wszystko inne (i linie, które kontroli nie przejdą) → parse_syslog_line.
     """
-    out: list[dict[str, Any]] = []
     if not text:
-        return out
+        return []
+    if _HOUSE_BODY_RE.match(text) is not None:
+        fast = _house_full_lines(text)
+        if fast is not None:
+            return fast
 
-    f = io.StringIO(text)
-    reader = csv.reader(f)
-    first_data_seen = False
-
-    # dopuszczalne aliasy nagłówków
-    def _is_header(row: list[str]) -> bool:
-        r = [c.strip().lower() for c in row]
-        if len(r) < 3:
-            return False
-        return (
-            r[0] in ("ts", "timestamp")
-            and r[1] in ("level", "lvl", "severity")
-            and r[2] in ("msg", "message", "log", "text")
-        )
+    out: list[dict[str, Any]] = []
+    append = out.append
+    levels = _HOUSE_LEVELS
+    slow = parse_syslog_line
+    for ln in text.splitlines():
+        p = ln.split(" ", 5)
+        if (
+            len(p) == 6
+            and p[2] in levels
+            and p[4][-1:] == ":"
+            and len(p[0]) == 10
+            and ln[4] == "-"
+            and ln[7] == "-"
+            and ln[13] == ":"
+            and ln[16] == ":"
+            and ln[0].isdigit()
+        ):
+            app = p[4][:-1]
+            if app[-1:] == "]":
+                app, sep, pid = app[:-1].partition("[")
+                if sep and app and pid.isdigit():
+                    append(
+                        {
+                            "ts": ln[:19],
+                            "level": p[2],
+                            "host": p[3],
+                            "app_name": app,
+                            "pid": pid,
+                            "msg": p[5],
+                        }
+                    )
+                    continue
+            elif app and "[" not in app and "]" not in app:
+                append({"ts": ln[:19], "level": p[2], "host": p[3], "app_name": app, "msg": p[5]})
+                continue
+        if ln.strip():
+            append(slow(ln))
+    return out
 
-    for row in reader:
-        if not row or all((c or "").strip() == "" for c in row):
-            continue
-        # pierwszy niepusty wiersz: jeśli to nagłówek, pomijamy
-        if not first_data_seen and _is_header(row):
-            first_data_seen = True
+
+# ── CSV: schematy kolumn per emiter ───────────────────────────────────────────
+# Nagłówek → pola kanoniczne (wbudowane aliasy jak dawniej + nazwy ze schematu emitera);
+# pozostałe kolumny zostają atrybutami rekordu pod nazwą z nagłówku (opcjonalnie typowane).
+_CSV_HEADER_ALIASES: dict[str, str] = {
+    "ts": "ts",
+    "timestamp": "ts",
+    "level": "level",
+    "lvl": "level",
+    "severity": "level",
+    "msg": "msg",
+    "message": "msg",
+    "log": "msg",
+    "text": "msg",
+}
+_CSV_CANONICAL = frozenset(("ts", "level", "msg"))
+
+
+def _csv_bool(value: str) -> bool:
+    v = value.lower()
+    if v in ("1", "true", "yes", "on", "t", "y"):
+        return True
+    if v in ("0", "false", "no", "off", "f", "n"):
+        return False
+    raise ValueError(value)
+
+
+_CSV_TYPES: dict[str, Callable[[str], Any]] = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": _csv_bool,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class CsvSchema:
+    """
+    Schemat CSV emitera: `columns` — pola wg pozycji (body bez nagłówka), `names` — nazwa
+    kolumny z nagłówka (lower) → pole, `types` — pole → konwersja (int/float/bool).
+    """
+
+    columns: tuple[str, ...] = ("ts", "level", "msg")
+    names: dict[str, str] = field(default_factory=dict)
+    types: dict[str, Callable[[str], Any]] = field(default_factory=dict)
+
+
+def parse_csv_schema_spec(spec: str) -> dict[str, CsvSchema]:
+    """
+    "emiter=kol[>pole][:typ],...;emiter2=..." → {emiter: CsvSchema}; emiter "*" = domyślny.
+    Np. "billing=time>ts,sev>level,text>msg,amount:float,user" — kolejność kolumn to też
+    układ body bez nagłówka. Nieznany typ → ValueError (błąd konfiguracji przy starcie).
+    """
+    out: dict[str, CsvSchema] = {}
+    for part in (spec or "").split(";"):
+        emitter, sep, cols = part.partition("=")
+        emitter = emitter.strip()
+        if not (sep and emitter):
             continue
-        first_data_seen = True
+        columns: list[str] = []
+        names: dict[str, str] = {}
+        types: dict[str, Callable[[str], Any]] = {}
+        for col in cols.split(","):
+            col, _, typ = col.partition(":")
+            name, _, target = col.partition(">")
+            name, target, typ = name.strip(), target.strip(), typ.strip().lower()
+            if not name:
+                continue
+            fld = target or _CSV_HEADER_ALIASES.get(name.lower(), name)
+            columns.append(fld)
+            names[name.lower()] = fld
+            if typ and typ != "str":
+                if typ not in _CSV_TYPES:
+                    raise ValueError(f"INGEST_CSV_SCHEMAS: unknown type {typ!r} for {name!r}")
+                types[fld] = _CSV_TYPES[typ]
+        if columns:
+            out[emitter] = CsvSchema(tuple(columns), names, types)
+    return out
+
+
+CSV_SCHEMAS: dict[str, CsvSchema] = parse_csv_schema_spec(os.getenv("INGEST_CSV_SCHEMAS", ""))
+_DEFAULT_CSV_SCHEMA = CSV_SCHEMAS.get("*", CsvSchema())
+
+
+def csv_schema(emitter: str) -> CsvSchema:
+    return CSV_SCHEMAS.get(emitter, _DEFAULT_CSV_SCHEMA)
+
+
+def csv_header_columns(row: list[str], schema: CsvSchema) -> tuple[str, ...] | None:
+    """
+    Wiersz → pola kolumn, jeśli to nagłówek: co najmniej dwa różne pola kanoniczne
+    (ts/level/msg) albo wszystkie nazwy znane ze schematu; inaczej None (wiersz danych).
+    """
+    names = [c.strip() for c in row]
+    fields = tuple(
+        schema.names.get(n.lower()) or _CSV_HEADER_ALIASES.get(n.lower()) or n for n in names
+    )
+    canonical = _CSV_CANONICAL.intersection(fields)
+    if len(canonical) >= 2 or (schema.names and all(n.lower() in schema.names for n in names if n)):
+        return fields
+    return None
+
+
+def csv_body_columns(data: bytes, emitter: str) -> tuple[str, ...] | None:
+    """Kolumny z nagłówka pierwszego niepustego wiersza body (kawałka) albo None."""
+    for raw in data.split(b"\n", 8):
+        line = raw.decode("utf-8", errors="replace").strip()
+        if line.strip(","):
+            row = next(csv.reader([line]), [])
+            return csv_header_columns(row, csv_schema(emitter))
+    return None
+
+
+def _csv_convert(rec: dict[str, Any], types: list[tuple[str, Callable[[str], Any]]]) -> None:
+    for f, conv in types:
+        v = rec.get(f)
+        if v == "":
+            del rec[f]
+        elif v is not None:
+            try:
+                rec[f] = conv(v)
+            except ValueError:
+                pass
+
+
+def parse_csv_text_body(
+    text: str,
+    *,
+    allow_header: bool = True,
+    emitter: str = "",
+    columns: tuple[str, ...] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    CSV → rekordy wg schematu emitera (INGEST_CSV_SCHEMAS; domyślnie kolumny ts, level, msg).
+    - nagłówek (pierwszy niepusty wiersz, jeśli allow_header) wyznacza kolumny: aliasy
+      ts/level/msg i nazwy ze schematu → pola kanoniczne, pozostałe → atrybuty pod swoją nazwą,
+    - bez nagłówka — kolumny schematu wg pozycji; `columns` — kolumny z nagłówka pierwszego
+      kawałka body (kolejne kawałki w puli),
+    - nadmiarowe komórki są doklejane (z przecinkiem) do ostatniej kolumny (zwykle msg),
+    - kolumny typowane w schemacie: konwersja; pusta komórka → brak pola, błąd → string.
+    Szybka ścieżka: tekst bez `"` dzielony `str.split` (bez csv.reader); z cudzysłowami —
+    jeden przebieg csv.reader (pola z przecinkami, `""`, nowe linie).
+    """
+    out: list[dict[str, Any]] = []
+    if not text:
+        return out
+    schema = csv_schema(emitter)
+    quoted = '"' in text
+    if quoted:
+        rows: Iterator[list[str]] = csv.reader(io.StringIO(text))
+    else:
+        rows = (ln.split(",") for ln in text.split("\n"))
+    if columns is None:
+        columns = schema.columns
+        if allow_header:
+            for row in rows:
+                if any(c.strip() for c in row):
+                    header = csv_header_columns(row, schema)
+                    if header is not None:
+                        columns = header
+                    else:
+                        rows = itertools.chain((row,), rows)
+                    break
+    ncols = len(columns)
+    last = ncols - 1
+    types = [(f, conv) for f, conv in schema.types.items() if f in columns]
+    append = out.append
+    strip = str.strip
+    for row in rows:
+        if len(row) > ncols:
+            if not any(map(strip, row)):
+                continue
+            row[last:] = [",".join(row[last:])]
+        rec = dict(zip(columns, map(strip, row), strict=False))
+        if not any(rec.values()):
+            continue  # pusty wiersz (same przecinki/spacje)
+        if types:
+            _csv_convert(rec, types)
+        append(rec)
+    return out
 
-        # mapowanie kolumn
-        ts = row[0].strip() if len(row) > 0 else ""
-        level = row[1].strip() if len(row) > 1 else ""
-        # wiadomość może zawierać przecinki → łączymy resztę
-        msg = ",".join(row[2:]).strip() if len(row) > 2 else ""
 
-        out.append({"ts": ts, "level": level, "msg": msg})
+# ── body tekstowe (text/plain, text/csv) w kawałkach — też w procesach puli (offload.py) ──
 
+
+def split_text_chunks(data: bytes, chunk_bytes: int, *, quoted: bool = False) -> list[bytes]:
+    """
+    Dzieli body na kawałki ~chunk_bytes, zawsze tuż po "\n" (UTF-8 bezpieczne).
+    quoted=True (CSV): tnie tylko poza cudzysłowem — parzysta liczba `"` od początku kawałka
+    (escape `""` nie zmienia parzystości), więc pole z nową linią nie zostanie rozcięte.
+    """
+    out: list[bytes] = []
+    start, n = 0, len(data)
+    step = max(1, int(chunk_bytes))
+    while n - start > step:
+        cut = data.find(b"\n", start + step)
+        if quoted and cut != -1:
+            quotes = data.count(b'"', start, cut)
+            while cut != -1 and quotes % 2:
+                nxt = data.find(b"\n", cut + 1)
+                if nxt != -1:
+                    quotes += data.count(b'"', cut, nxt)
+                cut = nxt
+        if cut == -1:
+            break
+        out.append(data[start : cut + 1])
+        start = cut + 1
+    if start < n:
+        out.append(data[start:])
     return out
+
+
+def parse_text_chunk(
+    kind: str,
+    data: bytes,
+    emitter: str,
+    scenario_id: str,
+    first: bool = True,
+    columns: tuple[str, ...] | None = None,
+) -> tuple[list[dict[str, Any]], BatchStats, float]:
+    """
+    Kawałek body tekstowego → (znormalizowane rekordy, liczniki, czas CPU w s).
+    kind = "syslog" (1 linia = 1 rekord) | "csv"; first=False — bez wykrywania nagłówka CSV,
+    `columns` — kolumny z nagłówka pierwszego kawałka (csv_body_columns).
+    Czysta funkcja (bez metryk/stanu) — wykonywana inline albo w procesie puli.
+    """
+    t0 = time.perf_counter()
+    text = data.decode("utf-8", errors="replace")
+    if kind == "csv":
+        records: list[Any] = parse_csv_text_body(
+            text, allow_header=first, emitter=emitter, columns=columns
+        )
+    else:
+        records = parse_syslog_text(text)
+    normalized, stats = normalize_batch(records, emitter=emitter, scenario_id=scenario_id)
+    return normalized, stats, time.perf_counter() - t0
+
+
+def pool_worker_init() -> None:
+    """Initializer procesu puli: Ctrl+C/SIGINT obsługuje proces główny (uvicorn), nie worker."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
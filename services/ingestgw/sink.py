@@ -0,0 +1,129 @@
+# services/ingestgw/sink.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from services.common import codec
+
+from .metrics import SINK_DROPPED_TOTAL, SINK_FLUSH_LATENCY, SINK_QUEUE_DEPTH
+
+logger = logging.getLogger("ingestgw.sink")
+
+
+class NdjsonSink:
+    """
+    Zapis NDJSON poza event loopem:
+    - ograniczona kolejka w pamięci (limit w rekordach),
+    - writer w tle (task + wątek) robi group-commit: jeden write() na flush,
+    - flush co `flush_interval_ms` albo po uzbieraniu `flush_records`,
+    - backpressure: przy pełnej kolejce producent czeka do `block_ms`,
+      potem nadmiar jest porzucany (licznik logops_sink_dropped_total),
+    - plik dzienny `YYYYMMDD<name_suffix>.ndjson` (sufiks per worker, np. "-w1").
+    """
+
+    def __init__(
+        self,
+        sink_dir: str | Path,
+        *,
+        max_queue: int = 50_000,
+        flush_interval_ms: int = 200,
+        flush_records: int = 2000,
+        block_ms: int = 50,
+        name_suffix: str = "",
+    ):
+        self.sink_dir = Path(sink_dir)
+        self.max_queue = max(1, int(max_queue))
+        self.flush_interval_s = max(1, int(flush_interval_ms)) / 1000.0
+        self.flush_records = max(1, int(flush_records))
+        self.block_s = max(0, int(block_ms)) / 1000.0
+        self.name_suffix = name_suffix
+        self._buf: deque[dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._closing = False
+
+    # --- cykl życia ---
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Dopisuje to, co zostało w kolejce, i zatrzymuje writer."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    # --- producent ---
+
+    async def submit(self, records: list[dict[str, Any]]) -> int:
+        """Wrzuca rekordy do kolejki; zwraca liczbę przyjętych (reszta porzucona)."""
+        if not records:
+            return 0
+        self.start()
+
+        free = self.max_queue - len(self._buf)
+        if free < len(records) and self.block_s > 0:
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), self.block_s)
+            except TimeoutError:
+                pass
+            free = self.max_queue - len(self._buf)
+
+        take = records if free >= len(records) else records[: max(0, free)]
+        dropped = len(records) - len(take)
+        if dropped:
+            SINK_DROPPED_TOTAL.labels("queue_full").inc(dropped)
+        if take:
+            self._buf.extend(take)
+            SINK_QUEUE_DEPTH.set(len(self._buf))
+            if len(self._buf) >= self.flush_records:
+                self._wakeup.set()
+        return len(take)
+
+    # --- writer ---
+
+    async def _run(self) -> None:
+        while not (self._closing and not self._buf):
+            if len(self._buf) < self.flush_records and not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_s)
+                except TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if not self._buf:
+                continue
+
+            n = min(len(self._buf), self.flush_records)
+            batch = [self._buf.popleft() for _ in range(n)]
+            SINK_QUEUE_DEPTH.set(len(self._buf))
+            self._space.set()
+
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception:
+                logger.exception("ndjson sink write failed")
+                SINK_DROPPED_TOTAL.labels("write_error").inc(len(batch))
+            SINK_FLUSH_LATENCY.observe(time.perf_counter() - t0)
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        # serializacja też tutaj (w wątku), żeby nie obciążać event loopa
+        dumps = codec.dumps
+        lines = [dumps({k: v for k, v in n.items() if not k.startswith("_")}) for n in batch]
+        lines.append(b"")
+        self.sink_dir.mkdir(parents=True, exist_ok=True)
+        day = datetime.now(UTC).strftime("%Y%m%d")
+        with (self.sink_dir / f"{day}{self.name_suffix}.ndjson").open("ab") as fh:
+            fh.write(b"\n".join(lines))
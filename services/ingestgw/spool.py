@@ -0,0 +1,358 @@
+# services/ingestgw/spool.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from .metrics import (
+    SPOOL_APPENDED_TOTAL,
+    SPOOL_BYTES,
+    SPOOL_DROPPED_TOTAL,
+    SPOOL_OLDEST_AGE,
+    SPOOL_REPLAYED_TOTAL,
+)
+
+logger = logging.getLogger("ingestgw.spool")
+
+# send(body, headers, count) -> (status_code, content)
+SendFn = Callable[[bytes, dict[str, str], int], Awaitable[tuple[int, Any]]]
+# probe() -> True = Core żyje (np. /healthz odpowiada)
+ProbeFn = Callable[[], Awaitable[bool]]
+
+# ramka wpisu: długość payloadu + crc32, potem payload = meta JSON + "\n" + body (tablica JSON)
+_FRAME = struct.Struct(">II")
+_SEG_SUFFIX = ".spool"
+_CHECKPOINT = "checkpoint.json"
+_DEAD_LETTER = "dead-letter.spool"
+
+
+def _parse_meta(raw: bytes) -> dict[str, Any] | None:
+    # {"ts": float, "n": int, "h": {nagłówki}} — None, gdy nie da się tego odczytać
+    try:
+        meta = json.loads(raw)
+        if isinstance(meta, dict) and isinstance(meta.get("h") or {}, dict):
+            float(meta.get("ts") or 0)
+            int(meta.get("n") or 0)
+            return meta
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+def _seg_name(seq: int) -> str:
+    return f"{seq:012d}{_SEG_SUFFIX}"
+
+
+class CoreSpool:
+    """
+    Lokalny spool (write-ahead) batchy, których nie udało się oddać do Core:
+    - segmenty `NNNNNNNNNNNN.spool` w `spool_dir`, dopisywane ramkami (len + crc32) z fsync,
+      nowy segment po przekroczeniu `segment_bytes`, łączny limit `max_bytes` (potem odmowa),
+    - drainer w tle odtwarza wpisy do Core po kolei (FIFO), z limitem `replay_rps` rekordów/s,
+      po każdym oddanym wpisie zapisuje checkpoint (segment, offset) — restart wznawia od niego,
+    - 2xx/4xx z Core = wpis zamknięty (4xx liczony jako odrzucony), 5xx/błąd sieci = backoff
+      i ponowienie tego samego wpisu,
+    - wpis, który nie przeszedł `max_attempts` razy, choć Core żyje (`probe`), trafia do
+      `dead-letter.spool` (te same ramki) — nie blokuje kolejki na zawsze; tam też wpis
+      z nieczytelnym meta (CRC zgodne),
+    - błąd dysku w drainerze (odczyt, checkpoint, dead-letter) → log i backoff, bez końca zadania,
+    - `spooling` mówi handlerowi, żeby dopisywał do spoola zamiast wysyłać do Core: Core leży
+      albo kolejka nie jest pusta (nowy batch nie może wyprzedzić starszych).
+    """
+
+    def __init__(
+        self,
+        spool_dir: str | Path,
+        *,
+        segment_bytes: int = 16 << 20,
+        max_bytes: int = 1 << 30,
+        replay_rps: int = 5000,
+        fsync: bool = True,
+        retry_max_s: float = 10.0,
+        max_attempts: int = 20,
+        probe: ProbeFn | None = None,
+    ):
+        self.dir = Path(spool_dir)
+        self.segment_bytes = max(64 * 1024, int(segment_bytes))
+        self.max_bytes = max(self.segment_bytes, int(max_bytes))
+        self.replay_rps = max(1, int(replay_rps))
+        self.fsync = fsync
+        self.retry_max_s = max(0.1, float(retry_max_s))
+        self.max_attempts = max(0, int(max_attempts))  # 0 = bez dead-letter
+        self.probe = probe
+        self.core_down = False
+
+        self._lock = threading.Lock()
+        self._sizes: dict[int, int] = {}  # seq → zatwierdzony rozmiar segmentu
+        self._write_seq = 0
+        self._write_fh = None
+        self._read_seq = 0
+        self._read_off = 0
+        self._head_ts: float | None = None  # czas dopisania najstarszego nieoddanego wpisu
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._recover()
+
+    # --- stan / metryki ---
+
+    @property
+    def pending_bytes(self) -> int:
+        with self._lock:
+            return self._pending_bytes_locked()
+
+    def _pending_bytes_locked(self) -> int:
+        return sum(self._sizes.values()) - self._read_off
+
+    @property
+    def spooling(self) -> bool:
+        """True = nowe batche do spoola (Core leży albo kolejka jeszcze się nie opróżniła)."""
+        return self.core_down or self.pending_bytes > 0
+
+    def refresh_metrics(self) -> None:
+        pending = self.pending_bytes
+        SPOOL_BYTES.set(pending)
+        head = self._head_ts
+        SPOOL_OLDEST_AGE.set(max(0.0, time.time() - head) if pending and head else 0.0)
+
+    # --- cykl życia ---
+
+    def start(self, send: SendFn) -> None:
+        task = self._task
+        if task is not None and task.done() and not task.cancelled() and task.exception():
+            logger.error("spool drainer died, restarting", exc_info=task.exception())
+        if task is None or task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._drain(send))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            if self._write_fh is not None:
+                self._write_fh.close()
+                self._write_fh = None
+
+    # --- producent ---
+
+    async def append(self, body: bytes, headers: dict[str, str], count: int) -> bool:
+        """Dopisuje batch (trwale); False = spool pełny (batch nie został przyjęty)."""
+        meta = json.dumps({"ts": time.time(), "n": count, "h": headers}).encode("utf-8")
+        payload = meta + b"\n" + body
+        frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        ok = await asyncio.to_thread(self._append_sync, frame)
+        if ok:
+            SPOOL_APPENDED_TOTAL.inc(count)
+            self._wakeup.set()
+        else:
+            SPOOL_DROPPED_TOTAL.labels("full").inc(count)
+        self.refresh_metrics()
+        return ok
+
+    def _append_sync(self, frame: bytes) -> bool:
+        with self._lock:
+            if self._pending_bytes_locked() + len(frame) > self.max_bytes:
+                return False
+            if self._write_fh is None or self._sizes[self._write_seq] >= self.segment_bytes:
+                self._roll_locked()
+            if self._pending_bytes_locked() == 0:
+                self._head_ts = time.time()
+            fh = self._write_fh
+            fh.write(frame)
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+            self._sizes[self._write_seq] += len(frame)
+            return True
+
+    def _roll_locked(self) -> None:
+        if self._write_fh is not None:
+            self._write_fh.close()
+        self._write_seq = max(self._sizes, default=self._write_seq) + 1
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._write_fh = open(self.dir / _seg_name(self._write_seq), "ab")
+        self._sizes[self._write_seq] = 0
+
+    # --- odczyt / checkpoint ---
+
+    def _recover(self) -> None:
+        """Stan z dysku: segmenty + checkpoint. Dopisywanie zawsze do nowego segmentu."""
+        if not self.dir.exists():
+            return
+        for p in self.dir.glob(f"*{_SEG_SUFFIX}"):
+            try:
+                self._sizes[int(p.stem)] = p.stat().st_size
+            except ValueError:
+                continue
+        try:
+            cp = json.loads((self.dir / _CHECKPOINT).read_text("utf-8"))
+            seq, off = int(cp["segment"]), int(cp["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            seq, off = min(self._sizes, default=0), 0
+        # segmenty sprzed checkpointu są już oddane
+        for s in [s for s in self._sizes if s < seq]:
+            self._delete_segment(s)
+        self._read_seq = seq
+        self._read_off = off if seq in self._sizes else 0
+        self._write_seq = max(self._sizes, default=0)
+        if self._sizes:
+            logger.info(
+                "spool recovered: %d segment(s), %d bytes pending",
+                len(self._sizes),
+                self._pending_bytes_locked(),
+            )
+
+    def _delete_segment(self, seq: int) -> None:
+        self._sizes.pop(seq, None)
+        try:
+            (self.dir / _seg_name(seq)).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _next_sync(self) -> tuple[dict[str, Any] | None, bytes, int] | None:
+        """
+        Następny wpis od checkpointu: (meta, body, rozmiar ramki); None = pusto.
+        Meta nieczytelne → (None, cała ramka, rozmiar).
+        """
+        while True:
+            with self._lock:
+                if self._read_seq not in self._sizes:
+                    later = [s for s in self._sizes if s > self._read_seq]
+                    if not later:
+                        return None
+                    self._read_seq, self._read_off = min(later), 0
+                seq, off = self._read_seq, self._read_off
+                size = self._sizes[seq]
+                active = seq == self._write_seq and self._write_fh is not None
+                if off >= size:
+                    if active or not [s for s in self._sizes if s > seq]:
+                        return None
+                    # segment oddany w całości — usuwamy i idziemy dalej
+                    self._delete_segment(seq)
+                    self._read_off = 0
+                    continue
+            with open(self.dir / _seg_name(seq), "rb") as fh:
+                fh.seek(off)
+                head = fh.read(_FRAME.size)
+                length, crc = _FRAME.unpack(head) if len(head) == _FRAME.size else (0, 0)
+                payload = fh.read(length) if length else b""
+            if not length or len(payload) != length or zlib.crc32(payload) != crc:
+                # urwana ramka (crash w trakcie dopisywania) — reszta segmentu jest nieczytelna
+                logger.warning("spool segment %s: torn frame at offset %d, skipping rest", seq, off)
+                with self._lock:
+                    self._read_off = self._sizes[seq] = off
+                    if not active:
+                        self._delete_segment(seq)
+                        self._read_off = 0
+                continue
+            meta_raw, _, body = payload.partition(b"\n")
+            meta = _parse_meta(meta_raw)
+            return meta, (body if meta is not None else payload), _FRAME.size + length
+
+    def _dead_letter_sync(self, meta: dict[str, Any], body: bytes) -> None:
+        payload = json.dumps(meta).encode("utf-8") + b"\n" + body
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / _DEAD_LETTER, "ab") as fh:
+            fh.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+
+    async def _is_poison(self, attempts: int) -> bool:
+        # po max_attempts porażkach wpis jest winny tylko wtedy, gdy Core poza nim żyje
+        if not self.max_attempts or attempts < self.max_attempts:
+            return False
+        if self.probe is None:
+            return True
+        try:
+            return bool(await self.probe())
+        except Exception:
+            return False
+
+    def _commit_sync(self, frame_len: int) -> None:
+        with self._lock:
+            self._read_off += frame_len
+            cp = {"segment": self._read_seq, "offset": self._read_off}
+        tmp = self.dir / (_CHECKPOINT + ".tmp")
+        tmp.write_text(json.dumps(cp), "utf-8")
+        os.replace(tmp, self.dir / _CHECKPOINT)
+
+    # --- drainer ---
+
+    async def _drain(self, send: SendFn) -> None:
+        delay = 0.1
+        attempts = 0  # nieudane próby bieżącego (najstarszego) wpisu
+        while True:
+            # błąd dysku (ENOSPC/EIO przy odczycie, checkpoincie, dead-letter) nie może
+            # zatrzymać drainera — inaczej `spooling` zostaje True, a spool tylko rośnie
+            try:
+                entry = await asyncio.to_thread(self._next_sync)
+                if entry is None:
+                    self._head_ts = None
+                    self.refresh_metrics()
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), 1.0)
+                    except TimeoutError:
+                        pass
+                    continue
+
+                meta, body, frame_len = entry
+                if meta is None:
+                    # meta nieczytelne mimo zgodnej sumy CRC — wpisu nie da się odtworzyć
+                    logger.error("spool entry with unreadable metadata, dead-lettered")
+                    SPOOL_DROPPED_TOTAL.labels("dead_letter").inc()
+                    await asyncio.to_thread(self._dead_letter_sync, {"corrupt": True}, body)
+                    await asyncio.to_thread(self._commit_sync, frame_len)
+                    continue
+                self._head_ts = float(meta.get("ts") or time.time())
+                count = int(meta.get("n") or 0)
+                try:
+                    status, _ = await send(body, dict(meta.get("h") or {}), count)
+                except Exception as e:
+                    status = 0
+                    logger.debug("spool replay failed: %r", e)
+                if status == 0 or status >= 500:
+                    attempts += 1
+                    if not await self._is_poison(attempts):
+                        self.core_down = True
+                        self.refresh_metrics()
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, self.retry_max_s)
+                        continue
+                    SPOOL_DROPPED_TOTAL.labels("dead_letter").inc(count)
+                    logger.error(
+                        "spool entry failed %d times while core is up (status %d), dead-lettered",
+                        attempts,
+                        status,
+                    )
+                    await asyncio.to_thread(self._dead_letter_sync, meta, body)
+                elif status >= 400:
+                    SPOOL_DROPPED_TOTAL.labels("rejected").inc(count)
+                    logger.warning("spool entry rejected by core (status %d), dropping", status)
+                else:
+                    SPOOL_REPLAYED_TOTAL.inc(count)
+                self.core_down = False
+                delay = 0.1
+                attempts = 0
+                await asyncio.to_thread(self._commit_sync, frame_len)
+                self.refresh_metrics()
+                # tempo odtwarzania: maks. replay_rps rekordów/s
+                await asyncio.sleep(count / self.replay_rps)
+            except Exception:
+                logger.exception("spool drainer error, retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_s)
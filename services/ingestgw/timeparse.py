@@ -0,0 +1,131 @@
+# services/ingestgw/timeparse.py
+from __future__ import annotations
+
+import os
+from datetime import UTC, datetime, timedelta
+from functools import lru_cache
+from typing import Any
+
+# Rekordy w batchu zwykle dzielą tę samą sekundę → cache po prefiksie "YYYY-MM-DD?HH:MM:SS" + strefie.
+TS_CACHE_SIZE = int(os.getenv("LOGOPS_TS_CACHE_SIZE", "4096"))
+
+_UTC_SUFFIX = "+00:00"
+
+
+def _tz_offset(tz: str) -> timedelta | None:
+    """Strefa: pusta / "Z" → 0 (brak strefy = UTC); "+HH", "+HHMM", "+HH:MM" → offset; reszta → None."""
+    if not tz or tz in ("Z", "z"):
+        return timedelta(0)
+    sign = tz[0]
+    if sign not in "+-":
+        return None
+    body = tz[1:].replace(":", "", 1)
+    if len(body) == 2:
+        body += "00"
+    if len(body) != 4 or not (body.isascii() and body.isdigit()):
+        return None
+    hh, mm = int(body[:2]), int(body[2:])
+    if hh > 23 or mm > 59:
+        return None
+    off = timedelta(hours=hh, minutes=mm)
+    return -off if sign == "-" else off
+
+
+@lru_cache(maxsize=TS_CACHE_SIZE)
+def _utc_second(prefix: str, tz: str) -> str | None:
+    """Prefiks do sekundy + strefa → "YYYY-MM-DDTHH:MM:SS" w UTC (None = niepoprawny)."""
+    digits = (
+        prefix[0:4] + prefix[5:7] + prefix[8:10] + prefix[11:13] + prefix[14:16] + prefix[17:19]
+    )
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    off = _tz_offset(tz)
+    if off is None:
+        return None
+    try:
+        dt = datetime(
+            int(digits[0:4]),
+            int(digits[4:6]),
+            int(digits[6:8]),
+            int(digits[8:10]),
+            int(digits[10:12]),
+            int(digits[12:14]),
+        )
+    except ValueError:
+        return None
+    if off:
+        dt -= off  # OverflowError przy granicach datetime — łapie canonical_ts (poza cache)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _from_isoformat(s: str) -> str | None:
+    # wolna ścieżka (formaty spoza sniffera, np. "20250909T100000Z") — bez cache
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    try:
+        return dt.astimezone(UTC).isoformat()
+    except OverflowError:  # np. "0001-01-01T00:00:00+01:00"
+        return None
+
+
+def canonical_ts(value: Any) -> str | None:
+    """
+    Timestamp → ISO8601 w UTC ("2025-09-09T10:00:00[.ffffff]+00:00"); None = niepoprawny.
+    - szybka ścieżka: "YYYY-MM-DD[T ]HH:MM:SS[.frac][Z|±HH[:]MM]" (json/csv/syslog emitery),
+      część do sekundy przeliczana raz i trzymana w LRU,
+    - brak strefy traktujemy jako UTC,
+    - liczby: epoch w sekundach (ms, jeśli > 1e11),
+    - reszta: datetime.fromisoformat.
+    """
+    if isinstance(value, str):
+        s = value.strip()
+        if (
+            len(s) >= 19
+            and s[4] == "-"
+            and s[7] == "-"
+            and s[10] in "T t"
+            and s[13] == ":"
+            and s[16] == ":"
+        ):
+            rest = s[19:]
+            frac = ""
+            if rest and rest[0] in ".,":
+                j = 1
+                while j < len(rest) and "0" <= rest[j] <= "9":
+                    j += 1
+                frac = rest[1:j]
+                if not frac:
+                    return None
+                rest = rest[j:]
+            try:
+                base = _utc_second(s[:19], rest)
+            except OverflowError:  # "0001-01-01T00:00:00+01:00" → poza zakresem datetime
+                return None
+            if base is None:
+                return None
+            if frac:
+                return f"{base}.{(frac + '000000')[:6]}{_UTC_SUFFIX}"
+            return base + _UTC_SUFFIX
+        # ISO zawsze zaczyna się cyfrą — śmieci odrzucamy bez wyjątku z fromisoformat
+        return _from_isoformat(s) if s[:1].isdigit() else None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int | float):
+        try:
+            # int z JSON-a może nie mieścić się we float (np. 400 cyfr) → OverflowError
+            v = float(value)
+            if v > 1e11:
+                v /= 1000.0
+            return datetime.fromtimestamp(v, UTC).isoformat()
+        except (OverflowError, OSError, ValueError):
+            return None
+    return None
+
+
+def cache_info():
+    """Statystyki LRU (hits/misses/currsize) — do debugowania i benchmarku."""
+    return _utc_second.cache_info()
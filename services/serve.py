@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Launcher IngestGW / Core z opcjonalnym trybem wieloprocesowym.
+
+  python -m services.serve ingest --port 8080 --workers 4
+  python -m services.serve core   --port 8095 --workers 4
+
+`--workers 1` (domyślnie) = zwykły pojedynczy proces uvicorn. Przy N > 1 uvicorn uruchamia
+N workerów na jednym sockecie (supervisor restartuje martwe), a launcher przygotowuje:
+- `<run-dir>/workers/<usługa>/prom` → `PROMETHEUS_MULTIPROC_DIR` (czyszczony przy starcie),
+  `/metrics` każdego workera zwraca sumę metryk wszystkich workerów,
+- `<run-dir>/workers/<usługa>` → `LOGOPS_WORKER_DIR` (sloty workerów, patrz
+  `services/common/workers.py`) — sink NDJSON i spool są wtedy osobne dla każdego workera.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+from pathlib import Path
+
+import uvicorn
+
+SERVICES = {
+    "ingest": ("services.ingestgw.app:app", 8080),
+    "core": ("services.core.app:app", 8095),
+}
+
+
+def prepare_worker_env(service: str, run_dir: str) -> Path:
+    """Katalogi i ENV trybu wieloprocesowego; musi być przed importem aplikacji w workerach."""
+    base = Path(run_dir).resolve() / "workers" / service
+    prom = base / "prom"
+    # pliki metryk poprzedniego uruchomienia zawyżałyby liczniki
+    shutil.rmtree(prom, ignore_errors=True)
+    prom.mkdir(parents=True, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(prom)
+    os.environ["LOGOPS_WORKER_DIR"] = str(base)
+    return base
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Run LogOps IngestGW / Core (optionally multi-worker)")
+    ap.add_argument("service", choices=sorted(SERVICES))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=None, help="domyślnie 8080 (ingest) / 8095 (core)")
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("LOGOPS_WORKERS", "1")),
+        help="liczba procesów (0 = liczba CPU); ENV LOGOPS_WORKERS",
+    )
+    ap.add_argument("--run-dir", default=os.getenv("LOGOPS_RUN_DIR", "run"))
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args()
+
+    app_path, default_port = SERVICES[args.service]
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    if workers > 1:
+        prepare_worker_env(args.service, args.run_dir)
+    uvicorn.run(
+        app_path,
+        host=args.host,
+        port=args.port or default_port,
+        workers=workers,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+"""
+Mikro-benchmarki gorącej ścieżki ingestu (bez sieci).
+
+  python -m tools.bench_ingest codec --sizes 10,100,1000,5000
+  python -m tools.bench_ingest normalize --sizes 10,100,1000,5000
+  python -m tools.bench_ingest ts --sizes 1000,50000
+  python -m tools.bench_ingest stream --sizes 100,1000,5000
+  python -m tools.bench_ingest coalesce --clients 1,10,100 --batch 10
+  python -m tools.bench_ingest workers --workers 1,2,4 --seconds 10
+  python -m tools.bench_ingest offload --sizes 256,1024,4096 --workers 2
+  python -m tools.bench_ingest syslog --lines 200000
+  python -m tools.bench_ingest csv --rows 100000
+  python -m tools.bench_ingest wire --sizes 100,1000,5000
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Callable
+from datetime import UTC, datetime
+from typing import Any
+
+import httpx
+
+from services.common import codec
+from services.common.codec import load_backend
+from services.common.colbatch import ColumnarBatchStream, encode_batch
+from services.common.jsonstream import JsonArrayStream
+from services.ingestgw.coalesce import CoreBatcher
+from services.ingestgw.normalize import normalize_batch, normalize_record
+from services.ingestgw.offload import TextParseOffload
+from services.ingestgw.parsers import parse_csv_text_body, parse_syslog_text, parse_text_chunk
+from services.ingestgw.timeparse import _utc_second, cache_info, canonical_ts
+
+
+def _sizes(spec: str) -> list[int]:
+    return [int(x) for x in spec.split(",") if x.strip()]
+
+
+def _bench(fn: Callable[[], Any], *, min_time: float = 0.3) -> float:
+    """Średni czas jednego wywołania (s); powtarzamy aż uzbiera się min_time."""
+    fn()  # rozgrzewka
+    n, elapsed = 0, 0.0
+    t0 = time.perf_counter()
+    while elapsed < min_time:
+        fn()
+        n += 1
+        elapsed = time.perf_counter() - t0
+    return elapsed / n
+
+
+def make_json_records(n: int, seed: int = 1) -> list[dict[str, Any]]:
+    """Rekordy w kształcie emitters/json.py (bez zależności od hosta/czasu)."""
+    rnd = random.Random(seed)
+    levels = ["debug", "info", "warning", "error", "fatal"]
+    return [
+        {
+            "timestamp": "2025-09-09T10:00:00+0000",
+            "level": rnd.choice(levels),
+            "message": f"request served #{i}",
+            "service": "emitter-json",
+            "env": "dev",
+            "host": "bench-host",
+            "request_id": f"req-{i:06d}",
+            "user_email": f"user{i}@example.com",
+            "client_ip": f"83.11.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}",
+            "attrs": {
+                "path": "/api/v1/resource",
+                "method": rnd.choice(["GET", "POST", "PUT"]),
+                "latency_ms": rnd.randint(5, 500),
+                "version": "1.0.0",
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def _print_table(header: list[str], rows: list[list[str]]) -> None:
+    widths = [max(len(h), *(len(r[i]) for r in rows)) for i, h in enumerate(header)]
+    print("  ".join(h.rjust(w) for h, w in zip(header, widths, strict=True)))
+    for r in rows:
+        print("  ".join(c.rjust(w) for c, w in zip(r, widths, strict=True)))
+
+
+# ── codec ─────────────────────────────────────────────────────────────────────
+
+
+def cmd_codec(args) -> None:
+    """
+    Ścieżka JSON na jeden batch: IngestGW loads(body) → dumps(forward) → Core loads
+    → NDJSON dumps per rekord. Porównanie backendów względem stdlib.
+    """
+    backends = []
+    for name in ("json", "orjson", "msgspec"):
+        got, dumps, loads = load_backend(name)
+        if got == name:
+            backends.append((name, dumps, loads))
+
+    rows = []
+    for size in _sizes(args.sizes):
+        records = make_json_records(size)
+        body = backends[0][1](records)
+        base = None
+        for name, dumps, loads in backends:
+
+            def hop(body=body, dumps=dumps, loads=loads):
+                recs = loads(body)
+                fwd = dumps(recs)
+                core = loads(fwd)
+                for r in core:
+                    dumps(r)
+
+            t = _bench(hop, min_time=args.min_time)
+            base = base or t
+            rows.append(
+                [
+                    str(size),
+                    name,
+                    f"{t * 1e3:.3f}",
+                    f"{size / t:,.0f}",
+                    f"{base / t:.2f}x",
+                ]
+            )
+    _print_table(["batch", "backend", "ms/batch", "records/s", "vs json"], rows)
+
+
+# ── normalize ─────────────────────────────────────────────────────────────────
+
+
+def _legacy_normalize(records: list[Any], emitter: str, scenario_id: str) -> int:
+    """Ścieżka sprzed normalize_batch(): normalize_record + 3 dodatkowe przejścia."""
+    counters: Counter[str] = Counter()
+    normalized = []
+    for rec in records:
+        norm = normalize_record(rec if isinstance(rec, dict) else {})
+        normalized.append(norm)
+        if norm.get("_missing_ts"):
+            counters["missing_ts"] += 1
+        if norm.get("_missing_level"):
+            counters["missing_level"] += 1
+    labeled = []
+    for n in normalized:
+        n["app"] = "logops"
+        n["source"] = "ingest"
+        n["emitter"] = emitter
+        n["scenario_id"] = scenario_id
+        labeled.append(n)
+    level_counts: Counter[str] = Counter()
+    for n in labeled:
+        level_counts[(n.get("level") or "UNKNOWN").upper().strip()] += 1
+    return len(labeled)
+
+
+def cmd_normalize(args) -> None:
+    """legacy (normalize_record + enforce_labels + Counter) vs normalize_batch()."""
+    rows = []
+    for size in _sizes(args.sizes):
+        records = make_json_records(size)
+        # co 3. rekord bez ts/level, żeby ścieżka "brak pola" też była mierzona
+        for i, r in enumerate(records):
+            r["ts"] = r.pop("timestamp")
+            r["msg"] = r.pop("message")
+            if i % 3 == 0:
+                r.pop("ts")
+                r.pop("level")
+        body = codec.dumps(records)
+
+        # w obu wariantach świeże rekordy z body (jak w handlerze) — koszt loads jest wspólny
+        t_loads = _bench(lambda body=body: codec.loads(body), min_time=args.min_time)
+        t_legacy = _bench(
+            lambda body=body: _legacy_normalize(codec.loads(body), "json", "sc-bench"),
+            min_time=args.min_time,
+        )
+        t_batch = _bench(
+            lambda body=body: normalize_batch(
+                codec.loads(body), emitter="json", scenario_id="sc-bench"
+            ),
+            min_time=args.min_time,
+        )
+        legacy = max(1e-9, t_legacy - t_loads)
+        batch = max(1e-9, t_batch - t_loads)
+        rows.append(
+            [
+                str(size),
+                f"{legacy * 1e3:.3f}",
+                f"{batch * 1e3:.3f}",
+                f"{size / batch:,.0f}",
+                f"{legacy / batch:.2f}x",
+            ]
+        )
+    _print_table(["batch", "legacy ms", "batch ms", "records/s", "speedup"], rows)
+
+
+# ── ts ────────────────────────────────────────────────────────────────────────
+
+
+def make_timestamps(n: int, *, seconds: int = 5, garbage: float = 0.1, seed: int = 1) -> list[str]:
+    """Mieszanka formatów emiterów (json/csv %z, syslog bez strefy, ISO z ms) + śmieci."""
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        sec = f"2025-09-09T10:00:{rnd.randrange(seconds):02d}"
+        r = rnd.random()
+        if r < garbage:
+            out.append(f"not-a-timestamp-{rnd.randint(100, 999)}")
+        elif r < 0.5:
+            out.append(sec + "+0200")
+        elif r < 0.75:
+            out.append(sec.replace("T", " "))
+        else:
+            out.append(f"{sec}.{rnd.randrange(1000):03d}Z")
+    return out
+
+
+def _fromisoformat_ts(value: str) -> str | None:
+    """Punkt odniesienia: pełne parsowanie każdego rekordu, bez sniffera i cache."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    return dt.astimezone(UTC).isoformat()
+
+
+def cmd_ts(args) -> None:
+    """canonical_ts (sniffer + LRU po sekundzie) vs datetime.fromisoformat per rekord."""
+    rows = []
+    for size in _sizes(args.sizes):
+        values = make_timestamps(size, garbage=args.garbage)
+        _utc_second.cache_clear()
+        t_iso = _bench(lambda v=values: [_fromisoformat_ts(x) for x in v], min_time=args.min_time)
+        t_fast = _bench(lambda v=values: [canonical_ts(x) for x in v], min_time=args.min_time)
+        rows.append(
+            [
+                str(size),
+                f"{size / t_iso:,.0f}",
+                f"{size / t_fast:,.0f}",
+                f"{t_iso / t_fast:.2f}x",
+            ]
+        )
+    _print_table(["batch", "fromisoformat rec/s", "canonical_ts rec/s", "speedup"], rows)
+    info = cache_info()
+    print(f"cache: hits={info.hits} misses={info.misses} size={info.currsize}/{info.maxsize}")
+
+
+# ── stream ────────────────────────────────────────────────────────────────────
+
+
+def _peak_bytes(fn: Callable[[], Any]) -> int:
+    """Szczyt alokacji (tracemalloc) podczas jednego wywołania."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def cmd_stream(args) -> None:
+    """
+    Body JSON przychodzące kawałkami (jak request.stream()): b"".join + loads całości
+    vs JsonArrayStream w trybie przyrostowym (buffer_below=0). Mierzymy czas i szczyt pamięci.
+    """
+    rows = []
+    for size in _sizes(args.sizes):
+        body = codec.dumps(make_json_records(size))
+        step = args.chunk
+        chunks = [body[i : i + step] for i in range(0, len(body), step)]
+
+        def whole(chunks=chunks):
+            return len(codec.loads(b"".join(chunks)))
+
+        def stream(chunks=chunks):
+            p = JsonArrayStream(buffer_below=0)  # zawsze przyrostowo
+            n = 0
+            for c in chunks:
+                n += len(p.feed(c))
+            return n + len(p.close())
+
+        # pamięć: cały batch vs przetwarzanie kawałkami (elementy oddawane dalej, nie trzymane)
+        m_whole = _peak_bytes(whole)
+        m_stream = _peak_bytes(stream)
+        t_whole = _bench(whole, min_time=args.min_time)
+        t_stream = _bench(stream, min_time=args.min_time)
+        rows.append(
+            [
+                str(size),
+                f"{len(body) / 1024:,.0f}",
+                f"{t_whole * 1e3:.2f}",
+                f"{t_stream * 1e3:.2f}",
+                f"{m_whole / 1024:,.0f}",
+                f"{m_stream / 1024:,.0f}",
+            ]
+        )
+    _print_table(
+        ["batch", "body KiB", "whole ms", "stream ms", "whole peak KiB", "stream peak KiB"], rows
+    )
+
+
+# ── coalesce ──────────────────────────────────────────────────────────────────
+
+
+async def _coalesce_run(
+    clients: int, batch: int, seconds: float, core_ms: float, coalesce: bool, linger_ms: int
+) -> tuple[int, int]:
+    """N klientów w pętli wysyła batche; Core udawany przez sleep(core_ms). → (żądania, POST-y)."""
+    posts = 0
+
+    async def send(body: bytes, headers: dict[str, str], count: int) -> tuple[int, Any]:
+        nonlocal posts
+        posts += 1
+        await asyncio.sleep(core_ms / 1000.0)
+        return 200, {"accepted": count}
+
+    batcher = CoreBatcher(send, max_records=1000, max_bytes=512 * 1024, linger_ms=linger_ms)
+    body = codec.dumps([{"msg": f"m{i}", "level": "INFO"} for i in range(batch)])
+    requests = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client() -> None:
+        nonlocal requests
+        while time.perf_counter() < deadline:
+            if coalesce:
+                await batcher.submit(("json", "bench"), body, batch, {})
+            else:
+                await send(body, {}, batch)
+            requests += 1
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    await batcher.aclose()
+    return requests, posts
+
+
+def cmd_coalesce(args) -> None:
+    """Ile POST-ów do Core na żądanie ingestu: forward 1:1 vs CoreBatcher (coalesce.py)."""
+    rows = []
+    for clients in _sizes(args.clients):
+        for coalesce in (False, True):
+            req, posts = asyncio.run(
+                _coalesce_run(
+                    clients, args.batch, args.seconds, args.core_ms, coalesce, args.linger_ms
+                )
+            )
+            rows.append(
+                [
+                    str(clients),
+                    "coalesce" if coalesce else "direct",
+                    f"{req / args.seconds:,.0f}",
+                    f"{posts / args.seconds:,.0f}",
+                    f"{req / max(1, posts):.1f}",
+                ]
+            )
+    _print_table(["clients", "mode", "ingest req/s", "core POST/s", "req per POST"], rows)
+
+
+# ── offload ───────────────────────────────────────────────────────────────────
+
+
+def make_syslog_body(kib: int, seed: int = 1) -> bytes:
+    """Body text/plain (syslog-like, jak emitters/syslog.py) o rozmiarze ~kib KiB."""
+    rnd = random.Random(seed)
+    lines: list[str] = []
+    size, i = 0, 0
+    while size < kib * 1024:
+        ln = (
+            f"2025-09-09 10:00:{i % 60:02d} {rnd.choice(['INFO', 'WARN', 'ERROR', 'DEBUG'])} "
+            f"bench-host web[{rnd.randint(100, 999)}]: served #{i} user=u{i}@example.com "
+            f"ip=83.11.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}"
+        )
+        lines.append(ln)
+        size += len(ln) + 1
+        i += 1
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def _offload_run(off: TextParseOffload, body: bytes) -> tuple[float, float]:
+    """(czas parsowania body, maks. opóźnienie event loopa w tym czasie) w sekundach."""
+    lag = 0.0
+    done = False
+
+    async def ticker() -> None:
+        nonlocal lag
+        while not done:
+            t = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - t - 0.001)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.005)
+    t0 = time.perf_counter()
+    await off.parse("syslog", body, "bench", "bench")
+    elapsed = time.perf_counter() - t0
+    done = True
+    await task
+    return elapsed, lag
+
+
+def cmd_offload(args) -> None:
+    """Body text/plain: parsowanie inline (blokuje event loop) vs TextParseOffload (offload.py)."""
+    rows = []
+    off = TextParseOffload(workers=args.workers, min_bytes=0, chunk_bytes=args.chunk * 1024)
+    off.start()
+    try:
+        for kib in _sizes(args.sizes):
+            body = make_syslog_body(kib)
+            t_inline = _bench(lambda b=body: parse_text_chunk("syslog", b, "bench", "bench"))
+            asyncio.run(_offload_run(off, body))  # rozgrzewka (procesy puli)
+            t_off, lag = asyncio.run(_offload_run(off, body))
+            rows.append(
+                [
+                    str(kib),
+                    f"{t_inline * 1e3:.1f}",
+                    f"{t_off * 1e3:.1f}",
+                    f"{lag * 1e3:.1f}",
+                ]
+            )
+    finally:
+        off.shutdown()
+    _print_table(
+        ["body KiB", "inline ms (= loop stall)", "offload ms", "offload loop lag ms"], rows
+    )
+
+
+# ── syslog ────────────────────────────────────────────────────────────────────
+
+_LEGACY_LEVEL_RE = re.compile(r"\b(DEBUG|INFO|WARN|ERROR|TRACE|FATAL)\b", re.IGNORECASE)
+
+
+def _legacy_syslog(text: str) -> list[dict[str, Any]]:
+    """Parser sprzed RFC: level z regexu w całej linii, msg = cała linia."""
+    out = []
+    for ln in text.splitlines():
+        if ln.strip():
+            m = _LEGACY_LEVEL_RE.search(ln)
+            out.append({"level": m.group(1).upper() if m else "INFO", "msg": ln})
+    return out
+
+
+def make_syslog_lines(n: int, fmt: str, seed: int = 1) -> str:
+    """n linii w formacie: house | mix (jak emitters/syslog.py, 30% bez levelu) | rfc3164 | rfc5424."""
+    rnd = random.Random(seed)
+    levels = ["DEBUG", "INFO", "WARN", "ERROR"]
+    lines = []
+    for i in range(n):
+        sec = i % 60
+        tail = f"request served #{i} user=user{i}@example.com ip=83.11.{rnd.randint(0, 255)}.7"
+        pid = rnd.randint(1000, 9999)
+        if fmt == "rfc5424":
+            pri = 8 + rnd.randint(0, 7)
+            lines.append(
+                f"<{pri}>1 2025-09-09T10:00:{sec:02d}.003Z bench-host web {pid} - - {tail}"
+            )
+        elif fmt == "rfc3164":
+            pri = 8 + rnd.randint(0, 7)
+            lines.append(f"<{pri}>Sep  9 10:00:{sec:02d} bench-host web[{pid}]: {tail}")
+        elif fmt == "mix" and rnd.random() < 0.3:
+            lines.append(f"2025-09-09 10:00:{sec:02d} {tail}")
+        else:
+            lvl = rnd.choice(levels)
+            lines.append(f"2025-09-09 10:00:{sec:02d} {lvl} bench-host web[{pid}]: {tail}")
+    return "\n".join(lines) + "\n"
+
+
+def cmd_syslog(args) -> None:
+    """Linie/s na rdzeń: parser legacy (level regex) vs parse_syslog_text (+ normalize_batch)."""
+    rows = []
+    n = args.lines
+    for fmt in ("house", "mix", "rfc3164", "rfc5424"):
+        text = make_syslog_lines(n, fmt)
+        t_legacy = _bench(lambda t=text: _legacy_syslog(t), min_time=args.min_time)
+        t_parse = _bench(lambda t=text: parse_syslog_text(t), min_time=args.min_time)
+        t_full = _bench(
+            lambda t=text: normalize_batch(parse_syslog_text(t), emitter="b", scenario_id="b"),
+            min_time=args.min_time,
+        )
+        rows.append(
+            [
+                fmt,
+                f"{n / t_legacy:,.0f}",
+                f"{n / t_parse:,.0f}",
+                f"{n / t_full:,.0f}",
+            ]
+        )
+    _print_table(["format", "legacy lines/s", "parser lines/s", "parse+normalize lines/s"], rows)
+
+
+# ── csv ───────────────────────────────────────────────────────────────────────
+
+
+def _legacy_csv(text: str) -> list[dict[str, Any]]:
+    """Parser sprzed schematów: csv.reader, kolumny (ts, level, msg), reszta doklejana do msg."""
+    out = []
+    rows = csv.reader(io.StringIO(text))
+    for i, row in enumerate(rows):
+        if not row or all(not c.strip() for c in row):
+            continue
+        if i == 0 and [c.strip().lower() for c in row[:3]] == ["ts", "level", "msg"]:
+            continue
+        ts = row[0].strip() if row else ""
+        level = row[1].strip() if len(row) > 1 else ""
+        msg = ",".join(row[2:]).strip() if len(row) > 2 else ""
+        out.append({"ts": ts, "level": level, "msg": msg})
+    return out
+
+
+def make_csv_body(n: int, variant: str, seed: int = 1) -> str:
+    """
+    emitter = emitters/csv.py (30% wierszy bez ts/level; msg w cudzysłowie) | plain = to samo
+    bez cudzysłowów | quoted = `""` i nowe linie w msg.
+    """
+    from emitters.csv import build_csv
+
+    random.seed(seed)
+    if variant in ("emitter", "plain"):
+        body = build_csv(n, 0.3)[0]
+        return body if variant == "emitter" else body.replace('"', "")
+    rows = ["ts,level,msg"]
+    for i in range(n):
+        rows.append(f'2025-09-09T10:00:00+0000,INFO,"say ""hi"" #{i}\nsecond line"')
+    return "\n".join(rows) + "\n"
+
+
+def cmd_csv(args) -> None:
+    """Wiersze/s: parser legacy (csv.reader) vs parse_csv_text_body (+ normalize_batch)."""
+    rows = []
+    n = args.rows
+    for variant in ("emitter", "plain", "quoted"):
+        text = make_csv_body(n, variant)
+        t_legacy = _bench(lambda t=text: _legacy_csv(t), min_time=args.min_time)
+        t_parse = _bench(lambda t=text: parse_csv_text_body(t), min_time=args.min_time)
+        t_full = _bench(
+            lambda t=text: normalize_batch(parse_csv_text_body(t), emitter="b", scenario_id="b"),
+            min_time=args.min_time,
+        )
+        rows.append(
+            [
+                variant,
+                f"{n / t_legacy:,.0f}",
+                f"{n / t_parse:,.0f}",
+                f"{n / t_full:,.0f}",
+            ]
+        )
+    _print_table(["body", "legacy rows/s", "parser rows/s", "parse+normalize rows/s"], rows)
+
+
+# ── wire ──────────────────────────────────────────────────────────────────────
+
+
+def cmd_wire(args) -> None:
+    """
+    Hop IngestGW → Core dla znormalizowanego batcha: tablica JSON (codec.dumps → JsonArrayStream
+    w Core, jak dotąd) vs ramka kolumnowa (encode_batch → ColumnarBatchStream).
+    """
+    rows = []
+    for size in _sizes(args.sizes):
+        records, _ = normalize_batch(make_json_records(size), emitter="json", scenario_id="bench")
+        j_body = codec.dumps(records)
+        c_body = encode_batch(records) or b""
+
+        def core_json(body=j_body):
+            p = JsonArrayStream()
+            return len(p.feed(body)) + len(p.close())
+
+        def core_col(body=c_body):
+            p = ColumnarBatchStream()
+            return len(p.feed(body)) + len(p.close())
+
+        t_jenc = _bench(lambda r=records: codec.dumps(r), min_time=args.min_time)
+        t_cenc = _bench(lambda r=records: encode_batch(r), min_time=args.min_time)
+        t_jdec = _bench(core_json, min_time=args.min_time)
+        t_cdec = _bench(core_col, min_time=args.min_time)
+        rows.append(
+            [
+                str(size),
+                f"{len(j_body) / 1024:,.1f}",
+                f"{len(c_body) / 1024:,.1f}",
+                f"{t_jenc * 1e3:.2f}",
+                f"{t_cenc * 1e3:.2f}",
+                f"{t_jdec * 1e3:.2f}",
+                f"{t_cdec * 1e3:.2f}",
+                f"{(t_jenc + t_jdec) / (t_cenc + t_cdec):.2f}x",
+            ]
+        )
+    _print_table(
+        [
+            "batch",
+            "json KiB",
+            "col KiB",
+            "json enc ms",
+            "col enc ms",
+            "json dec ms",
+            "col dec ms",
+            "hop speedup",
+        ],
+        rows,
+    )
+
+
+# ── workers ───────────────────────────────────────────────────────────────────
+
+
+def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _load_client(url: str, body: bytes, seconds: float, out: Any) -> None:
+    """Jeden proces obciążający: POST-y w pętli przez keep-alive; → liczba udanych żądań."""
+    ok = 0
+    headers = {"Content-Type": "application/json", "X-Emitter": "bench", "X-Scenario-Id": "bench"}
+    with httpx.Client(timeout=10.0) as client:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            if client.post(url, content=body, headers=headers).status_code < 300:
+                ok += 1
+    out.put(ok)
+
+
+def _workers_run(workers: int, args, run_dir: str) -> float:
+    """Core + IngestGW z `workers` procesami, klienci w osobnych procesach → rekordy/s."""
+    env = dict(
+        os.environ,
+        CORE_URL=f"http://127.0.0.1:{args.core_port}/v1/logs",
+        LOGOPS_SINK_DIR=os.path.join(run_dir, "sink"),
+    )
+    serve = [sys.executable, "-m", "services.serve"]
+    common = ["--run-dir", run_dir, "--log-level", "warning"]
+    core_workers = args.core_workers or workers
+    procs = [
+        subprocess.Popen(
+            [*serve, "core", "--port", str(args.core_port), "--workers", str(core_workers)]
+            + common,
+            env=env,
+        ),
+        subprocess.Popen(
+            [*serve, "ingest", "--port", str(args.port), "--workers", str(workers)] + common,
+            env=env,
+        ),
+    ]
+    try:
+        _wait_ready(f"http://127.0.0.1:{args.core_port}/healthz")
+        _wait_ready(f"http://127.0.0.1:{args.port}/metrics")
+        body = codec.dumps(make_json_records(args.batch))
+        ctx = multiprocessing.get_context("spawn")
+        out = ctx.Queue()
+        clients = [
+            ctx.Process(
+                target=_load_client,
+                args=(f"http://127.0.0.1:{args.port}/v1/logs", body, args.seconds, out),
+            )
+            for _ in range(args.clients_per_worker * workers)
+        ]
+        for c in clients:
+            c.start()
+        done = sum(out.get() for _ in clients)
+        for c in clients:
+            c.join()
+        return done * args.batch / args.seconds
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=30)
+
+
+def cmd_workers(args) -> None:
+    """Skalowanie IngestGW (+ Core) w trybie wieloprocesowym: rekordy/s dla 1..N workerów."""
+    rows = []
+    base = 0.0
+    for workers in _sizes(args.workers):
+        with tempfile.TemporaryDirectory(prefix="logops-bench-") as run_dir:
+            rps = _workers_run(workers, args, run_dir)
+        base = base or rps / workers
+        rows.append(
+            [
+                str(workers),
+                str(args.clients_per_worker * workers),
+                f"{rps:,.0f}",
+                f"{rps / base:.2f}x",
+                f"{rps / base / workers:.0%}",
+            ]
+        )
+    print(f"os.cpu_count() = {os.cpu_count()}")
+    _print_table(["workers", "clients", "records/s", "speedup", "efficiency"], rows)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="LogOps ingest micro-benchmarks")
+    ap.add_argument("--min-time", type=float, default=0.3, help="min. czas pomiaru na wariant [s]")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("codec", help="JSON codec: stdlib vs orjson/msgspec")
+    s.add_argument("--sizes", default="10,100,1000,5000")
+    s.set_defaults(func=cmd_codec)
+
+    s = sub.add_parser("normalize", help="normalize_record pipeline vs normalize_batch()")
+    s.add_argument("--sizes", default="10,100,1000,5000")
+    s.set_defaults(func=cmd_normalize)
+
+    s = sub.add_parser("ts", help="timestamp canonicalisation: fromisoformat vs canonical_ts")
+    s.add_argument("--sizes", default="1000,50000")
+    s.add_argument("--garbage", type=float, default=0.1, help="udział nieparsowalnych ts")
+    s.set_defaults(func=cmd_ts)
+
+    s = sub.add_parser("stream", help="JSON body: whole loads vs incremental JsonArrayStream")
+    s.add_argument("--sizes", default="100,1000,5000")
+    s.add_argument("--chunk", type=int, default=65536, help="rozmiar kawałka body [B]")
+    s.set_defaults(func=cmd_stream)
+
+    s = sub.add_parser("coalesce", help="Core POST rate: direct forward vs CoreBatcher")
+    s.add_argument("--clients", default="1,10,100", help="liczby równoległych klientów")
+    s.add_argument("--batch", type=int, default=10, help="rekordów na żądanie (emiter)")
+    s.add_argument("--seconds", type=float, default=2.0)
+    s.add_argument("--core-ms", type=float, default=5.0, help="udawany czas odpowiedzi Core")
+    s.add_argument("--linger-ms", type=int, default=10)
+    s.set_defaults(func=cmd_coalesce)
+
+    s = sub.add_parser("offload", help="text/plain parse: inline vs process-pool offload")
+    s.add_argument("--sizes", default="256,1024,4096", help="rozmiary body [KiB]")
+    s.add_argument("--workers", type=int, default=2, help="procesy puli")
+    s.add_argument("--chunk", type=int, default=256, help="rozmiar kawałka [KiB]")
+    s.set_defaults(func=cmd_offload)
+
+    s = sub.add_parser("syslog", help="syslog lines/s: legacy vs RFC3164/5424/house parser")
+    s.add_argument("--lines", type=int, default=200_000)
+    s.set_defaults(func=cmd_syslog)
+
+    s = sub.add_parser("csv", help="CSV rows/s: legacy csv.reader vs schema parser + fast path")
+    s.add_argument("--rows", type=int, default=100_000)
+    s.set_defaults(func=cmd_csv)
+
+    s = sub.add_parser("wire", help="IngestGW -> Core batch: JSON array vs columnar frame")
+    s.add_argument("--sizes", default="100,1000,5000")
+    s.set_defaults(func=cmd_wire)
+
+    s = sub.add_parser("workers", help="multi-process IngestGW/Core: records/s vs workers")
+    s.add_argument("--workers", default="1,2,4", help="liczby workerów IngestGW")
+    s.add_argument("--core-workers", type=int, default=0, help="workerzy Core (0 = jak Ingest)")
+    s.add_argument("--clients-per-worker", type=int, default=4, help="procesy obciążające")
+    s.add_argument("--batch", type=int, default=100, help="rekordów na żądanie")
+    s.add_argument("--seconds", type=float, default=10.0)
+    s.add_argument("--port", type=int, default=18080)
+    s.add_argument("--core-port", type=int, default=18095)
+    s.set_defaults(func=cmd_workers)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,9 +29,9 @@ if ARCHIVE_MODE == "zip":
 
 
 def parse_day(name: str):
-    """Return datetime(UTC) parsed from YYYYMMDD filename stem or None."""
+    """Return datetime(UTC) parsed from YYYYMMDD[-w<slot>] filename stem or None."""
     try:
-        return datetime.strptime(Path(name).stem, "%Y%m%d").replace(tzinfo=UTC)
+        return datetime.strptime(Path(name).stem[:8], "%Y%m%d").replace(tzinfo=UTC)
     except Exception:
         return None
 